@@ -0,0 +1,356 @@
+"""
+Module containing the admission control of the device API.
+
+Device requests are split into reads and writes, each with its own concurrency limit, so
+that a burst of writes queued behind the single SQLite writer does not hold back reads,
+and the other way around. Requests beyond the limit wait in line, first come first
+served, in a bounded queue. A request is answered 503 with a Retry-After header instead
+of waiting when:
+- the queue is full ('queue_full');
+- its expected wait, estimated from the latency of the admitted requests, exceeds the
+  deadline ('deadline');
+- it has waited for the deadline without being admitted ('timeout').
+
+In adaptive mode, each limit is tuned with additive increase and multiplicative decrease
+(AIMD) from the latency of the requests it admits, nearly all of which is spent on the
+database: once per round of as many requests as the limit, the limit is cut by a tenth if
+their mean latency exceeded the target, and raised by one if it did not while requests
+were waiting, up to the configured limit.
+
+The change feed, the export and the NDJSON listing, which stream for as long as their
+client reads them, are not subject to admission control: each would hold a turn for the
+whole stream, and its duration would inflate the latency the deadline and the adaptive
+limit are estimated from.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from urllib.parse import parse_qsl
+from dataclasses import dataclass, asdict
+from typing import Deque, List, Optional
+from fastapi import status
+from fastapi.encoders import jsonable_encoder
+from app.config import settings
+from app.api.responses import ORJSONResponse
+from app.metrics import ADMISSION_LIMIT, ADMISSION_QUEUE_DEPTH, ADMISSION_SHED
+from app.models.device import ServiceOverloadedResponse
+
+# Weight of the latest request in the moving average of the latency
+LATENCY_SMOOTHING = 0.2
+
+# Factor applied to an adaptive limit when the latency exceeds the target
+DECREASE_FACTOR = 0.9
+
+READ_METHODS = ("GET", "HEAD")
+
+# Paths of the device API that are not subject to admission control
+EXEMPT_PATHS = ("/devices/changes", "/devices/export")
+
+# Query parameters of the device reads that stream their response, and are not subject
+# to admission control either
+STREAMING_PARAMETERS = (("format", "ndjson"),)
+
+
+class RequestShedError(Exception):
+    """
+    Raised when a request is not admitted.
+
+    Attributes:
+    - reason (str): 'queue_full', 'deadline' or 'timeout'.
+    - retry_after (int): The number of seconds after which the client should retry.
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Request shed: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionStats:
+    """
+    Represents the counters of an admission limiter.
+
+    Attributes:
+    - admitted (int): Requests admitted.
+    - waited (int): Admitted requests that had to wait for their turn.
+    - shed_queue_full (int): Requests rejected because the queue was full.
+    - shed_deadline (int): Requests rejected because their wait would exceed the deadline.
+    - shed_timeout (int): Requests rejected after waiting for the deadline.
+    """
+    admitted: int = 0
+    waited: int = 0
+    shed_queue_full: int = 0
+    shed_deadline: int = 0
+    shed_timeout: int = 0
+
+
+class AdmissionLimiter:
+    """
+    Represents the concurrency limit and wait queue of one kind of request.
+
+    Attributes:
+    - kind (str): 'read' or 'write'.
+    - max_limit (int): The configured limit, 0 if admission control is disabled.
+    - limit (int): The current limit, below the configured one in adaptive mode.
+    - queue_size (int): The number of requests waiting at most.
+    - deadline_seconds (float): The time a request may wait for its turn.
+    - adaptive (bool): Whether the limit is tuned from the latency.
+    - target_latency_seconds (float): The latency the adaptive limit aims at.
+    - in_flight (int): The number of admitted requests being handled.
+    - latency_seconds (float, optional): The moving average of the latency of the admitted
+      requests, None until one completed.
+    """
+
+    def __init__(self, kind: str, limit: int, queue_size: int = settings.admission_queue_size,
+                 deadline_ms: float = settings.admission_deadline_ms,
+                 adaptive: bool = settings.admission_adaptive,
+                 target_latency_ms: float = settings.admission_target_latency_ms):
+        self.kind = kind
+        self.max_limit = limit
+        self.limit = limit
+        self.queue_size = queue_size
+        self.deadline_seconds = deadline_ms / 1000
+        self.adaptive = adaptive
+        self.target_latency_seconds = target_latency_ms / 1000
+        self.in_flight = 0
+        self.latency_seconds: Optional[float] = None
+        self.stats = AdmissionStats()
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._round_requests = 0
+        self._round_seconds = 0.0
+        self._round_contended = False
+        ADMISSION_LIMIT.set(limit, kind)
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether requests of this kind are subject to admission control.
+        """
+        return self.max_limit > 0
+
+    @property
+    def queued(self) -> int:
+        """
+        The number of requests waiting for their turn.
+        """
+        return len(self._waiters)
+
+    def expected_wait(self, position: int) -> float:
+        """
+        Estimates the time a request waits for its turn.
+
+        Parameters:
+        - position (int): The number of requests waiting ahead of it.
+
+        Returns:
+        - float: The expected wait, in seconds, 0 until a request completed.
+        """
+        if self.latency_seconds is None:
+            return 0.0
+        return (position + 1) * self.latency_seconds / self.limit
+
+    def _shed(self, reason: str, expected_wait: float) -> RequestShedError:
+        """
+        Counts a rejected request.
+
+        Parameters:
+        - reason (str): 'queue_full', 'deadline' or 'timeout'.
+        - expected_wait (float): The expected wait of a request queued now, in seconds.
+
+        Returns:
+        - RequestShedError: The error to raise, advising to retry once the queue drained.
+        """
+        setattr(self.stats, f"shed_{reason}", getattr(self.stats, f"shed_{reason}") + 1)
+        ADMISSION_SHED.inc(self.kind, reason)
+        return RequestShedError(reason, max(1, math.ceil(expected_wait)))
+
+    async def acquire(self) -> None:
+        """
+        Waits for the turn of a request.
+
+        Raises:
+        - RequestShedError: If the request is not admitted.
+        """
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.stats.admitted += 1
+            return
+        expected_wait = self.expected_wait(len(self._waiters))
+        if len(self._waiters) >= self.queue_size:
+            raise self._shed("queue_full", expected_wait)
+        if expected_wait > self.deadline_seconds:
+            raise self._shed("deadline", expected_wait)
+
+        self._round_contended = True
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters), self.kind)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.deadline_seconds)
+        except asyncio.TimeoutError:
+            # The turn may have been handed over just before the deadline
+            if not waiter.done():
+                self._withdraw(waiter)
+                raise self._shed("timeout",
+                                 self.expected_wait(len(self._waiters))) from None
+        except asyncio.CancelledError:
+            if waiter.done():
+                self.release(None)
+            else:
+                self._withdraw(waiter)
+            raise
+        self.stats.admitted += 1
+        self.stats.waited += 1
+
+    def _withdraw(self, waiter: asyncio.Future) -> None:
+        """
+        Removes a request from the queue before its turn.
+
+        Parameters:
+        - waiter (asyncio.Future): The future the request waits on.
+        """
+        waiter.cancel()
+        self._waiters.remove(waiter)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters), self.kind)
+
+    def release(self, latency_seconds: Optional[float]) -> None:
+        """
+        Ends an admitted request and hands its turn over to the longest waiting one.
+
+        Parameters:
+        - latency_seconds (float, optional): The time taken to handle the request, None
+          if it was not handled.
+        """
+        self.in_flight -= 1
+        if latency_seconds is not None:
+            self._observe(latency_seconds)
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            self.in_flight += 1
+            waiter.set_result(None)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters), self.kind)
+
+    def _observe(self, latency_seconds: float) -> None:
+        """
+        Records the latency of a request, and tunes the limit in adaptive mode.
+
+        Parameters:
+        - latency_seconds (float): The time taken to handle the request.
+        """
+        if self.latency_seconds is None:
+            self.latency_seconds = latency_seconds
+        else:
+            self.latency_seconds += LATENCY_SMOOTHING * (latency_seconds
+                                                         - self.latency_seconds)
+        if not self.adaptive:
+            return
+        self._round_requests += 1
+        self._round_seconds += latency_seconds
+        if self._round_requests < self.limit:
+            return
+        if self._round_seconds / self._round_requests > self.target_latency_seconds:
+            self.limit = max(1, min(self.limit - 1, int(self.limit * DECREASE_FACTOR)))
+        elif self._round_contended:
+            self.limit = min(self.max_limit, self.limit + 1)
+        self._round_requests = 0
+        self._round_seconds = 0.0
+        self._round_contended = bool(self._waiters)
+        ADMISSION_LIMIT.set(self.limit, self.kind)
+
+    def snapshot(self) -> dict:
+        """
+        Returns the state and counters of the limiter.
+
+        Returns:
+        - dict: The limits, the requests in flight and waiting, the latency and counters.
+        """
+        return {"kind": self.kind, "limit": self.limit, "max_limit": self.max_limit,
+                "adaptive": self.adaptive, "in_flight": self.in_flight,
+                "queued": self.queued, "latency_ms": (self.latency_seconds * 1000
+                                                      if self.latency_seconds is not None
+                                                      else None),
+                **asdict(self.stats)}
+
+
+READS = AdmissionLimiter("read", settings.admission_read_limit)
+WRITES = AdmissionLimiter("write", settings.admission_write_limit)
+
+
+def admission_stats() -> List[dict]:
+    """
+    Returns the state and counters of the read and write limiters.
+
+    Returns:
+    - list[dict]: The snapshot of each limiter.
+    """
+    return [READS.snapshot(), WRITES.snapshot()]
+
+
+class AdmissionMiddleware:
+    """
+    Represents the middleware applying the admission control to the device API.
+
+    Attributes:
+    - prefix (str): The path prefix of the requests subject to admission control.
+    - reads (AdmissionLimiter): The limiter of the read requests.
+    - writes (AdmissionLimiter): The limiter of the write requests.
+    """
+
+    def __init__(self, app, prefix: str = "/devices", reads: AdmissionLimiter = READS,
+                 writes: AdmissionLimiter = WRITES):
+        self.app = app
+        self.prefix = prefix
+        self.reads = reads
+        self.writes = writes
+
+    def _limiter(self, scope) -> Optional[AdmissionLimiter]:
+        """
+        Returns the limiter a request goes through.
+
+        Parameters:
+        - scope (dict): The ASGI scope of the request.
+
+        Returns:
+        - AdmissionLimiter or None: The limiter, None if the request is not subject to
+          admission control.
+        """
+        if scope["type"] != "http":
+            return None
+        path = scope["path"]
+        if not path.startswith(self.prefix) or path.startswith(EXEMPT_PATHS):
+            return None
+        if scope["method"] in READ_METHODS:
+            parameters = parse_qsl(scope["query_string"].decode("latin-1"))
+            if any(parameter in parameters for parameter in STREAMING_PARAMETERS):
+                return None
+            limiter = self.reads
+        # Batch reads are posted because of the size of their body
+        elif path.endswith("/batch-get"):
+            limiter = self.reads
+        else:
+            limiter = self.writes
+        return limiter if limiter.enabled else None
+
+    async def __call__(self, scope, receive, send):
+        limiter = self._limiter(scope)
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire()
+        except RequestShedError as error:
+            response = ORJSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content=jsonable_encoder(ServiceOverloadedResponse()),
+                headers={"Retry-After": str(error.retry_after)})
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - start)
@@ -0,0 +1,197 @@
+"""
+Module containing the parsing and batch validation of bulk device payloads.
+"""
+
+import json
+from typing import Any, AsyncIterator, Iterable, List, Optional, Tuple
+from pydantic import EmailStr, TypeAdapter, ValidationError
+from fastapi.encoders import jsonable_encoder
+from app.models.device import Device, BulkItemResult, BulkItemStatus
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+BULK_BATCH_SIZE = 1_000
+BULK_MAX_ITEMS = 100_000
+
+
+class _UncheckedOwnerDevice(Device):
+    """
+    Represents a device whose owner is not validated yet.
+
+    Validating an email address is by far the most expensive part of validating a device,
+    and a bulk payload usually shares a handful of owners across thousands of devices, so
+    owners are validated once per distinct value instead.
+    """
+    owner: str
+
+
+_DEVICE_LIST_ADAPTER = TypeAdapter(List[_UncheckedOwnerDevice])
+_EMAIL_ADAPTER = TypeAdapter(EmailStr)
+_MISSING_LOCALISATION = [{"type": "missing", "loc": ["localisation"], "msg": "Field required"}]
+
+
+class InvalidBulkPayload(ValueError):
+    """
+    Raised when a bulk request body is neither a JSON array nor an NDJSON stream.
+    """
+
+
+def is_ndjson(content_type: Optional[str]) -> bool:
+    """
+    Tells whether a request content type designates newline-delimited JSON.
+
+    Parameters:
+    - content_type (str, optional): The value of the Content-Type header.
+
+    Returns:
+    - bool: True for an NDJSON body.
+    """
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return media_type in NDJSON_MEDIA_TYPES
+
+
+def parse_json_array(body: bytes) -> List[Any]:
+    """
+    Parses a JSON array body.
+
+    Parameters:
+    - body (bytes): The request body.
+
+    Returns:
+    - list: The items of the array.
+
+    Raises:
+    - InvalidBulkPayload: If the body is not a JSON array.
+    """
+    try:
+        items = json.loads(body)
+    except ValueError as error:
+        raise InvalidBulkPayload(str(error)) from error
+    if not isinstance(items, list):
+        raise InvalidBulkPayload("Expected a JSON array")
+    return items
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[Any, Optional[list]]]:
+    """
+    Parses an NDJSON body as it is received.
+
+    Parameters:
+    - chunks (AsyncIterator[bytes]): The chunks of the request body.
+
+    Yields:
+    - tuple: The parsed item, and the parsing errors if the line is not valid JSON.
+    """
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if pending.strip():
+        yield _parse_line(pending)
+
+
+def _parse_line(line: bytes) -> Tuple[Any, Optional[list]]:
+    """
+    Parses a single NDJSON line.
+
+    Parameters:
+    - line (bytes): The line to parse.
+
+    Returns:
+    - tuple: The parsed item, and the parsing errors if the line is not valid JSON.
+    """
+    try:
+        return json.loads(line), None
+    except ValueError as error:
+        return None, [{"type": "json_invalid", "loc": [], "msg": str(error)}]
+
+
+def validate_batch(items: Iterable[Tuple[int, Any]]) -> Tuple[List[Tuple[int, Device]],
+                                                               List[BulkItemResult]]:
+    """
+    Validates a batch of raw items against the Device model.
+
+    The whole batch is validated in one call; when some items fail, only the remaining
+    ones are validated again, so a mostly valid batch costs a couple of calls.
+    Owners are then validated once per distinct address.
+
+    Parameters:
+    - items (Iterable[tuple[int, Any]]): The raw items along with their position in the request.
+
+    Returns:
+    - tuple: The validated devices with their position, and the results of invalid items.
+    """
+    pending = list(items)
+    invalid: List[BulkItemResult] = []
+    while pending:
+        try:
+            devices = _DEVICE_LIST_ADAPTER.validate_python([item for _, item in pending])
+        except ValidationError as error:
+            failed = {}
+            for detail in error.errors(include_url=False, include_context=False):
+                position, *loc = detail["loc"]
+                failed.setdefault(position, []).append({**detail, "loc": loc})
+            for position, details in sorted(failed.items()):
+                index, item = pending[position]
+                invalid.append(_invalid(index, item, jsonable_encoder(details)))
+            pending = [entry for position, entry in enumerate(pending) if position not in failed]
+            continue
+
+        owners = _validate_owners({device.owner for device in devices})
+        valid = []
+        for (index, item), device in zip(pending, devices):
+            owner = owners[device.owner]
+            if isinstance(owner, list):
+                invalid.append(_invalid(index, item, owner))
+            elif device.localisation is None:
+                invalid.append(_invalid(index, item, _MISSING_LOCALISATION))
+            else:
+                valid.append((index, Device.model_construct(
+                    device_uuid=device.device_uuid,
+                    localisation=device.localisation,
+                    deployment_date=device.deployment_date,
+                    owner=owner)))
+        return valid, invalid
+    return [], invalid
+
+
+def _validate_owners(owners: Iterable[str]) -> dict:
+    """
+    Validates a set of owner email addresses.
+
+    Parameters:
+    - owners (Iterable[str]): The distinct owner addresses.
+
+    Returns:
+    - dict: The normalized address of each valid owner, or its validation errors.
+    """
+    results = {}
+    for owner in owners:
+        try:
+            results[owner] = _EMAIL_ADAPTER.validate_python(owner)
+        except ValidationError as error:
+            results[owner] = jsonable_encoder(
+                [{**detail, "loc": ["owner"]}
+                 for detail in error.errors(include_url=False, include_context=False)])
+    return results
+
+
+def _invalid(index: int, item: Any, detail: list) -> BulkItemResult:
+    """
+    Builds the result of an invalid item.
+
+    Parameters:
+    - index (int): The position of the item in the request.
+    - item (Any): The raw item.
+    - detail (list): The validation errors.
+
+    Returns:
+    - BulkItemResult: The invalid result.
+    """
+    device_uuid = item.get("device_uuid") if isinstance(item, dict) else None
+    return BulkItemResult(index=index,
+                          device_uuid=device_uuid if isinstance(device_uuid, str) else None,
+                          status=BulkItemStatus.INVALID,
+                          detail=detail)
@@ -0,0 +1,84 @@
+"""
+Module containing the streaming of the device change feed to the API clients.
+
+Events are sent as Server-Sent Events, whose id is the sequence of the event so that a
+reconnecting client resumes with the standard Last-Event-ID header, or as WebSocket text
+messages holding the JSON event.
+"""
+
+import asyncio
+from typing import AsyncIterator
+import orjson
+from fastapi import WebSocket
+from app.database.changes import ChangeEvent, Subscription
+
+# Time after which an idle Server-Sent Events stream sends a comment, so that proxies keep
+# the connection open and a disconnected client is noticed
+HEARTBEAT_SECONDS = 15.0
+
+
+def sse_message(event: ChangeEvent) -> bytes:
+    """
+    Formats an event as a Server-Sent Event.
+
+    Parameters:
+    - event (ChangeEvent): The event.
+
+    Returns:
+    - bytes: The id, event type and JSON data lines of the event.
+    """
+    return (f"id: {event.sequence}\nevent: {event.type}\ndata: ".encode()
+            + orjson.dumps(event.to_dict()) + b"\n\n")
+
+
+async def sse_stream(subscription: Subscription) -> AsyncIterator[bytes]:
+    """
+    Streams the events of a subscription as Server-Sent Events, until the client leaves.
+
+    Parameters:
+    - subscription (Subscription): The subscription, closed when the stream ends.
+
+    Yields:
+    - bytes: The messages, and a comment after every idle HEARTBEAT_SECONDS.
+    """
+    try:
+        # Sent at once, so that the client knows the subscription is registered
+        yield b": subscribed\n\n"
+        while True:
+            event = await subscription.next_event(HEARTBEAT_SECONDS)
+            yield sse_message(event) if event is not None else b": heartbeat\n\n"
+    finally:
+        subscription.close()
+
+
+async def _wait_for_disconnect(websocket: WebSocket) -> None:
+    """
+    Waits until a WebSocket client disconnects, ignoring the messages it sends.
+
+    Parameters:
+    - websocket (WebSocket): The accepted connection.
+    """
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+async def websocket_stream(websocket: WebSocket, subscription: Subscription) -> None:
+    """
+    Sends the events of a subscription over a WebSocket, until the client leaves.
+
+    Parameters:
+    - websocket (WebSocket): The accepted connection.
+    - subscription (Subscription): The subscription, closed when the client leaves.
+    """
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(websocket))
+    try:
+        while True:
+            next_event = asyncio.ensure_future(subscription.next_event())
+            await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                next_event.cancel()
+                return
+            await websocket.send_text(orjson.dumps(next_event.result().to_dict()).decode())
+    finally:
+        disconnected.cancel()
+        subscription.close()
@@ -0,0 +1,147 @@
+"""
+Module containing the ASGI middleware of the application.
+"""
+import asyncio
+import random
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, List, Optional
+from app.config import settings
+from app.metrics import (HTTP_REQUESTS, HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_FLIGHT,
+                         SLOW_REQUESTS)
+
+SLOW_REQUEST_LOG_SIZE = 100
+UNMATCHED_ROUTE = "unmatched"
+
+_SLOW_REQUESTS: Deque[dict] = deque(maxlen=SLOW_REQUEST_LOG_SIZE)
+
+
+def slow_requests() -> List[dict]:
+    """
+    Returns the slow requests captured by the profiling, most recent last.
+
+    Returns:
+    - list[dict]: The method, path, elapsed time and stack of each captured request.
+    """
+    return list(_SLOW_REQUESTS)
+
+
+class MetricsMiddleware:
+    """
+    Represents the middleware recording the latency, status code and concurrency of the
+    HTTP requests.
+
+    Requests are labeled by the name of the endpoint handling them (e.g. read_device)
+    rather than by path, so that the number of samples stays bounded.
+
+    When profiling is enabled, a sample of the requests is watched: if a watched request
+    is still running once the threshold has elapsed, the stack of its task is captured,
+    showing what it is waiting on at that moment.
+
+    Attributes:
+    - slow_request_seconds (float): The profiling threshold, 0 if profiling is disabled.
+    - sample_rate (float): The fraction of the requests watched by the profiling.
+    """
+
+    def __init__(self, app, slow_request_ms: float = settings.slow_request_ms,
+                 sample_rate: float = settings.slow_request_sample_rate):
+        self.app = app
+        self.slow_request_seconds = slow_request_ms / 1000
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        watcher = self._watch(scope, start)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            if watcher is not None:
+                watcher.cancel()
+            # The router stores the matched route in the scope
+            handler = getattr(scope.get("route"), "name", UNMATCHED_ROUTE)
+            HTTP_REQUESTS.inc(scope["method"], handler, str(status_code))
+            HTTP_REQUEST_SECONDS.observe(elapsed, scope["method"], handler)
+
+    def _watch(self, scope, start: float) -> Optional[asyncio.TimerHandle]:
+        """
+        Schedules the capture of the request stack once the threshold has elapsed, if the
+        request is sampled.
+
+        Parameters:
+        - scope (dict): The ASGI scope of the request.
+        - start (float): The time the request started, from `time.perf_counter()`.
+
+        Returns:
+        - asyncio.TimerHandle or None: The scheduled capture, to cancel once the request
+          is over.
+        """
+        if self.slow_request_seconds <= 0 or random.random() >= self.sample_rate:
+            return None
+        task = asyncio.current_task()
+        return asyncio.get_running_loop().call_later(self.slow_request_seconds,
+                                                     _capture_stack, task, scope, start)
+
+
+def _capture_stack(task: asyncio.Task, scope, start: float) -> None:
+    """
+    Captures the stack of a request still running after the profiling threshold.
+
+    Parameters:
+    - task (asyncio.Task): The task handling the request.
+    - scope (dict): The ASGI scope of the request.
+    - start (float): The time the request started, from `time.perf_counter()`.
+    """
+    if task.done():
+        return
+    SLOW_REQUESTS.inc()
+    _SLOW_REQUESTS.append({
+        "method": scope["method"],
+        "path": scope["path"],
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+        "captured_at": datetime.now(timezone.utc).isoformat(),
+        "stack": _await_stack(task),
+    })
+
+
+def _await_stack(task: asyncio.Task) -> str:
+    """
+    Formats the chain of coroutines a task is suspended in, outermost first.
+
+    `Task.get_stack()` only returns the frame of the outermost coroutine of a suspended
+    task, so the chain is followed through the awaited coroutines instead.
+
+    Parameters:
+    - task (asyncio.Task): The suspended task.
+
+    Returns:
+    - str: The formatted stack, ending with the innermost await.
+    """
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = (getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+                 or getattr(awaitable, "ag_frame", None))
+        if frame is None:
+            break
+        frames.append((frame, frame.f_lineno))
+        awaitable = (getattr(awaitable, "cr_await", None)
+                     or getattr(awaitable, "gi_yieldfrom", None)
+                     or getattr(awaitable, "ag_await", None))
+    return "".join(traceback.StackSummary.extract(frames).format())
@@ -0,0 +1,55 @@
+"""
+Module containing the response classes of the API.
+
+Endpoints returning a plain value have it walked by `jsonable_encoder` before it is rendered.
+Devices read from the database were validated when they were written and only hold JSON
+types, so the read endpoints return them through `trusted_json`, which renders them straight
+to bytes. Devices validated from a request body are rendered by Pydantic with `model_json`.
+"""
+
+from typing import Any
+import orjson
+from fastapi import status
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    Represents a JSON response rendered with orjson.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+def trusted_json(content: Any, status_code: int = status.HTTP_200_OK) -> ORJSONResponse:
+    """
+    Builds a JSON response from content that only holds JSON types, skipping
+    `jsonable_encoder`.
+
+    Parameters:
+    - content (Any): The content, made of dicts, lists, strings, numbers and None.
+    - status_code (int): The status code of the response. Default is 200.
+
+    Returns:
+    - ORJSONResponse: The response.
+    """
+    return ORJSONResponse(content=content, status_code=status_code)
+
+
+def model_json(model: BaseModel, status_code: int = status.HTTP_200_OK) -> Response:
+    """
+    Builds a JSON response from an already validated model, serialized by Pydantic.
+
+    Parameters:
+    - model (BaseModel): The model.
+    - status_code (int): The status code of the response. Default is 200.
+
+    Returns:
+    - Response: The response.
+    """
+    return Response(content=model.model_dump_json(), status_code=status_code,
+                    media_type=JSON_MEDIA_TYPE)
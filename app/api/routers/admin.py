@@ -0,0 +1,109 @@
+"""
+Module containing the administration API endpoints.
+"""
+
+from fastapi import APIRouter, status
+from app.database.pool import pool_stats
+from app.database.cache import cache_stats
+from app.database.operations.history import compact_history
+from app.database.operations.stats import rebuild_device_counts
+from app.database.operations.storage import maintain_storage, storage_stats
+from app.api.admission import admission_stats
+from app.api.middleware import slow_requests
+
+router = APIRouter()
+
+
+@router.get(path="/pool",
+            summary="Read the connection pool statistics",
+            description="Read the usage and wait statistics of the database connection pools.",
+            status_code=status.HTTP_200_OK)
+async def read_pool_stats():
+    """
+    Read the usage and wait statistics of the database connection pools.
+    """
+    return pool_stats()
+
+
+@router.get(path="/cache",
+            summary="Read the device cache statistics",
+            description="Read the hit, miss and eviction counters of the device caches.",
+            status_code=status.HTTP_200_OK)
+async def read_cache_stats():
+    """
+    Read the hit, miss and eviction counters of the device caches.
+    """
+    return cache_stats()
+
+
+@router.get(path="/admission",
+            summary="Read the admission control statistics",
+            description="Read the limits, queue depths and shed counts of the admission "
+                        "control of the device reads and writes.",
+            status_code=status.HTTP_200_OK)
+async def read_admission_stats():
+    """
+    Read the limits, queue depths and shed counts of the admission control.
+    """
+    return admission_stats()
+
+
+@router.get(path="/slow-requests",
+            summary="Read the captured slow requests",
+            description="Read the stacks of the sampled requests that exceeded the "
+                        "profiling threshold (EDGEMATRIX_SLOW_REQUEST_MS).",
+            status_code=status.HTTP_200_OK)
+async def read_slow_requests():
+    """
+    Read the stacks of the sampled requests that exceeded the profiling threshold.
+    """
+    return slow_requests()
+
+
+@router.post(path="/history/compact",
+             summary="Compact the device history",
+             description="Downsample and expire the old versions of the device history now, "
+                         "instead of waiting for the periodic compaction.",
+             status_code=status.HTTP_200_OK)
+async def compact_device_history():
+    """
+    Downsample and expire the old versions of the device history.
+    """
+    return await compact_history()
+
+
+@router.get(path="/storage",
+            summary="Read the storage statistics",
+            description="Read the file size of each database shard, the size of each table "
+                        "with its indexes, and the size of the free pages to reclaim.",
+            status_code=status.HTTP_200_OK)
+async def read_storage_stats():
+    """
+    Read the file size, table sizes and reclaimable size of each database shard.
+    """
+    return await storage_stats()
+
+
+@router.post(path="/storage/maintain",
+             summary="Maintain the storage",
+             description="Delete the unreferenced coordinates and return the free pages to "
+                         "the file system now, instead of waiting for the periodic "
+                         "maintenance.",
+             status_code=status.HTTP_200_OK)
+async def maintain_database_storage():
+    """
+    Delete the unreferenced coordinates and return the free pages to the file system.
+    """
+    return await maintain_storage()
+
+
+@router.post(path="/stats/rebuild",
+             summary="Rebuild the device statistics",
+             description="Recompute the device counts per owner, deployment month and grid "
+                         "cell from the devices, should they have drifted from them.",
+             status_code=status.HTTP_200_OK)
+async def rebuild_device_stats():
+    """
+    Recompute the device counts per owner, deployment month and grid cell.
+    """
+    return {"seconds": await rebuild_device_counts()}
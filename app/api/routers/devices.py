@@ -2,16 +2,36 @@
 Module containing the device API endpoints.
 """
 
-from typing import Annotated
-from fastapi import APIRouter, Path, status
-from fastapi.responses import JSONResponse
+from datetime import date, datetime
+from typing import Annotated, Optional
+import orjson
+from fastapi import APIRouter, Header, Path, Query, Request, WebSocket, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.encoders import jsonable_encoder
 from app.models.device import (Device, DeviceNotFoundResponse,
-                               DeviceAlreadyExists, DeviceDeletionResponse)
-from app.database.operations import devices
+                               DeviceAlreadyExists, DeviceDeletionResponse,
+                               BulkIngestResponse, BulkItemResult, BulkItemStatus,
+                               InvalidBulkPayloadResponse, BulkPayloadTooLargeResponse,
+                               DevicePage, ListingFormat, DeviceList, NearbyDeviceList,
+                               InvalidBoundingBoxResponse, DeviceBatchGetRequest,
+                               DeviceBatchGetResponse, DeviceHistory, ExportFormat,
+                               ExportFormatUnavailableResponse, DevicePatch,
+                               DeviceBulkPatchRequest, DeviceBulkPatchResponse,
+                               OwnerCountList, MonthCountList, GridCellCountList)
+from app.database.migrations import GRID_PRECISIONS
+from app.database.operations import devices, history, stats
+from app.database import export
+from app.database.changes import get_feed
+from app.database.exceptions import (DeviceAlreadyExistsError, DeviceNotFoundError,
+                                     ExportFormatUnavailableError)
+from app.database.spatial import MAX_DISTANCE_KM
+from app.api import bulk, changes
+from app.api.responses import model_json, trusted_json
 
 router = APIRouter()
 
+UUID_PREFIX_PATTERN = r'^DEV([A-Z]\d{0,6})?$'
+
 
 @router.post(path="/",
              summary="Create a Device",
@@ -28,17 +48,430 @@ async def create_device(device: Device):
     Parameters:
     - `device`: The device details to create.
     """
-    item = await devices.get_device(device.device_uuid)
-
-    if item is not None:
+    try:
+        await devices.create_device(device)
+    except DeviceAlreadyExistsError:
         return JSONResponse(
             status_code=status.HTTP_409_CONFLICT,
             content=jsonable_encoder(DeviceAlreadyExists())
         )
 
-    await devices.create_device(device)
+    return model_json(device, status.HTTP_201_CREATED)
+
+
+@router.post(path="/bulk",
+             summary="Create Devices in bulk",
+             description="Create many devices at once from a JSON array or an NDJSON stream "
+                         "(Content-Type: application/x-ndjson). "
+                         "Every valid device is inserted in a single transaction "
+                         "(one per shard when the database is sharded).",
+             status_code=status.HTTP_200_OK,
+             responses={
+                 status.HTTP_200_OK: {"model": BulkIngestResponse},
+                 status.HTTP_400_BAD_REQUEST: {"model": InvalidBulkPayloadResponse},
+                 status.HTTP_413_CONTENT_TOO_LARGE: {"model": BulkPayloadTooLargeResponse}
+             },
+             openapi_extra={
+                 "requestBody": {
+                     "required": True,
+                     "content": {
+                         "application/json": {
+                             "schema": {"type": "array",
+                                        "items": {"$ref": "#/components/schemas/Device"}}
+                         },
+                         "application/x-ndjson": {
+                             "schema": {"type": "string",
+                                        "description": "One device JSON object per line"}
+                         }
+                     }
+                 }
+             })
+async def create_devices(request: Request):
+    """
+    Create many devices at once.
+
+    The body is validated in batches and every valid device is inserted in a single
+    transaction. Each item gets its own result: created, conflict or invalid.
+
+    Parameters:
+    - `request`: The request, whose body is a JSON array or an NDJSON stream of devices.
+    """
+    valid = []
+    results = []
+    batch = []
+    count = 0
+
+    if bulk.is_ndjson(request.headers.get("content-type")):
+        async for item, errors in bulk.iter_ndjson(request.stream()):
+            if errors is not None:
+                results.append(BulkItemResult(index=count, status=BulkItemStatus.INVALID,
+                                              detail=errors))
+            else:
+                batch.append((count, item))
+            count += 1
+            if count > bulk.BULK_MAX_ITEMS:
+                return JSONResponse(
+                    status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                    content=jsonable_encoder(BulkPayloadTooLargeResponse())
+                )
+            if len(batch) == bulk.BULK_BATCH_SIZE:
+                batch_valid, batch_invalid = bulk.validate_batch(batch)
+                valid += batch_valid
+                results += batch_invalid
+                batch = []
+    else:
+        try:
+            items = bulk.parse_json_array(await request.body())
+        except bulk.InvalidBulkPayload:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content=jsonable_encoder(InvalidBulkPayloadResponse())
+            )
+        if len(items) > bulk.BULK_MAX_ITEMS:
+            return JSONResponse(
+                status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                content=jsonable_encoder(BulkPayloadTooLargeResponse())
+            )
+        for start in range(0, len(items), bulk.BULK_BATCH_SIZE):
+            batch_valid, batch_invalid = bulk.validate_batch(
+                enumerate(items[start:start + bulk.BULK_BATCH_SIZE], start))
+            valid += batch_valid
+            results += batch_invalid
+
+    if batch:
+        batch_valid, batch_invalid = bulk.validate_batch(batch)
+        valid += batch_valid
+        results += batch_invalid
+
+    created = await devices.create_devices([device for _, device in valid]) if valid else {}
+
+    seen = set()
+    for index, device in valid:
+        is_created = created[device.device_uuid] and device.device_uuid not in seen
+        seen.add(device.device_uuid)
+        results.append(BulkItemResult(
+            index=index,
+            device_uuid=device.device_uuid,
+            status=BulkItemStatus.CREATED if is_created else BulkItemStatus.CONFLICT))
+    results.sort(key=lambda result: result.index)
+
+    response = BulkIngestResponse(results=results)
+    for result in results:
+        if result.status == BulkItemStatus.CREATED:
+            response.created += 1
+        elif result.status == BulkItemStatus.CONFLICT:
+            response.conflicts += 1
+        else:
+            response.invalid += 1
+    return response
+
+
+@router.post(path="/batch-get",
+             summary="Read Devices in batch",
+             description="Read up to 1000 devices by their UUIDs with a single query. "
+                         "UUIDs without a device are listed as missing.",
+             status_code=status.HTTP_200_OK,
+             responses={
+                 status.HTTP_200_OK: {"model": DeviceBatchGetResponse}
+             })
+async def read_devices(request: DeviceBatchGetRequest):
+    """
+    Read several devices by their UUIDs.
+
+    Parameters:
+    - `request`: The UUIDs of the devices to read.
+    """
+    found = await devices.get_devices(request.device_uuids)
+
+    return trusted_json({
+        "items": [item for item in found.values() if item is not None],
+        "missing": [device_uuid for device_uuid, item in found.items() if item is None]
+    })
+
+
+@router.get(path="/",
+            summary="List Devices",
+            description="List devices ordered by UUID, one page at a time, "
+                        "or stream them all as NDJSON.",
+            status_code=status.HTTP_200_OK,
+            responses={
+                status.HTTP_200_OK: {
+                    "model": DevicePage,
+                    "content": {"application/x-ndjson": {}}
+                }
+            })
+async def list_devices(
+        cursor: Annotated[Optional[str], Query(pattern=Device.UUID_REGEX_PATTERN,
+                                               description="Only list devices whose UUID "
+                                                           "comes after this one. Use the "
+                                                           "next_cursor of the previous page.")
+                          ] = None,
+        limit: Annotated[int, Query(ge=1, le=1000,
+                                    description="The maximum number of devices per page. "
+                                                "Ignored when streaming NDJSON.")] = 100,
+        owner: Annotated[Optional[str], Query(description="Only list the devices "
+                                                          "of this owner.")] = None,
+        deployed_from: Annotated[Optional[date], Query(description="Only list devices "
+                                                                   "deployed on or after "
+                                                                   "this date.")] = None,
+        deployed_to: Annotated[Optional[date], Query(description="Only list devices "
+                                                                 "deployed on or before "
+                                                                 "this date.")] = None,
+        prefix: Annotated[Optional[str], Query(pattern=UUID_PREFIX_PATTERN,
+                                               description="Only list devices whose UUID "
+                                                           "starts with this prefix "
+                                                           "(e.g., DEVX00).")] = None,
+        output_format: Annotated[ListingFormat, Query(alias="format",
+                                                      description="json for a single page, "
+                                                                  "ndjson to stream every "
+                                                                  "matching device.")
+                                 ] = ListingFormat.JSON):
+    """
+    List devices ordered by UUID.
+
+    Parameters:
+    - `cursor`: The UUID after which the listing starts.
+    - `limit`: The maximum number of devices per page.
+    - `owner`: Only list the devices of this owner.
+    - `deployed_from`: Only list devices deployed on or after this date.
+    - `deployed_to`: Only list devices deployed on or before this date.
+    - `prefix`: Only list devices whose UUID starts with this prefix.
+    - `format`: json for a single page, ndjson to stream every matching device.
+    """
+    if output_format == ListingFormat.NDJSON:
+        async def stream():
+            async for item in devices.iter_devices(cursor, owner, deployed_from, deployed_to,
+                                                   prefix):
+                yield orjson.dumps(item) + b"\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
 
-    return device
+    # One extra device is read to know whether there is a next page
+    items = await devices.list_devices(limit + 1, cursor, owner, deployed_from, deployed_to,
+                                       prefix)
+    next_cursor = items[limit - 1]['device_uuid'] if len(items) > limit else None
+
+    return trusted_json({"items": items[:limit], "next_cursor": next_cursor})
+
+
+@router.get(path="/export",
+            summary="Export every Device",
+            description="Stream every device from a consistent snapshot of the database, "
+                        "as NDJSON, CSV, Arrow IPC stream or Parquet.",
+            status_code=status.HTTP_200_OK,
+            responses={
+                status.HTTP_200_OK: {
+                    "content": {media_type: {} for media_type in export.MEDIA_TYPES.values()}
+                },
+                status.HTTP_501_NOT_IMPLEMENTED: {"model": ExportFormatUnavailableResponse}
+            })
+async def export_devices(
+        output_format: Annotated[ExportFormat, Query(alias="format",
+                                                     description="The output format. Arrow "
+                                                                 "and Parquet require "
+                                                                 "pyarrow.")
+                                 ] = ExportFormat.NDJSON,
+        batch_size: Annotated[int, Query(ge=1, le=100_000,
+                                         description="The number of devices fetched and "
+                                                     "encoded at a time.")] = 10_000):
+    """
+    Stream every device from a consistent snapshot of the database.
+
+    Parameters:
+    - `format`: ndjson, csv, arrow or parquet.
+    - `batch_size`: The number of devices fetched and encoded at a time.
+    """
+    try:
+        export.check_format(output_format.value)
+    except ExportFormatUnavailableError:
+        return JSONResponse(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            content=jsonable_encoder(ExportFormatUnavailableResponse())
+        )
+
+    return StreamingResponse(export.export_devices(output_format.value, batch_size),
+                             media_type=export.MEDIA_TYPES[output_format.value],
+                             headers={"Content-Disposition": "attachment; filename="
+                                                             f"devices.{output_format.value}"})
+
+
+@router.get(path="/near",
+            summary="Find Devices near a point",
+            description="Find the devices closest to a point, ordered by distance, "
+                        "optionally restricted to a radius.",
+            status_code=status.HTTP_200_OK,
+            responses={
+                status.HTTP_200_OK: {"model": NearbyDeviceList}
+            })
+async def find_devices_near(
+        lat: Annotated[float, Query(ge=-90, le=90, description="Latitude of the point.")],
+        lon: Annotated[float, Query(ge=-180, le=180, description="Longitude of the point.")],
+        radius_km: Annotated[Optional[float], Query(gt=0, le=MAX_DISTANCE_KM,
+                                                    description="Only find the devices "
+                                                                "within this distance, "
+                                                                "in kilometers.")] = None,
+        limit: Annotated[int, Query(ge=1, le=1000,
+                                    description="The maximum number of devices.")] = 100):
+    """
+    Find the devices closest to a point.
+
+    Parameters:
+    - `lat`: The latitude of the point.
+    - `lon`: The longitude of the point.
+    - `radius_km`: Only find the devices within this distance.
+    - `limit`: The maximum number of devices.
+    """
+    return trusted_json({"items": await devices.find_devices_near(lat, lon, radius_km, limit)})
+
+
+@router.get(path="/within",
+            summary="Find Devices in a bounding box",
+            description="Find the devices located in a latitude/longitude bounding box. "
+                        "A min_lon greater than max_lon designates a box crossing "
+                        "the antimeridian.",
+            status_code=status.HTTP_200_OK,
+            responses={
+                status.HTTP_200_OK: {"model": DeviceList},
+                status.HTTP_400_BAD_REQUEST: {"model": InvalidBoundingBoxResponse}
+            })
+async def find_devices_in_box(
+        min_lat: Annotated[float, Query(ge=-90, le=90, description="Southern edge.")],
+        max_lat: Annotated[float, Query(ge=-90, le=90, description="Northern edge.")],
+        min_lon: Annotated[float, Query(ge=-180, le=180, description="Western edge.")],
+        max_lon: Annotated[float, Query(ge=-180, le=180, description="Eastern edge.")],
+        limit: Annotated[int, Query(ge=1, le=10000,
+                                    description="The maximum number of devices.")] = 1000):
+    """
+    Find the devices located in a bounding box.
+
+    Parameters:
+    - `min_lat`: The southern edge of the box.
+    - `max_lat`: The northern edge of the box.
+    - `min_lon`: The western edge of the box.
+    - `max_lon`: The eastern edge of the box.
+    - `limit`: The maximum number of devices.
+    """
+    if min_lat > max_lat:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content=jsonable_encoder(InvalidBoundingBoxResponse())
+        )
+
+    items = await devices.find_devices_in_box(min_lat, max_lat, min_lon, max_lon, limit)
+    return trusted_json({"items": items})
+
+
+@router.get(path="/changes",
+            summary="Stream Device changes",
+            description="Stream the creations, updates and deletions of devices as "
+                        "Server-Sent Events, as they are committed. Each event id is its "
+                        "sequence number: a client reconnecting with the Last-Event-ID header "
+                        "receives the events it missed, or a reset event if they are no "
+                        "longer kept, meaning it must read the devices again.",
+            status_code=status.HTTP_200_OK,
+            responses={
+                status.HTTP_200_OK: {"content": {"text/event-stream": {}}}
+            })
+async def stream_device_changes(
+        owner: Annotated[Optional[str], Query(description="Only stream the changes of the "
+                                                          "devices of this owner.")] = None,
+        prefix: Annotated[Optional[str], Query(pattern=UUID_PREFIX_PATTERN,
+                                               description="Only stream the changes of the "
+                                                           "devices whose UUID starts with "
+                                                           "this prefix.")] = None,
+        after: Annotated[Optional[int], Query(description="Resume after the event with this "
+                                                          "sequence number.")] = None,
+        last_event_id: Annotated[Optional[int], Header(description="Resume after the event "
+                                                                   "with this id, as sent by "
+                                                                   "reconnecting clients. "
+                                                                   "Takes precedence over "
+                                                                   "after.")] = None):
+    """
+    Stream the changes of devices as Server-Sent Events.
+
+    Parameters:
+    - `owner`: Only stream the changes of the devices of this owner.
+    - `prefix`: Only stream the changes of the devices whose UUID starts with this prefix.
+    - `after`: Resume after the event with this sequence number.
+    - `Last-Event-ID`: Resume after the event with this id.
+    """
+    subscription = get_feed().subscribe(owner, prefix,
+                                        last_event_id if last_event_id is not None else after)
+    return StreamingResponse(changes.sse_stream(subscription), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
+@router.websocket(path="/changes/ws")
+async def watch_device_changes(
+        websocket: WebSocket,
+        owner: Annotated[Optional[str], Query()] = None,
+        prefix: Annotated[Optional[str], Query(pattern=UUID_PREFIX_PATTERN)] = None,
+        after: Annotated[Optional[int], Query()] = None):
+    """
+    Stream the changes of devices over a WebSocket, one JSON message per event.
+
+    Parameters:
+    - `owner`: Only stream the changes of the devices of this owner.
+    - `prefix`: Only stream the changes of the devices whose UUID starts with this prefix.
+    - `after`: Resume after the event with this sequence number.
+    """
+    await websocket.accept()
+    await changes.websocket_stream(websocket, get_feed().subscribe(owner, prefix, after))
+
+
+@router.get(path="/stats/by-owner",
+            summary="Count the Devices per owner",
+            description="Count the devices of each owner, from counts maintained on every "
+                        "write rather than by scanning the devices.",
+            status_code=status.HTTP_200_OK,
+            responses={
+                status.HTTP_200_OK: {"model": OwnerCountList}
+            })
+async def count_devices_by_owner():
+    """
+    Count the devices of each owner.
+    """
+    return trusted_json({"items": await stats.count_devices_by_owner()})
+
+
+@router.get(path="/stats/by-deployment-month",
+            summary="Count the Devices per deployment month",
+            description="Count the devices deployed each month, and those without a "
+                        "deployment date, from counts maintained on every write rather "
+                        "than by scanning the devices.",
+            status_code=status.HTTP_200_OK,
+            responses={
+                status.HTTP_200_OK: {"model": MonthCountList}
+            })
+async def count_devices_by_deployment_month():
+    """
+    Count the devices deployed each month.
+    """
+    return trusted_json({"items": await stats.count_devices_by_deployment_month()})
+
+
+@router.get(path="/stats/by-grid-cell",
+            summary="Count the Devices per grid cell",
+            description="Count the devices located in each cell of a latitude and longitude "
+                        "grid, from counts maintained on every write rather than by "
+                        "scanning the devices.",
+            status_code=status.HTTP_200_OK,
+            responses={
+                status.HTTP_200_OK: {"model": GridCellCountList}
+            })
+async def count_devices_by_grid_cell(
+        precision: Annotated[int, Query(ge=min(GRID_PRECISIONS), le=max(GRID_PRECISIONS),
+                                        description="The number of decimals of the cell "
+                                                    "corners: cells span 1 degree at 0, "
+                                                    "0.1 at 1 and 0.01 at 2.")] = 0):
+    """
+    Count the devices located in each cell of a grid.
+
+    Parameters:
+    - `precision`: The number of decimals of the cell corners.
+    """
+    return trusted_json({"precision": precision,
+                         "items": await stats.count_devices_by_grid_cell(precision)})
 
 
 @router.get(path="/{device_uuid}",
@@ -70,7 +503,60 @@ async def read_device(
             content=jsonable_encoder(DeviceNotFoundResponse())
         )
 
-    return item
+    return trusted_json(item)
+
+
+@router.get(path="/{device_uuid}/history",
+            summary="Read the history of a Device",
+            description="Read the versions of a device recorded within a time range, "
+                        "oldest first. Versions older than the full resolution period are "
+                        "downsampled to one per bucket.",
+            status_code=status.HTTP_200_OK,
+            responses={
+                status.HTTP_200_OK: {"model": DeviceHistory},
+                status.HTTP_404_NOT_FOUND: {"model": DeviceNotFoundResponse}
+            })
+async def read_device_history(
+        device_uuid: Annotated[str, Path(pattern=Device.UUID_REGEX_PATTERN,
+                                         examples=["DEVX000001"],
+                                         description="The uuid of the device. "
+                                                     "It should start with the prefix (DEV), "
+                                                     "a single variable character [A-Z], "
+                                                     "and six integers.")],
+        start: Annotated[Optional[datetime], Query(alias="from",
+                                                   description="Only return the versions "
+                                                               "recorded at or after this "
+                                                               "time (UTC if no offset).")
+                         ] = None,
+        end: Annotated[Optional[datetime], Query(alias="to",
+                                                 description="Only return the versions "
+                                                             "recorded at or before this "
+                                                             "time (UTC if no offset).")
+                       ] = None,
+        limit: Annotated[int, Query(ge=1, le=10000,
+                                    description="The maximum number of versions.")] = 1000):
+    """
+    Read the versions of a device recorded within a time range, oldest first.
+
+    Parameters:
+    - `device_uuid`: The UUID of the device, which may have been deleted since.
+    - `from`: Only return the versions recorded at or after this time.
+    - `to`: Only return the versions recorded at or before this time.
+    - `limit`: The maximum number of versions.
+    """
+    items = await history.get_device_history(
+        device_uuid,
+        history.datetime_to_ms(start) if start is not None else None,
+        history.datetime_to_ms(end) if end is not None else None,
+        limit)
+
+    if items is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content=jsonable_encoder(DeviceNotFoundResponse())
+        )
+
+    return trusted_json({"device_uuid": device_uuid, "items": items})
 
 
 @router.put(path="/",
@@ -88,17 +574,73 @@ async def update_device(device: Device):
     Parameters:
     - `device`: The updated device details, including its UUID.
     """
-    item = await devices.get_device(device.device_uuid)
-
-    if item is None:
+    try:
+        await devices.update_device(device)
+    except DeviceNotFoundError:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
             content=jsonable_encoder(DeviceNotFoundResponse())
         )
 
-    await devices.update_device(device)
+    return model_json(device)
+
+
+@router.patch(path="/bulk",
+              summary="Patch Devices in bulk",
+              description="Change the supplied fields of every device matching a filter, "
+                          "e.g. to transfer the devices of a site to a new owner, with a "
+                          "single statement.",
+              status_code=status.HTTP_200_OK,
+              responses={
+                  status.HTTP_200_OK: {"model": DeviceBulkPatchResponse}
+              })
+async def patch_devices(request: DeviceBulkPatchRequest):
+    """
+    Change the supplied fields of every device matching a filter.
+
+    Parameters:
+    - `request`: The filter selecting the devices, and the fields to change.
+    """
+    updated = await devices.patch_devices(request.patch, request.filter.owner,
+                                          request.filter.deployed_from,
+                                          request.filter.deployed_to, request.filter.prefix)
 
-    return device
+    return DeviceBulkPatchResponse(updated=updated)
+
+
+@router.patch(path="/{device_uuid}",
+              summary="Patch a Device",
+              description="Change the supplied fields of a device, leaving the others "
+                          "unchanged.",
+              status_code=status.HTTP_200_OK,
+              responses={
+                  status.HTTP_200_OK: {"model": Device},
+                  status.HTTP_404_NOT_FOUND: {"model": DeviceNotFoundResponse}
+              })
+async def patch_device(
+        device_uuid: Annotated[str, Path(pattern=Device.UUID_REGEX_PATTERN,
+                                         examples=["DEVX000001"],
+                                         description="The uuid of the device. "
+                                                     "It should start with the prefix (DEV), "
+                                                     "a single variable character [A-Z], "
+                                                     "and six integers.")],
+        patch: DevicePatch):
+    """
+    Change the supplied fields of a device.
+
+    Parameters:
+    - `device_uuid`: The UUID of the device to patch.
+    - `patch`: The fields to change.
+    """
+    try:
+        item = await devices.patch_device(device_uuid, patch)
+    except DeviceNotFoundError:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content=jsonable_encoder(DeviceNotFoundResponse())
+        )
+
+    return trusted_json(item)
 
 
 @router.delete(path="/{device_uuid}",
@@ -122,15 +664,12 @@ async def delete_device(
     Parameters:
     - `device_uuid`: The UUID of the device to delete.
     """
-
-    item = await devices.get_device(device_uuid)
-
-    if item is None:
+    try:
+        await devices.delete_device(device_uuid)
+    except DeviceNotFoundError:
         return JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
             content=jsonable_encoder(DeviceNotFoundResponse())
         )
 
-    await devices.delete_device(device_uuid)
-
     return DeviceDeletionResponse()
@@ -0,0 +1,28 @@
+"""
+Module containing the readiness API endpoint.
+"""
+
+from fastapi import APIRouter, Request, status
+from fastapi.responses import JSONResponse
+
+router = APIRouter()
+
+
+@router.get(path="/ready",
+            summary="Check that the application is ready",
+            description="Report the application ready once its database is set up and, "
+                        "unless disabled with EDGEMATRIX_WARMUP, warmed up. Until then, "
+                        "answer 503 so that load balancers keep sending requests to the "
+                        "other instances.",
+            status_code=status.HTTP_200_OK,
+            responses={status.HTTP_503_SERVICE_UNAVAILABLE: {
+                "description": "The database is being warmed up"}})
+async def read_readiness(request: Request):
+    """
+    Report whether the application is ready to serve requests.
+    """
+    warm_up = getattr(request.app.state, "warm_up", None)
+    if warm_up is not None and not warm_up.done():
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            content={"status": "warming up"})
+    return {"status": "ready"}
@@ -0,0 +1,24 @@
+"""
+Module containing the metrics API endpoint.
+"""
+
+from fastapi import APIRouter, status
+from fastapi.responses import PlainTextResponse
+from app.metrics import render_metrics
+
+router = APIRouter()
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get(path="/metrics",
+            summary="Read the application metrics",
+            description="Read the request and SQL statement metrics "
+                        "in the Prometheus text format.",
+            status_code=status.HTTP_200_OK,
+            response_class=PlainTextResponse)
+async def read_metrics():
+    """
+    Read the request and SQL statement metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_MEDIA_TYPE)
@@ -0,0 +1,169 @@
+"""
+Module containing the command-line interface of the database maintenance tasks.
+
+The commands run against the configured database (EDGEMATRIX_DATABASE_PATH and its shard
+layout). The export, the backup and the rebuild of the statistics can run while the API is
+serving it, the load cannot. The migration applies the pending migrations of the schema
+ahead of a deployment, rather than when the application starts.
+They refuse to run when the devices are stored in memory (EDGEMATRIX_STORAGE_BACKEND), as
+the SQLite database does not hold them then.
+
+Usage:
+    python -m app.cli export --format csv --output devices.csv
+    python -m app.cli backup /backups/devices.db
+    python -m app.cli load devices.csv
+    python -m app.cli rebuild-stats
+    python -m app.cli migrate
+"""
+import argparse
+import asyncio
+import sys
+from typing import BinaryIO, List, Optional
+from app.config import settings
+from app.database.startup import DATABASE_PATH, setup_database
+from app.database.export import EXPORT_FORMATS, check_format, export_devices
+from app.database.backup import backup_database
+from app.database.loader import LOAD_FORMATS, load_devices
+from app.database.operations.stats import rebuild_device_counts
+from app.database.pool import close_pools
+from app.database.exceptions import ExportFormatUnavailableError
+
+# What to do instead of each command when the devices are stored in memory
+MEMORY_ALTERNATIVES = {
+    "export": "export them with GET /devices/export",
+    "backup": "copy the snapshot written at shutdown ('<database>.snapshot') instead",
+    "load": "load them with POST /devices/bulk",
+    "rebuild-stats": "their statistics are rebuilt whenever they are loaded, or with "
+                     "POST /admin/stats/rebuild",
+    "migrate": "they have no schema to migrate",
+}
+
+
+async def _export(output: BinaryIO, export_format: str, batch_size: int,
+                  db_name: str) -> None:
+    """
+    Writes the export of the devices to a binary file.
+
+    Parameters:
+    - output (BinaryIO): The file written to.
+    - export_format (str): One of EXPORT_FORMATS.
+    - batch_size (int): The number of devices fetched and encoded at a time.
+    - db_name (str): The name of the SQLite database file.
+    """
+    async for chunk in export_devices(export_format, batch_size, db_name):
+        output.write(chunk)
+
+
+async def _rebuild_stats(db_name: str) -> float:
+    """
+    Recomputes the device counts of the statistics, once the schema of the database is up
+    to date, then closes the connection pools.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file.
+
+    Returns:
+    - float: The time taken by the rebuild, in seconds.
+    """
+    setup_database(db_name)
+    try:
+        return await rebuild_device_counts(db_name)
+    finally:
+        await close_pools()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Runs a maintenance command from the command line.
+
+    Parameters:
+    - argv (list[str], optional): The command-line arguments. Default is sys.argv.
+
+    Returns:
+    - int: The exit status.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default=DATABASE_PATH,
+                        help=f"database file (default: {DATABASE_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="export every device from a consistent "
+                                                "snapshot")
+    export.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson",
+                        help="output format (default: ndjson)")
+    export.add_argument("--output", help="file the devices are written to (default: stdout)")
+    export.add_argument("--batch-size", type=int, default=10_000,
+                        help="devices fetched and encoded at a time (default: 10000)")
+
+    backup = commands.add_parser("backup", help="copy the live database with the online "
+                                                "backup API")
+    backup.add_argument("destination", help="backup file, written once complete")
+    backup.add_argument("--pages", type=int, default=1024,
+                        help="pages copied per step, -1 for a single step (default: 1024)")
+
+    load = commands.add_parser("load", help="load devices from a file, with the API stopped")
+    load.add_argument("path", help="CSV or NDJSON file of devices")
+    load.add_argument("--format", choices=LOAD_FORMATS,
+                      help="input format (default: the file extension)")
+    load.add_argument("--rejects", help="file the rejected rows are written to "
+                                        "(default: PATH.rejected.ndjson)")
+    load.add_argument("--batch-size", type=int, default=100_000,
+                      help="rows validated and committed at a time (default: 100000)")
+
+    commands.add_parser("rebuild-stats", help="recompute the device counts per owner, "
+                                              "deployment month and grid cell")
+    commands.add_parser("migrate", help="apply the pending migrations of the schema")
+    arguments = parser.parse_args(argv)
+
+    if settings.storage_backend == "memory":
+        print(f"The devices are stored in memory, not in {arguments.database}: "
+              f"{MEMORY_ALTERNATIVES[arguments.command]}", file=sys.stderr)
+        return 1
+
+    if arguments.command == "export":
+        try:
+            check_format(arguments.format)
+        except ExportFormatUnavailableError as error:
+            print(error, file=sys.stderr)
+            return 1
+        if arguments.output:
+            with open(arguments.output, "wb") as output:
+                asyncio.run(_export(output, arguments.format, arguments.batch_size,
+                                    arguments.database))
+        else:
+            asyncio.run(_export(sys.stdout.buffer, arguments.format, arguments.batch_size,
+                                arguments.database))
+        return 0
+
+    if arguments.command == "load":
+        try:
+            report = load_devices(arguments.path, arguments.format, arguments.rejects,
+                                  arguments.batch_size, arguments.database)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 1
+        print(f"Loaded {report.loaded} of {report.rows} rows in {report.seconds:.1f}s "
+              f"({report.rows_per_second:.0f} rows/s), {report.rejected} rejected",
+              file=sys.stderr)
+        return 0
+
+    if arguments.command == "rebuild-stats":
+        seconds = asyncio.run(_rebuild_stats(arguments.database))
+        print(f"Rebuilt the device statistics in {seconds:.1f}s", file=sys.stderr)
+        return 0
+
+    if arguments.command == "migrate":
+        for applied in setup_database(arguments.database):
+            print(f"Applied migration {applied.version} ({applied.description}) "
+                  f"in {applied.seconds:.3f}s", file=sys.stderr)
+        return 0
+
+    report = backup_database(arguments.destination, arguments.pages, arguments.database)
+    print(f"Copied {report.pages} pages into {', '.join(report.files)} "
+          f"({report.restarts} restarts)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""
+Module containing the application settings.
+
+Every setting can be overridden with an environment variable prefixed with ``EDGEMATRIX_``
+(e.g. ``EDGEMATRIX_POOL_READERS=8``).
+"""
+import os
+from dataclasses import dataclass
+
+ENV_PREFIX = "EDGEMATRIX_"
+
+
+def _env_int(name: str, default: int) -> int:
+    """
+    Reads an integer setting from the environment.
+
+    Parameters:
+    - name (str): The setting name, without the environment prefix.
+    - default (int): The value used when the variable is not set.
+
+    Returns:
+    - int: The configured value.
+    """
+    return int(os.environ.get(ENV_PREFIX + name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    """
+    Reads a decimal setting from the environment.
+
+    Parameters:
+    - name (str): The setting name, without the environment prefix.
+    - default (float): The value used when the variable is not set.
+
+    Returns:
+    - float: The configured value.
+    """
+    return float(os.environ.get(ENV_PREFIX + name, default))
+
+
+def _env_str(name: str, default: str) -> str:
+    """
+    Reads a text setting from the environment.
+
+    Parameters:
+    - name (str): The setting name, without the environment prefix.
+    - default (str): The value used when the variable is not set.
+
+    Returns:
+    - str: The configured value.
+    """
+    return os.environ.get(ENV_PREFIX + name, default)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """
+    Reads a yes/no setting from the environment.
+
+    Parameters:
+    - name (str): The setting name, without the environment prefix.
+    - default (bool): The value used when the variable is not set.
+
+    Returns:
+    - bool: The configured value: true for '1', 'true', 'yes' or 'on', in any case.
+    """
+    value = os.environ.get(ENV_PREFIX + name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Represents the runtime configuration of the application.
+
+    Attributes:
+    - database_path (str): Path of the SQLite database file.
+    - shard_count (int): Number of files the devices are split into, 1 to keep a single
+      database file (see `app.database.sharding`).
+    - shard_key (str): How devices are assigned to shards: 'letter' (by UUID letter) or
+      'hash' (evenly, by UUID serial).
+    - pool_readers (int): Number of read-only connections kept open per database.
+    - statement_cache_size (int): Number of prepared statements cached per connection.
+    - cache_size_kib (int): Page cache size of each connection, in KiB.
+    - mmap_size (int): Maximum number of bytes of the database file mapped in memory.
+    - busy_timeout_ms (int): Time a connection waits on a locked database before failing.
+    - cache_max_entries (int): Maximum number of devices kept in the device cache
+      (0 disables the cache).
+    - cache_max_bytes (int): Approximate memory budget of the device cache.
+    - cache_ttl_seconds (float): Time a cached device is served before being read again.
+    - cache_negative_ttl_seconds (float): Time a cached absence of device is served.
+    - writer_batch_size (int): Maximum number of write operations committed together.
+    - writer_max_latency_ms (float): Time the writer waits for more write operations
+      before committing a batch that is not full.
+    - writer_queue_size (int): Maximum number of write operations waiting to be executed.
+    - change_feed_history (int): Number of recent device changes kept for the change feed
+      subscribers to resume from.
+    - change_feed_buffer (int): Number of device changes buffered per change feed
+      subscriber before it is dropped and has to resume.
+    - history_full_resolution_days (float): Age up to which every version of a device is
+      kept in its history.
+    - history_bucket_hours (float): Period of which a single version, the last, is kept for
+      older history.
+    - history_retention_days (float): Age after which versions are deleted, except the
+      current version of existing devices.
+    - history_compaction_interval_seconds (float): Time between two compactions of the
+      device history (0 disables them).
+    - storage_maintenance_interval_seconds (float): Time between two deletions of the
+      unreferenced coordinates, each followed by the release of the free pages (0 disables
+      them).
+    - admission_read_limit (int): Number of device read requests handled concurrently at
+      most (0 disables their admission control).
+    - admission_write_limit (int): Number of device write requests handled concurrently at
+      most (0 disables their admission control).
+    - admission_queue_size (int): Number of device requests of each kind waiting for
+      their turn at most, beyond which they are rejected.
+    - admission_deadline_ms (float): Time a device request may wait for its turn, beyond
+      which, or when the wait is expected to exceed it, it is rejected.
+    - admission_adaptive (bool): Whether the limits are tuned from the latency of the
+      admitted requests, never exceeding the configured ones.
+    - admission_target_latency_ms (float): Latency of the admitted requests the adaptive
+      limits aim at.
+    - warmup (bool): Whether the tables and indexes of the devices are read into the page
+      cache and the hot devices preloaded after startup, the application reporting ready
+      only once done.
+    - warmup_devices (int): Number of most recently used devices saved at shutdown and
+      preloaded into the device cache by the next warm-up (0 disables it).
+    - slow_request_ms (float): Duration above which a sampled request has its stack
+      captured (0 disables the profiling).
+    - slow_request_sample_rate (float): Fraction of the requests watched by the profiling.
+    - storage_backend (str): Where the devices are stored: 'sqlite' (in the database file)
+      or 'memory' (in memory, persisted to snapshot and log files next to it).
+    - memory_snapshot_interval_seconds (float): Time between two snapshots of the devices
+      stored in memory, each truncating their log (0 only snapshots them at shutdown).
+    """
+    database_path: str = "/data/devices.db"
+    shard_count: int = 1
+    shard_key: str = "letter"
+    pool_readers: int = 4
+    statement_cache_size: int = 256
+    cache_size_kib: int = 20_000
+    mmap_size: int = 256 * 1024 * 1024
+    busy_timeout_ms: int = 5_000
+    cache_max_entries: int = 100_000
+    cache_max_bytes: int = 64 * 1024 * 1024
+    cache_ttl_seconds: float = 60.0
+    cache_negative_ttl_seconds: float = 5.0
+    writer_batch_size: int = 256
+    writer_max_latency_ms: float = 0.0
+    writer_queue_size: int = 10_000
+    change_feed_history: int = 10_000
+    change_feed_buffer: int = 1_000
+    history_full_resolution_days: float = 7.0
+    history_bucket_hours: float = 24.0
+    history_retention_days: float = 365.0
+    history_compaction_interval_seconds: float = 3600.0
+    storage_maintenance_interval_seconds: float = 3600.0
+    admission_read_limit: int = 256
+    admission_write_limit: int = 256
+    admission_queue_size: int = 1024
+    admission_deadline_ms: float = 1000.0
+    admission_adaptive: bool = False
+    admission_target_latency_ms: float = 50.0
+    warmup: bool = True
+    warmup_devices: int = 10_000
+    slow_request_ms: float = 0.0
+    slow_request_sample_rate: float = 0.01
+    storage_backend: str = "sqlite"
+    memory_snapshot_interval_seconds: float = 300.0
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """
+        Builds the settings from the environment, falling back to the defaults.
+
+        Returns:
+        - Settings: The application settings.
+        """
+        return cls(
+            database_path=_env_str("DATABASE_PATH", cls.database_path),
+            shard_count=_env_int("SHARD_COUNT", cls.shard_count),
+            shard_key=_env_str("SHARD_KEY", cls.shard_key),
+            pool_readers=_env_int("POOL_READERS", cls.pool_readers),
+            statement_cache_size=_env_int("STATEMENT_CACHE_SIZE", cls.statement_cache_size),
+            cache_size_kib=_env_int("CACHE_SIZE_KIB", cls.cache_size_kib),
+            mmap_size=_env_int("MMAP_SIZE", cls.mmap_size),
+            busy_timeout_ms=_env_int("BUSY_TIMEOUT_MS", cls.busy_timeout_ms),
+            cache_max_entries=_env_int("CACHE_MAX_ENTRIES", cls.cache_max_entries),
+            cache_max_bytes=_env_int("CACHE_MAX_BYTES", cls.cache_max_bytes),
+            cache_ttl_seconds=_env_float("CACHE_TTL_SECONDS", cls.cache_ttl_seconds),
+            cache_negative_ttl_seconds=_env_float("CACHE_NEGATIVE_TTL_SECONDS",
+                                                  cls.cache_negative_ttl_seconds),
+            writer_batch_size=_env_int("WRITER_BATCH_SIZE", cls.writer_batch_size),
+            writer_max_latency_ms=_env_float("WRITER_MAX_LATENCY_MS", cls.writer_max_latency_ms),
+            writer_queue_size=_env_int("WRITER_QUEUE_SIZE", cls.writer_queue_size),
+            change_feed_history=_env_int("CHANGE_FEED_HISTORY", cls.change_feed_history),
+            change_feed_buffer=_env_int("CHANGE_FEED_BUFFER", cls.change_feed_buffer),
+            history_full_resolution_days=_env_float("HISTORY_FULL_RESOLUTION_DAYS",
+                                                    cls.history_full_resolution_days),
+            history_bucket_hours=_env_float("HISTORY_BUCKET_HOURS", cls.history_bucket_hours),
+            history_retention_days=_env_float("HISTORY_RETENTION_DAYS",
+                                              cls.history_retention_days),
+            history_compaction_interval_seconds=_env_float(
+                "HISTORY_COMPACTION_INTERVAL_SECONDS", cls.history_compaction_interval_seconds),
+            storage_maintenance_interval_seconds=_env_float(
+                "STORAGE_MAINTENANCE_INTERVAL_SECONDS",
+                cls.storage_maintenance_interval_seconds),
+            admission_read_limit=_env_int("ADMISSION_READ_LIMIT", cls.admission_read_limit),
+            admission_write_limit=_env_int("ADMISSION_WRITE_LIMIT",
+                                           cls.admission_write_limit),
+            admission_queue_size=_env_int("ADMISSION_QUEUE_SIZE", cls.admission_queue_size),
+            admission_deadline_ms=_env_float("ADMISSION_DEADLINE_MS",
+                                             cls.admission_deadline_ms),
+            admission_adaptive=_env_bool("ADMISSION_ADAPTIVE", cls.admission_adaptive),
+            admission_target_latency_ms=_env_float("ADMISSION_TARGET_LATENCY_MS",
+                                                   cls.admission_target_latency_ms),
+            warmup=_env_bool("WARMUP", cls.warmup),
+            warmup_devices=_env_int("WARMUP_DEVICES", cls.warmup_devices),
+            slow_request_ms=_env_float("SLOW_REQUEST_MS", cls.slow_request_ms),
+            slow_request_sample_rate=_env_float("SLOW_REQUEST_SAMPLE_RATE",
+                                                cls.slow_request_sample_rate),
+            storage_backend=_env_str("STORAGE_BACKEND", cls.storage_backend),
+            memory_snapshot_interval_seconds=_env_float(
+                "MEMORY_SNAPSHOT_INTERVAL_SECONDS", cls.memory_snapshot_interval_seconds),
+        )
+
+
+settings = Settings.from_env()
@@ -0,0 +1,234 @@
+"""
+Module containing the interface of the storage backends of the devices.
+
+The device operations of `app.database.operations.devices` store devices in the SQLite
+database, which is the default backend. When another backend is registered for a database,
+with EDGEMATRIX_STORAGE_BACKEND or `set_backend`, each operation is delegated to it
+instead, with the same arguments and results, so that the API behaves the same whatever
+the backend. The backends are responsible for publishing their committed writes to the
+change feed (see `app.database.changes`), and for recording the versions of the devices
+they write, read by `app.database.operations.history` and exported by
+`app.database.export` through them, and for counting them for
+`app.database.operations.stats`.
+
+The backup, the bulk loader, the warm-up and the storage maintenance only apply to the
+SQLite database.
+"""
+from abc import ABC, abstractmethod
+from datetime import date
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from app.config import settings
+from app.models.device import Device, DevicePatch
+from app.database.startup import DATABASE_PATH
+from app.database.spatial import Box
+
+BACKEND_NAMES = ("sqlite", "memory")
+
+
+class StorageBackend(ABC):
+    """
+    Represents a storage backend of the devices.
+
+    Unless stated otherwise, each method behaves as the function of the same name of
+    `app.database.operations.devices`, without its db_name parameter.
+    """
+
+    @abstractmethod
+    async def open(self) -> None:
+        """
+        Makes the stored devices available, e.g. by loading them. Calling it on an open
+        backend does nothing.
+        """
+
+    @abstractmethod
+    async def close(self) -> None:
+        """
+        Persists the stored devices and releases the resources of the backend.
+        """
+
+    @abstractmethod
+    async def create_device(self, device: Device) -> None:
+        """
+        Creates a new device.
+
+        Raises:
+        - DeviceAlreadyExistsError: If a device with the same UUID already exists.
+        """
+
+    @abstractmethod
+    async def get_device(self, device_uuid: str) -> Optional[dict]:
+        """
+        Retrieves a device, or None if it does not exist.
+        """
+
+    @abstractmethod
+    async def get_devices(self, device_uuids: List[str]) -> Dict[str, Optional[dict]]:
+        """
+        Retrieves several devices, None for each UUID without a device.
+        """
+
+    @abstractmethod
+    async def update_device(self, device: Device) -> None:
+        """
+        Replaces an existing device.
+
+        Raises:
+        - DeviceNotFoundError: If no device has this UUID.
+        """
+
+    @abstractmethod
+    async def patch_device(self, device_uuid: str, patch: DevicePatch) -> dict:
+        """
+        Updates the supplied fields of an existing device, and returns it.
+
+        Raises:
+        - DeviceNotFoundError: If no device has this UUID.
+        """
+
+    @abstractmethod
+    async def patch_devices(self, patch: DevicePatch, owner: Optional[str],
+                            deployed_from: Optional[date], deployed_to: Optional[date],
+                            prefix: Optional[str]) -> int:
+        """
+        Applies a patch to every device matching the filters, and returns their number.
+        """
+
+    @abstractmethod
+    async def delete_device(self, device_uuid: str) -> None:
+        """
+        Deletes a device.
+
+        Raises:
+        - DeviceNotFoundError: If no device has this UUID.
+        """
+
+    @abstractmethod
+    async def create_devices(self, device_list: List[Device]) -> Dict[str, bool]:
+        """
+        Creates several devices, and returns whether each UUID was created.
+        """
+
+    @abstractmethod
+    async def list_devices(self, limit: int, after: Optional[str], owner: Optional[str],
+                           deployed_from: Optional[date], deployed_to: Optional[date],
+                           prefix: Optional[str]) -> List[dict]:
+        """
+        Retrieves a page of devices ordered by UUID.
+        """
+
+    @abstractmethod
+    async def find_devices_in_boxes(self, boxes: List[Box], limit: Optional[int]
+                                    ) -> List[dict]:
+        """
+        Retrieves the devices located in a set of bounding boxes, at most limit of them
+        unless it is None.
+        """
+
+    @abstractmethod
+    async def get_device_history(self, device_uuid: str, start: Optional[int],
+                                 end: Optional[int], limit: int) -> Optional[List[dict]]:
+        """
+        Retrieves the versions of a device recorded within a time range, oldest first, or
+        None if the device has no history at all. See
+        `app.database.operations.history.get_device_history`.
+        """
+
+    @abstractmethod
+    async def compact_history(self, downsample_before: int, bucket_ms: int,
+                              expire_before: int) -> Tuple[int, int]:
+        """
+        Downsamples and expires the old versions of the device history, and returns the
+        number of downsampled and expired versions. See
+        `app.database.operations.history.compact_history`.
+        """
+
+    @abstractmethod
+    def iter_batches(self, batch_size: int) -> AsyncIterator[List[tuple]]:
+        """
+        Iterates over every device of a consistent snapshot, in batches of (UUID, latitude,
+        longitude, deployment date, owner) tuples. See `app.database.export.iter_batches`.
+        """
+
+    @abstractmethod
+    async def count_devices_by_owner(self) -> Dict[str, int]:
+        """
+        Returns the number of devices of each owner with a device.
+        """
+
+    @abstractmethod
+    async def count_devices_by_deployment_month(self) -> Dict[str, int]:
+        """
+        Returns the number of devices deployed each month, in the format YYYY-MM, with the
+        devices without a deployment date under ''.
+        """
+
+    @abstractmethod
+    async def count_devices_by_grid_cell(self, precision: int) -> Dict[Tuple[int, int], int]:
+        """
+        Returns the number of devices in each grid cell of a precision with a device, keyed
+        by the cell of `app.database.operations.stats.grid_cell`.
+        """
+
+    @abstractmethod
+    async def rebuild_device_counts(self) -> None:
+        """
+        Recomputes the device counts from the devices.
+        """
+
+
+_BACKENDS: Dict[str, StorageBackend] = {}
+
+
+def get_backend(db_name: str = DATABASE_PATH) -> Optional[StorageBackend]:
+    """
+    Returns the backend the devices of a database are delegated to.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - StorageBackend or None: The backend, None if the devices are stored in SQLite.
+    """
+    return _BACKENDS.get(db_name)
+
+
+def set_backend(db_name: str, backend: Optional[StorageBackend]) -> None:
+    """
+    Registers the backend the devices of a database are delegated to.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file.
+    - backend (StorageBackend, optional): The backend, None to store the devices in SQLite.
+    """
+    if backend is None:
+        _BACKENDS.pop(db_name, None)
+    else:
+        _BACKENDS[db_name] = backend
+
+
+def configure_backend(name: str = settings.storage_backend,
+                      db_name: str = DATABASE_PATH) -> Optional[StorageBackend]:
+    """
+    Registers the configured backend of a database, unless one is already registered.
+
+    Parameters:
+    - name (str): 'sqlite' or 'memory'. Default is EDGEMATRIX_STORAGE_BACKEND.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - StorageBackend or None: The backend of the database, None if the devices are stored
+      in SQLite.
+
+    Raises:
+    - ValueError: If the backend name is unknown.
+    """
+    if name not in BACKEND_NAMES:
+        raise ValueError(f"The storage backend must be one of {', '.join(BACKEND_NAMES)}, "
+                         f"not {name!r}")
+    backend = get_backend(db_name)
+    if backend is None and name == "memory":
+        # Imported here, as the memory engine implements the interface of this module
+        from app.database.memory import MemoryEngine
+        backend = MemoryEngine(db_name)
+        set_backend(db_name, backend)
+    return backend
@@ -0,0 +1,124 @@
+"""
+Module containing the hot backup of the database.
+
+Each shard is copied with SQLite's online backup API, a number of pages at a time. Between
+steps, the source is not locked at all, and in WAL mode a step only holds a read
+transaction, so the API keeps serving reads and writes during the backup. When the source
+is written by another connection between two steps, SQLite restarts the copy so that the
+backup is always a consistent snapshot. To make sure a busy database is eventually backed
+up, the copy falls back to a single step, i.e. a single read snapshot, after a few
+restarts.
+
+The copy is written next to its destination and renamed once complete, so that the
+destination never holds a partial backup.
+"""
+import logging
+import os
+import sqlite3
+from dataclasses import dataclass, field
+from typing import List
+from app.database.startup import DATABASE_PATH
+from app.database.sharding import get_layout, shard_path, shards
+
+logger = logging.getLogger(__name__)
+
+# Number of restarts of an incremental copy after which it is done in a single step
+MAX_BACKUP_RESTARTS = 3
+
+
+class _TooManyRestarts(Exception):
+    """
+    Raised by the progress callback to stop an incremental copy that keeps restarting.
+    """
+
+
+@dataclass
+class BackupReport:
+    """
+    Represents the outcome of a backup.
+
+    Attributes:
+    - files (list[str]): The backup files written, one per shard.
+    - pages (int): The number of database pages copied.
+    - restarts (int): The number of times a copy restarted because the source changed.
+    """
+    files: List[str] = field(default_factory=list)
+    pages: int = 0
+    restarts: int = 0
+
+
+def _copy(source: sqlite3.Connection, target_name: str, pages: int, report: BackupReport,
+          max_restarts: int) -> int:
+    """
+    Copies a database into a file with the online backup API.
+
+    Parameters:
+    - source (sqlite3.Connection): The connection to the database to copy.
+    - target_name (str): The name of the file to write.
+    - pages (int): The number of pages copied per step, or -1 to copy in a single step.
+    - report (BackupReport): The report, whose restart count is updated.
+    - max_restarts (int): The number of restarts after which the copy is stopped.
+
+    Returns:
+    - int: The number of pages of the copied database.
+
+    Raises:
+    - _TooManyRestarts: If the source changed more than max_restarts times.
+    """
+    remaining_pages = None
+    restarts = 0
+    total_pages = 0
+
+    def progress(_status: int, remaining: int, total: int) -> None:
+        nonlocal remaining_pages, restarts, total_pages
+        if remaining_pages is not None and remaining > remaining_pages:
+            restarts += 1
+            report.restarts += 1
+            if restarts > max_restarts:
+                raise _TooManyRestarts()
+        remaining_pages = remaining
+        total_pages = total
+
+    target = sqlite3.connect(target_name)
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    finally:
+        target.close()
+    return total_pages
+
+
+def backup_database(destination: str, pages: int = 1024, db_name: str = DATABASE_PATH,
+                    max_restarts: int = MAX_BACKUP_RESTARTS) -> BackupReport:
+    """
+    Copies every shard of a live database into backup files.
+
+    Parameters:
+    - destination (str): The name of the backup file. The shards of a sharded database are
+      written as its shards, e.g. backup-00.db, backup-01.db and so on.
+    - pages (int): The number of pages copied per step, or -1 to copy each shard in a
+      single step.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+    - max_restarts (int): The number of restarts of an incremental copy after which the
+      shard is copied in a single step.
+
+    Returns:
+    - BackupReport: The backup files and the number of copied pages.
+    """
+    report = BackupReport()
+    count = get_layout(db_name).count
+    for index, shard in enumerate(shards(db_name)):
+        target_name = shard_path(destination, index, count)
+        partial_name = f"{target_name}.partial"
+        source = sqlite3.connect(f"file:{shard}?mode=ro", uri=True)
+        try:
+            try:
+                report.pages += _copy(source, partial_name, pages, report, max_restarts)
+            except _TooManyRestarts:
+                logger.warning("The backup of %s restarted %d times, copying it in a single "
+                               "step", shard, max_restarts)
+                report.pages += _copy(source, partial_name, -1, report, max_restarts)
+        finally:
+            source.close()
+        os.replace(partial_name, target_name)
+        report.files.append(target_name)
+    return report
@@ -0,0 +1,278 @@
+"""
+Module containing the in-process cache of device records.
+
+The cache sits in front of `get_device`: records are stored on read, replaced or dropped
+by the write operations, and lookups of missing devices are cached as well so that
+repeated probes of unknown UUIDs do not reach the database.
+"""
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+from app.database.startup import DATABASE_PATH
+
+# Number of recently written keys remembered to detect fills racing with a write
+_WRITE_LOG_SIZE = 4096
+
+
+@dataclass
+class CacheStats:
+    """
+    Represents the counters of a device cache.
+
+    Attributes:
+    - hits (int): Lookups answered with a cached device.
+    - negative_hits (int): Lookups answered with a cached absence.
+    - misses (int): Lookups that had to query the database.
+    - evictions (int): Entries dropped to respect the entry or memory budget.
+    - expirations (int): Entries dropped because their time to live elapsed.
+    - stale_fills (int): Database reads not cached because a write happened meanwhile.
+    - entries (int): Number of entries currently cached.
+    - bytes (int): Approximate memory used by the cached entries.
+    """
+    hits: int = 0
+    negative_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    stale_fills: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+
+def _estimate_size(key: str, value: Optional[dict]) -> int:
+    """
+    Estimates the memory used by a cache entry.
+
+    Parameters:
+    - key (str): The device UUID.
+    - value (dict, optional): The device record, or None for a cached absence.
+
+    Returns:
+    - int: The approximate size in bytes.
+    """
+    size = sys.getsizeof(key) + 64  # The key and the entry bookkeeping
+    if value is not None:
+        size += sys.getsizeof(value)
+        for item in value.values():
+            size += sys.getsizeof(item)
+            if isinstance(item, dict):
+                size += sum(sys.getsizeof(nested) for nested in item.values())
+    return size
+
+
+class DeviceCache:
+    """
+    Represents an LRU cache of device records with a time to live and a memory budget.
+
+    Cached records are shared between callers and must not be mutated.
+    """
+    MISSING = object()
+
+    def __init__(self, max_entries: int = settings.cache_max_entries,
+                 max_bytes: int = settings.cache_max_bytes,
+                 ttl_seconds: float = settings.cache_ttl_seconds,
+                 negative_ttl_seconds: float = settings.cache_negative_ttl_seconds):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, int, Optional[dict]]]" = OrderedDict()
+        self._write_seq = 0
+        self._write_log: "OrderedDict[str, int]" = OrderedDict()
+        self._write_floor = 0
+        self.stats = CacheStats()
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether the cache stores anything.
+        """
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, device_uuid: str) -> Any:
+        """
+        Looks up a device.
+
+        Parameters:
+        - device_uuid (str): The UUID of the device.
+
+        Returns:
+        - The cached record, None for a cached absence, or DeviceCache.MISSING on a miss.
+        """
+        entry = self._entries.get(device_uuid)
+        if entry is None:
+            self.stats.misses += 1
+            return self.MISSING
+        expires_at, _, value = entry
+        if expires_at < time.monotonic():
+            self._remove(device_uuid)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return self.MISSING
+        self._entries.move_to_end(device_uuid)
+        if value is None:
+            self.stats.negative_hits += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    def read_token(self) -> int:
+        """
+        Returns a token to take before reading a device from the database.
+
+        Passing it to `fill` prevents caching a record read before a concurrent write.
+
+        Returns:
+        - int: The token.
+        """
+        return self._write_seq
+
+    def fill(self, device_uuid: str, value: Optional[dict], token: int) -> None:
+        """
+        Caches a record read from the database, unless it was written since the read began.
+
+        Parameters:
+        - device_uuid (str): The UUID of the device.
+        - value (dict, optional): The device record, or None if the device does not exist.
+        - token (int): The token returned by `read_token` before the read.
+        """
+        if self._write_log.get(device_uuid, self._write_floor) > token:
+            self.stats.stale_fills += 1
+            return
+        self._store(device_uuid, value)
+
+    def write(self, device_uuid: str, value: Optional[dict]) -> None:
+        """
+        Records the committed state of a device.
+
+        Parameters:
+        - device_uuid (str): The UUID of the device.
+        - value (dict, optional): The device record, or None if the device was deleted.
+        """
+        self._log_write(device_uuid)
+        self._store(device_uuid, value)
+
+    def invalidate(self, device_uuid: str) -> None:
+        """
+        Drops the cached state of a device after it was written.
+
+        Parameters:
+        - device_uuid (str): The UUID of the device.
+        """
+        self._log_write(device_uuid)
+        if device_uuid in self._entries:
+            self._remove(device_uuid)
+
+    def hot_keys(self, limit: int) -> List[str]:
+        """
+        Returns the most recently used devices, e.g. to preload them after a restart.
+
+        Parameters:
+        - limit (int): The maximum number of devices returned.
+
+        Returns:
+        - list[str]: The UUIDs of the cached devices, cached absences excluded, the most
+          recently used first.
+        """
+        hot = []
+        for device_uuid in reversed(self._entries):
+            if len(hot) >= limit:
+                break
+            if self._entries[device_uuid][2] is not None:
+                hot.append(device_uuid)
+        return hot
+
+    def clear(self) -> None:
+        """
+        Drops every cached entry.
+        """
+        self._write_seq += 1
+        self._write_floor = self._write_seq
+        self._write_log.clear()
+        self._entries.clear()
+        self.stats.entries = 0
+        self.stats.bytes = 0
+
+    def _log_write(self, device_uuid: str) -> None:
+        """
+        Remembers that a device was written, to reject fills that began before.
+
+        Parameters:
+        - device_uuid (str): The UUID of the device.
+        """
+        self._write_seq += 1
+        self._write_log[device_uuid] = self._write_seq
+        self._write_log.move_to_end(device_uuid)
+        if len(self._write_log) > _WRITE_LOG_SIZE:
+            _, self._write_floor = self._write_log.popitem(last=False)
+
+    def _store(self, device_uuid: str, value: Optional[dict]) -> None:
+        """
+        Stores an entry and evicts the least recently used ones beyond the budget.
+
+        Parameters:
+        - device_uuid (str): The UUID of the device.
+        - value (dict, optional): The device record, or None for a cached absence.
+        """
+        if not self.enabled:
+            return
+        if device_uuid in self._entries:
+            self._remove(device_uuid)
+        ttl = self.ttl_seconds if value is not None else self.negative_ttl_seconds
+        size = _estimate_size(device_uuid, value)
+        self._entries[device_uuid] = (time.monotonic() + ttl, size, value)
+        self.stats.entries += 1
+        self.stats.bytes += size
+        while self.stats.entries > self.max_entries or self.stats.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+    def _remove(self, device_uuid: str) -> None:
+        """
+        Removes an entry.
+
+        Parameters:
+        - device_uuid (str): The UUID of the device.
+        """
+        _, size, _ = self._entries.pop(device_uuid)
+        self.stats.entries -= 1
+        self.stats.bytes -= size
+
+
+_CACHES: Dict[str, DeviceCache] = {}
+
+
+def get_cache(db_name: str = DATABASE_PATH) -> DeviceCache:
+    """
+    Returns the device cache of a database, creating it on first use.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - DeviceCache: The cache of the database.
+    """
+    cache = _CACHES.get(db_name)
+    if cache is None:
+        cache = _CACHES[db_name] = DeviceCache()
+    return cache
+
+
+def clear_caches() -> None:
+    """
+    Drops every device cache, e.g. when the application shuts down.
+    """
+    _CACHES.clear()
+
+
+def cache_stats() -> List[dict]:
+    """
+    Returns the counters of every device cache.
+
+    Returns:
+    - list[dict]: The counters of each cache.
+    """
+    return [{"database": db_name, **asdict(cache.stats)} for db_name, cache in _CACHES.items()]
@@ -0,0 +1,279 @@
+"""
+Module containing the in-process feed of device changes.
+
+The write operations publish an event once a device creation, update or deletion is
+committed. Each event carries a sequence number, increasing by one per event, and the
+recent events are kept so that a subscriber can resume after the last sequence it
+received. The numbering starts from the clock, in microseconds, when the feed is created,
+so that sequences keep increasing across restarts: resuming from a sequence of an earlier
+process is detected and answered with a reset event, since the events in between are lost.
+
+Each subscriber has a bounded buffer. A subscriber that does not keep up is dropped from
+the feed when its buffer is full, and resumes from the kept events once it has consumed
+its buffer; if the events it missed are no longer kept, it receives a reset event instead.
+"""
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+from app.config import settings
+from app.database.startup import DATABASE_PATH
+
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+RESET = "reset"
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """
+    Represents a committed change of a device, or a reset of the feed.
+
+    Attributes:
+    - sequence (int): The sequence number of the event.
+    - type (str): 'created', 'updated', 'deleted', or 'reset' when events were lost and
+      the subscriber must read the devices again.
+    - device_uuid (str, optional): The UUID of the changed device.
+    - device (dict, optional): The device after the change, None when it was deleted.
+    - owner (str, optional): The owner of the device after the change, or when it was
+      deleted.
+    - previous_owner (str, optional): The owner of the device before an update.
+    """
+    sequence: int
+    type: str
+    device_uuid: Optional[str] = None
+    device: Optional[dict] = None
+    owner: Optional[str] = None
+    previous_owner: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        """
+        Builds the message of the event sent to the subscribers.
+
+        Returns:
+        - dict: The sequence, type, device UUID and device, and the previous owner of an
+          update.
+        """
+        message = {"sequence": self.sequence, "type": self.type}
+        if self.type != RESET:
+            message["device_uuid"] = self.device_uuid
+            message["device"] = self.device
+        if self.type == UPDATED:
+            message["previous_owner"] = self.previous_owner
+        return message
+
+
+class Subscription:
+    """
+    Represents a subscriber of the change feed, with its filters and its buffer.
+
+    Attributes:
+    - owner (str, optional): Only the changes of the devices of this owner are received,
+      including updates giving a device to, or taking it from, this owner.
+    - prefix (str, optional): Only the changes of the devices whose UUID starts with this
+      prefix are received.
+    - last_sequence (int): The sequence of the last event received.
+    """
+
+    def __init__(self, feed: "ChangeFeed", owner: Optional[str], prefix: Optional[str],
+                 after: int, buffer_size: int):
+        self.feed = feed
+        self.owner = owner
+        self.prefix = prefix
+        self.last_sequence = after
+        self.buffer_size = max(1, buffer_size)
+        self._buffer: Deque[ChangeEvent] = deque()
+        self._wakeup = asyncio.Event()
+        self._dropped = False
+
+    def matches(self, event: ChangeEvent) -> bool:
+        """
+        Tells whether an event passes the filters of the subscriber.
+
+        Parameters:
+        - event (ChangeEvent): The event.
+
+        Returns:
+        - bool: Whether the subscriber receives the event.
+        """
+        if self.prefix is not None and not event.device_uuid.startswith(self.prefix):
+            return False
+        return self.owner is None or self.owner in (event.owner, event.previous_owner)
+
+    def push(self, event: ChangeEvent) -> None:
+        """
+        Buffers an event, or drops the subscriber from the feed if its buffer is full.
+
+        Parameters:
+        - event (ChangeEvent): The published event.
+        """
+        if len(self._buffer) >= self.buffer_size:
+            self._dropped = True
+            self.feed.unsubscribe(self)
+        else:
+            self._buffer.append(event)
+        self._wakeup.set()
+
+    async def next_event(self, timeout: Optional[float] = None) -> Optional[ChangeEvent]:
+        """
+        Waits for the next event, resuming from the kept events if the subscriber was dropped.
+
+        Parameters:
+        - timeout (float, optional): The time to wait for an event, in seconds.
+
+        Returns:
+        - ChangeEvent or None: The event, or None if none arrived in time.
+        """
+        while not self._buffer:
+            if self._dropped:
+                self._dropped = False
+                self.feed.resume(self)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        event = self._buffer.popleft()
+        self.last_sequence = event.sequence
+        return event
+
+    def replay(self, events: List[ChangeEvent]) -> None:
+        """
+        Buffers the events replayed on subscription or resumption, whatever the buffer size.
+
+        Parameters:
+        - events (list[ChangeEvent]): The events, in sequence order.
+        """
+        self._buffer.extend(events)
+        self._wakeup.set()
+
+    def close(self) -> None:
+        """
+        Stops the subscription.
+        """
+        self.feed.unsubscribe(self)
+
+
+class ChangeFeed:
+    """
+    Represents the publisher of the device changes of a database.
+
+    Attributes:
+    - history_size (int): The number of recent events kept for subscribers to resume from.
+    - buffer_size (int): The number of events buffered per subscriber.
+    """
+
+    def __init__(self, history_size: int = settings.change_feed_history,
+                 buffer_size: int = settings.change_feed_buffer):
+        self.history_size = history_size
+        self.buffer_size = buffer_size
+        self._sequence = time.time_ns() // 1000
+        self._history: Deque[ChangeEvent] = deque(maxlen=max(1, history_size))
+        self._subscriptions: Dict[int, Subscription] = {}
+
+    @property
+    def sequence(self) -> int:
+        """
+        The sequence of the last published event.
+        """
+        return self._sequence
+
+    def publish(self, event_type: str, device_uuid: str, device: Optional[dict],
+                owner: Optional[str], previous_owner: Optional[str] = None) -> None:
+        """
+        Publishes a committed change.
+
+        Parameters:
+        - event_type (str): 'created', 'updated' or 'deleted'.
+        - device_uuid (str): The UUID of the device.
+        - device (dict, optional): The device after the change, None when it was deleted.
+          It must not be mutated afterwards.
+        - owner (str, optional): The owner of the device after the change, or when it was
+          deleted.
+        - previous_owner (str, optional): The owner of the device before an update.
+        """
+        self._sequence += 1
+        event = ChangeEvent(self._sequence, event_type, device_uuid, device, owner,
+                            previous_owner)
+        self._history.append(event)
+        for subscription in list(self._subscriptions.values()):
+            if subscription.matches(event):
+                subscription.push(event)
+
+    def subscribe(self, owner: Optional[str] = None, prefix: Optional[str] = None,
+                  after: Optional[int] = None) -> Subscription:
+        """
+        Registers a subscriber.
+
+        Parameters:
+        - owner (str, optional): Only the changes of the devices of this owner are received.
+        - prefix (str, optional): Only the changes of the devices whose UUID starts with
+          this prefix are received.
+        - after (int, optional): The sequence of the last event received before, to resume
+          from. Default is to only receive the events published from now on.
+
+        Returns:
+        - Subscription: The subscription.
+        """
+        subscription = Subscription(self, owner, prefix,
+                                    self._sequence if after is None else after,
+                                    self.buffer_size)
+        self.resume(subscription)
+        return subscription
+
+    def resume(self, subscription: Subscription) -> None:
+        """
+        Replays the kept events published after the last one of a subscriber, or a reset
+        event if some of them are lost, and registers it for the next ones.
+
+        Parameters:
+        - subscription (Subscription): The subscriber.
+        """
+        after = subscription.last_sequence
+        oldest = self._history[0].sequence if self._history else self._sequence + 1
+        if after < oldest - 1 or after > self._sequence:
+            subscription.replay([ChangeEvent(self._sequence, RESET)])
+        else:
+            subscription.replay([event for event in self._history
+                                 if event.sequence > after and subscription.matches(event)])
+        self._subscriptions[id(subscription)] = subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Unregisters a subscriber.
+
+        Parameters:
+        - subscription (Subscription): The subscriber.
+        """
+        self._subscriptions.pop(id(subscription), None)
+
+    def subscriber_count(self) -> int:
+        """
+        Returns the number of registered subscribers.
+
+        Returns:
+        - int: The number of subscribers.
+        """
+        return len(self._subscriptions)
+
+
+_FEEDS: Dict[str, ChangeFeed] = {}
+
+
+def get_feed(db_name: str = DATABASE_PATH) -> ChangeFeed:
+    """
+    Returns the change feed of a database, creating it on first use.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - ChangeFeed: The feed of the database.
+    """
+    feed = _FEEDS.get(db_name)
+    if feed is None:
+        feed = _FEEDS[db_name] = ChangeFeed()
+    return feed
@@ -0,0 +1,83 @@
+"""
+Module containing the integer encoding of the device UUIDs.
+
+A device UUID is 'DEV', an uppercase letter and six digits, so it maps one-to-one to an
+integer below 26,000,000: the letter rank times one million plus the digits. Devices are
+keyed by that integer in the database, which stores it in the rowid B-tree itself instead
+of a separate text index, and the integers sort in the same order as the UUIDs.
+"""
+import re
+from typing import Tuple
+
+UUID_PREFIX = "DEV"
+SERIAL_DIGITS = 6
+SERIAL_RANGE = 10 ** SERIAL_DIGITS
+LETTER_COUNT = 26
+MAX_DEVICE_ID = LETTER_COUNT * SERIAL_RANGE - 1
+
+_UUID_PATTERN = re.compile(r'^DEV([A-Z])(\d{6})$')
+_PREFIX_PATTERN = re.compile(r'^(?:D(?:E(?:V(?:([A-Z])(\d{0,6}))?)?)?)?$')
+
+# SQL expressions converting a UUID column to its integer, and back, used by migrations
+UUID_TO_ID_SQL = ("((unicode(substr({column}, 4, 1)) - 65) * 1000000 "
+                  "+ CAST(substr({column}, 5) AS INTEGER))")
+UUID_PATTERN_SQL = "{column} GLOB 'DEV[A-Z][0-9][0-9][0-9][0-9][0-9][0-9]'"
+
+
+def encode_uuid(device_uuid: str) -> int:
+    """
+    Encodes a device UUID as an integer.
+
+    Parameters:
+    - device_uuid (str): The device UUID (e.g., DEVX000001).
+
+    Returns:
+    - int: The device identifier.
+
+    Raises:
+    - ValueError: If the UUID does not follow the device UUID format.
+    """
+    match = _UUID_PATTERN.match(device_uuid)
+    if match is None:
+        raise ValueError(f"Invalid device UUID: {device_uuid!r}")
+    letter, serial = match.groups()
+    return (ord(letter) - ord('A')) * SERIAL_RANGE + int(serial)
+
+
+def decode_uuid(device_id: int) -> str:
+    """
+    Decodes a device identifier back to its UUID.
+
+    Parameters:
+    - device_id (int): The device identifier.
+
+    Returns:
+    - str: The device UUID.
+    """
+    letter, serial = divmod(device_id, SERIAL_RANGE)
+    return f"{UUID_PREFIX}{chr(ord('A') + letter)}{serial:06d}"
+
+
+def prefix_range(prefix: str) -> Tuple[int, int]:
+    """
+    Returns the range of identifiers of the UUIDs starting with a prefix.
+
+    Since identifiers sort like UUIDs, the devices sharing a prefix are a contiguous range
+    of the primary key.
+
+    Parameters:
+    - prefix (str): The beginning of a device UUID (e.g., DEVX00).
+
+    Returns:
+    - tuple[int, int]: The lowest and highest identifiers, both included. The range is
+      empty (low greater than high) if no UUID can start with the prefix.
+    """
+    match = _PREFIX_PATTERN.match(prefix)
+    if match is None:
+        return 1, 0
+    letter, serial = match.groups()
+    if letter is None:
+        return 0, MAX_DEVICE_ID
+    width = SERIAL_RANGE // 10 ** len(serial)
+    low = (ord(letter) - ord('A')) * SERIAL_RANGE + int(serial or 0) * width
+    return low, low + width - 1
@@ -0,0 +1,33 @@
+"""
+Module containing the exceptions raised by the database operations.
+"""
+
+
+class DeviceAlreadyExistsError(Exception):
+    """
+    Raised when creating a device whose UUID is already in the database.
+    """
+
+    def __init__(self, device_uuid: str):
+        super().__init__(f"Device {device_uuid} already exists")
+        self.device_uuid = device_uuid
+
+
+class DeviceNotFoundError(Exception):
+    """
+    Raised when writing to a device whose UUID is not in the database.
+    """
+
+    def __init__(self, device_uuid: str):
+        super().__init__(f"Device {device_uuid} not found")
+        self.device_uuid = device_uuid
+
+
+class ExportFormatUnavailableError(Exception):
+    """
+    Raised when exporting to a columnar format without the optional pyarrow package.
+    """
+
+    def __init__(self, export_format: str):
+        super().__init__(f"The {export_format} export requires the pyarrow package")
+        self.export_format = export_format
@@ -0,0 +1,230 @@
+"""
+Module containing the export of every device from a consistent snapshot.
+
+The export opens its own read-only connection to each shard instead of borrowing pooled
+readers, so that a long export does not starve the API. A read transaction is started on
+every shard before the first device is sent: thanks to WAL, the export then reads the
+devices as they were committed at that moment while writers proceed, and a write that
+commits during the export is either entirely in it or not at all.
+
+Devices are fetched and encoded in fixed-size batches, so memory use does not depend on
+the number of devices. They are exported in UUID order within each shard, the shards one
+after the other, as:
+- 'ndjson': one device per line, as returned by the API;
+- 'csv': a header and one device per line, with flat latitude and longitude columns;
+- 'arrow' and 'parquet': one Arrow IPC stream record batch, or Parquet row group, per
+  batch, with the same columns as the CSV. Both require the optional pyarrow package.
+
+When the devices are stored by another backend (see `app.database.backend`), the batches
+are read from a snapshot it takes, in UUID order.
+"""
+import csv
+import importlib.util
+import io
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Callable, List
+import aiosqlite
+import orjson
+from app.config import settings
+from app.database.startup import DATABASE_PATH
+from app.database.sharding import shards
+from app.database.backend import get_backend
+from app.database.encoding import decode_uuid
+from app.database.exceptions import ExportFormatUnavailableError
+
+# pyarrow is only imported by the columnar exports, as importing it slows the startup down
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+EXPORT_FORMATS = ("ndjson", "csv", "arrow", "parquet")
+COLUMNAR_FORMATS = ("arrow", "parquet")
+COLUMNS = ("device_uuid", "latitude", "longitude", "deployment_date", "owner")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+EXPORT_SELECT = ("SELECT devices.device_id, coordinates.latitude, coordinates.longitude, "
+                 "devices.deployment_date, devices.owner "
+                 "FROM devices INNER JOIN coordinates "
+                 "ON coordinates.id = devices.localisation_id "
+                 "ORDER BY devices.device_id")
+
+Batch = List[tuple]
+
+
+def check_format(export_format: str) -> None:
+    """
+    Checks that an export format can be produced.
+
+    Parameters:
+    - export_format (str): One of EXPORT_FORMATS.
+
+    Raises:
+    - ValueError: If the format is unknown.
+    - ExportFormatUnavailableError: If the format requires pyarrow, which is not installed.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"The export format must be one of {', '.join(EXPORT_FORMATS)}, "
+                         f"not {export_format!r}")
+    if export_format in COLUMNAR_FORMATS and not PYARROW_AVAILABLE:
+        raise ExportFormatUnavailableError(export_format)
+
+
+async def _open_snapshot(db_name: str) -> aiosqlite.Connection:
+    """
+    Opens a read-only connection to a shard and starts its read transaction.
+
+    Parameters:
+    - db_name (str): The name of the shard file.
+
+    Returns:
+    - aiosqlite.Connection: The connection, reading the shard as of now.
+    """
+    database = await aiosqlite.connect(f"file:{db_name}?mode=ro", uri=True,
+                                       isolation_level=None)
+    await database.execute(f"PRAGMA busy_timeout = {settings.busy_timeout_ms}")
+    await database.execute("BEGIN")
+    # The snapshot of a WAL database is taken by the first read of the transaction
+    async with database.execute("SELECT 1 FROM devices LIMIT 1"):
+        pass
+    return database
+
+
+async def iter_batches(batch_size: int = 10_000,
+                       db_name: str = DATABASE_PATH) -> AsyncIterator[Batch]:
+    """
+    Iterates over every device of a consistent snapshot of the database, in batches.
+
+    Parameters:
+    - batch_size (int): The number of devices per batch.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Yields:
+    - list[tuple]: The UUID, latitude, longitude, deployment date and owner of the devices.
+    """
+    backend = get_backend(db_name)
+    if backend is not None:
+        async for batch in backend.iter_batches(batch_size):
+            yield batch
+        return
+
+    async with AsyncExitStack() as stack:
+        snapshots = []
+        for shard in shards(db_name):
+            database = await _open_snapshot(shard)
+            stack.push_async_callback(database.close)
+            snapshots.append(database)
+
+        for database in snapshots:
+            async with database.execute(EXPORT_SELECT) as cursor:
+                while True:
+                    rows = await cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield [(decode_uuid(row[0]), *row[1:]) for row in rows]
+
+
+def _ndjson_encoder() -> Callable[[Batch], bytes]:
+    """
+    Returns the encoder of the batches as NDJSON.
+    """
+    def encode(batch: Batch) -> bytes:
+        return b"".join(orjson.dumps({
+            'device_uuid': device_uuid,
+            'localisation': {'latitude': latitude, 'longitude': longitude},
+            'deployment_date': deployment_date,
+            'owner': owner
+        }) + b"\n" for device_uuid, latitude, longitude, deployment_date, owner in batch)
+    return encode
+
+
+def _csv_encoder() -> Callable[[Batch], bytes]:
+    """
+    Returns the encoder of the batches as CSV, the first batch starting with the header.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(COLUMNS)
+
+    def encode(batch: Batch) -> bytes:
+        writer.writerows(batch)
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+    return encode
+
+
+def _columnar_encoder(export_format: str) -> Callable[[Batch], bytes]:
+    """
+    Returns the encoder of the batches as an Arrow IPC stream or a Parquet file.
+
+    Both are written sequentially, so the bytes of each batch are taken from the buffer
+    as soon as it is written. An empty batch ends the stream, writing its footer.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    schema = pyarrow.schema([("device_uuid", pyarrow.string()),
+                             ("latitude", pyarrow.float64()),
+                             ("longitude", pyarrow.float64()),
+                             ("deployment_date", pyarrow.string()),
+                             ("owner", pyarrow.string())])
+    buffer = io.BytesIO()
+    if export_format == "arrow":
+        writer = pyarrow.ipc.new_stream(buffer, schema)
+    else:
+        writer = pyarrow.parquet.ParquetWriter(buffer, schema)
+
+    def encode(batch: Batch) -> bytes:
+        if batch:
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array(column, type=field.type)
+                 for column, field in zip(zip(*batch), schema)], schema=schema))
+        else:
+            writer.close()
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+    return encode
+
+
+async def export_devices(export_format: str, batch_size: int = 10_000,
+                         db_name: str = DATABASE_PATH) -> AsyncIterator[bytes]:
+    """
+    Exports every device of a consistent snapshot of the database.
+
+    Parameters:
+    - export_format (str): One of EXPORT_FORMATS.
+    - batch_size (int): The number of devices fetched and encoded at a time.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Yields:
+    - bytes: The encoded devices, one chunk per batch.
+
+    Raises:
+    - ValueError: If the format is unknown.
+    - ExportFormatUnavailableError: If the format requires pyarrow, which is not installed.
+    """
+    check_format(export_format)
+    if export_format == "ndjson":
+        encode = _ndjson_encoder()
+    elif export_format == "csv":
+        encode = _csv_encoder()
+    else:
+        encode = _columnar_encoder(export_format)
+
+    empty = True
+    async for batch in iter_batches(batch_size, db_name):
+        empty = False
+        yield encode(batch)
+    if export_format == "csv" and empty:
+        yield encode([])
+    if export_format in COLUMNAR_FORMATS:
+        yield encode([])
@@ -0,0 +1,388 @@
+"""
+Module containing the offline bulk loader of devices.
+
+The loader backfills devices from CSV or NDJSON files straight into the database files,
+without the API. Instead of validating one Pydantic model per row, each batch of rows is
+validated column by column:
+- the UUIDs are checked against `Device.UUID_REGEX_PATTERN` in a single pass, which also
+  routes the valid ones to their shard;
+- the other columns are staged in an in-memory temporary table, where one set-based query
+  checks the `Coordinate` latitude and longitude ranges, parses the deployment dates
+  (YYYY-MM-DD) and checks the owners look like email addresses, then a second one finds,
+  among the rows passing these checks, the UUIDs repeated in the file or already in the
+  database. A row is thus only rejected as a duplicate of a row that is loaded, as with
+  `POST /devices/bulk`.
+
+The coordinates of the valid rows are then deduplicated within the temporary table and
+inserted, and the devices are inserted with a join on them, together with the first
+version of their history. Each batch is committed as one transaction, with the sync
+settings tuned for bulk loading: the database is locked exclusively and not synced on
+commit, so that the loader must run while the API is stopped, and a power loss during the
+load may lose the last batches.
+
+The owner check is lighter than the API's email validation: it only requires a single
+'@' followed by a dotted domain, without spaces.
+
+Rejected rows are written to a side file, one JSON object per line holding the line
+number of the row, the reason of the rejection, and the row as read.
+"""
+import csv
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, TextIO, Tuple
+import orjson
+from app.config import settings
+from app.models.device import Device
+from app.database.startup import DATABASE_PATH, setup_database
+from app.database.sharding import ShardLayout, get_layout, shard_path
+from app.database.encoding import encode_uuid
+from app.database.operations.history import now_ms
+
+LOAD_FORMATS = ("csv", "ndjson")
+COLUMNS = ("device_uuid", "latitude", "longitude", "deployment_date", "owner")
+
+_UUID_PATTERN = re.compile(Device.UUID_REGEX_PATTERN)
+
+# Finds the reason, if any, to reject each staged row on its own values
+COLUMN_REJECTION_SELECT = """
+    SELECT line, reason FROM (
+        SELECT staged.line, CASE
+            WHEN typeof(staged.latitude) NOT IN ('integer', 'real')
+                 OR staged.latitude NOT BETWEEN -90 AND 90
+                THEN 'Latitude must be between -90 and 90 degrees'
+            WHEN typeof(staged.longitude) NOT IN ('integer', 'real')
+                 OR staged.longitude NOT BETWEEN -180 AND 180
+                THEN 'Longitude must be between -180 and 180 degrees'
+            WHEN staged.deployment_date IS NOT NULL
+                 AND date(staged.deployment_date, '+0 days') IS NOT staged.deployment_date
+                THEN 'Invalid deployment date, expected YYYY-MM-DD'
+            WHEN typeof(staged.owner) != 'text' OR staged.owner NOT LIKE '%_@_%._%'
+                 OR staged.owner LIKE '%@%@%' OR instr(staged.owner, ' ') > 0
+                THEN 'Invalid owner email address'
+        END AS reason
+        FROM temp.staged_devices AS staged
+    ) WHERE reason IS NOT NULL
+"""
+
+# Finds the rows, among those not rejected yet, whose UUID is taken by an earlier row or
+# an existing device
+DUPLICATE_REJECTION_SELECT = """
+    SELECT line, reason FROM (
+        SELECT staged.line, CASE
+            WHEN row_number() OVER (PARTITION BY staged.device_id ORDER BY staged.line) > 1
+                THEN 'Duplicated device_uuid'
+            WHEN EXISTS (SELECT 1 FROM devices WHERE devices.device_id = staged.device_id)
+                THEN 'Device already exists'
+        END AS reason
+        FROM temp.staged_devices AS staged
+        WHERE staged.line NOT IN (SELECT line FROM temp.rejected_lines)
+    ) WHERE reason IS NOT NULL
+"""
+
+COORDINATES_INSERT = ("INSERT INTO coordinates (latitude, longitude) "
+                      "SELECT DISTINCT latitude, longitude FROM temp.staged_devices "
+                      "WHERE line NOT IN (SELECT line FROM temp.rejected_lines) "
+                      "ON CONFLICT (latitude, longitude) DO NOTHING")
+
+# Inserting in identifier order appends to the devices table instead of splitting its pages
+STAGED_DEVICES_SELECT = ("SELECT staged.device_id, coordinates.id, staged.deployment_date, "
+                         "staged.owner "
+                         "FROM temp.staged_devices AS staged INNER JOIN coordinates "
+                         "ON coordinates.latitude = staged.latitude "
+                         "AND coordinates.longitude = staged.longitude "
+                         "WHERE staged.line NOT IN (SELECT line FROM temp.rejected_lines) "
+                         "ORDER BY staged.device_id")
+
+
+@dataclass
+class LoadReport:
+    """
+    Represents the outcome of a bulk load.
+
+    Attributes:
+    - rows (int): The number of rows read.
+    - loaded (int): The number of devices inserted.
+    - rejected (int): The number of rows rejected.
+    - seconds (float): The time taken by the load.
+    """
+    rows: int = 0
+    loaded: int = 0
+    rejected: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        """
+        The number of rows read per second.
+        """
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+# A row read from a file: its line number, its values (None if it could not be parsed),
+# and the row as read, written to the side file if it is rejected
+Row = Tuple[int, Optional[tuple], Any]
+
+
+def _read_csv(source: TextIO) -> Iterator[Row]:
+    """
+    Reads the rows of a CSV file whose header names the COLUMNS, in any order.
+
+    Parameters:
+    - source (TextIO): The file.
+
+    Yields:
+    - Row: The rows, numbered from 2, after the header.
+
+    Raises:
+    - ValueError: If the header misses a column.
+    """
+    reader = csv.reader(source)
+    header = next(reader, [])
+    missing = [column for column in COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"The CSV header misses the columns {', '.join(missing)}")
+    positions = [header.index(column) for column in COLUMNS]
+    width = max(positions) + 1
+    for line, fields in enumerate(reader, start=2):
+        if len(fields) < width:
+            yield line, None, fields
+            continue
+        yield line, tuple(fields[position] or None for position in positions), fields
+
+
+def _read_ndjson(source: TextIO) -> Iterator[Row]:
+    """
+    Reads the rows of an NDJSON file of devices, as returned by the API, or with flat
+    latitude and longitude fields.
+
+    Parameters:
+    - source (TextIO): The file.
+
+    Yields:
+    - Row: The rows, numbered from 1. Blank lines are skipped.
+    """
+    for line, text in enumerate(source, start=1):
+        if not text.strip():
+            continue
+        try:
+            record = orjson.loads(text)
+        except orjson.JSONDecodeError:
+            yield line, None, text.rstrip("\n")
+            continue
+        if not isinstance(record, dict):
+            yield line, None, record
+            continue
+        localisation = record.get("localisation")
+        if not isinstance(localisation, dict):
+            localisation = record
+        values = (record.get("device_uuid"), localisation.get("latitude"),
+                  localisation.get("longitude"), record.get("deployment_date"),
+                  record.get("owner"))
+        # Nested values cannot be bound to a statement, and are rejected as text
+        yield line, tuple(value if value is None or isinstance(value, (str, int, float))
+                          else orjson.dumps(value).decode() for value in values), record
+
+
+class _ShardLoader:
+    """
+    Represents the connection and staging tables of the load of a shard.
+    """
+
+    def __init__(self, db_name: str):
+        self.database = sqlite3.connect(db_name, isolation_level=None)
+        self.database.execute(f"PRAGMA busy_timeout = {settings.busy_timeout_ms}")
+        self.database.execute("PRAGMA locking_mode = EXCLUSIVE")
+        self.database.execute("PRAGMA synchronous = OFF")
+        self.database.execute("PRAGMA temp_store = MEMORY")
+        self.database.execute("PRAGMA cache_size = -262144")
+        self.database.execute("CREATE TEMP TABLE staged_devices (line INTEGER PRIMARY KEY, "
+                              "device_id INTEGER, latitude REAL, longitude REAL, "
+                              "deployment_date TEXT, owner TEXT)")
+        self.database.execute("CREATE TEMP TABLE rejected_lines (line INTEGER PRIMARY KEY, "
+                              "reason TEXT)")
+
+    def load(self, rows: List[Tuple[int, tuple]], recorded_at: int) -> List[Tuple[int, str]]:
+        """
+        Validates and inserts a batch of rows, whose UUIDs are valid, within a transaction.
+
+        Parameters:
+        - rows (list[tuple[int, tuple]]): The line numbers and values of the rows, with
+          the device identifier in place of the UUID.
+        - recorded_at (int): The time of the history versions of the devices.
+
+        Returns:
+        - list[tuple[int, str]]: The line numbers and reasons of the rejected rows.
+        """
+        database = self.database
+        database.execute("BEGIN")
+        try:
+            database.executemany("INSERT INTO temp.staged_devices VALUES (?, ?, ?, ?, ?, ?)",
+                                 [(line, *values) for line, values in rows])
+            database.execute(f"INSERT INTO temp.rejected_lines {COLUMN_REJECTION_SELECT}")
+            database.execute(f"INSERT INTO temp.rejected_lines {DUPLICATE_REJECTION_SELECT}")
+            database.execute(COORDINATES_INSERT)
+            database.execute("INSERT INTO devices (device_id, localisation_id, "
+                             f"deployment_date, owner) {STAGED_DEVICES_SELECT}")
+            database.execute("INSERT OR REPLACE INTO device_history (device_id, "
+                             "localisation_id, deployment_date, owner, recorded_at) "
+                             f"SELECT *, ? FROM ({STAGED_DEVICES_SELECT})", (recorded_at,))
+            rejected = database.execute("SELECT line, reason FROM temp.rejected_lines "
+                                        "ORDER BY line").fetchall()
+            database.execute("DELETE FROM temp.staged_devices")
+            database.execute("DELETE FROM temp.rejected_lines")
+            database.execute("COMMIT")
+        except BaseException:
+            database.execute("ROLLBACK")
+            raise
+        return rejected
+
+    def close(self) -> None:
+        """
+        Updates the query planner statistics and closes the connection.
+        """
+        self.database.execute("PRAGMA optimize")
+        self.database.close()
+
+
+def _route(batch: List[Row], layout: ShardLayout
+           ) -> Tuple[Dict[int, List[Tuple[int, tuple]]], List[Tuple[int, str]]]:
+    """
+    Checks the UUIDs of a batch of rows column-wise, and routes the valid rows to their
+    shard.
+
+    Parameters:
+    - batch (list[Row]): The rows.
+    - layout (ShardLayout): The shard layout of the database.
+
+    Returns:
+    - tuple: The line numbers and values of the valid rows of each shard index, with the
+      device identifier in place of the UUID, and the line numbers and reasons of the
+      rejected rows.
+    """
+    uuids = [values[0] if values is not None else None for _line, values, _original in batch]
+    valid = [isinstance(uuid, str) and _UUID_PATTERN.match(uuid) is not None
+             for uuid in uuids]
+    by_shard: Dict[int, List[Tuple[int, tuple]]] = {}
+    rejected: List[Tuple[int, str]] = []
+    for (line, values, _original), uuid, is_valid in zip(batch, uuids, valid):
+        if values is None:
+            rejected.append((line, "Unreadable row"))
+        elif not is_valid:
+            rejected.append((line, "Invalid device_uuid format"))
+        else:
+            device_id = encode_uuid(uuid)
+            by_shard.setdefault(layout.index(device_id), []).append(
+                (line, (device_id, *values[1:])))
+    return by_shard, rejected
+
+
+def _write_rejections(rejects: BinaryIO, batch: List[Row],
+                      rejected: List[Tuple[int, str]]) -> None:
+    """
+    Writes the rejected rows of a batch to the side file, in line order.
+
+    Parameters:
+    - rejects (BinaryIO): The side file.
+    - batch (list[Row]): The rows.
+    - rejected (list[tuple[int, str]]): The line numbers and reasons of the rejected rows.
+    """
+    originals = {line: original for line, _values, original in batch}
+    rejects.write(b"".join(orjson.dumps({"line": line, "reason": reason,
+                                         "row": originals[line]}) + b"\n"
+                           for line, reason in sorted(rejected)))
+
+
+class _DatabaseLoader:
+    """
+    Represents the loads of the shards of a database, each opened on its first row.
+    """
+
+    def __init__(self, db_name: str, layout: ShardLayout):
+        self.db_name = db_name
+        self.layout = layout
+        self.shards: Dict[int, _ShardLoader] = {}
+
+    def load(self, batch: List[Row]) -> Tuple[int, List[Tuple[int, str]]]:
+        """
+        Validates a batch of rows and inserts the valid ones into their shards.
+
+        Parameters:
+        - batch (list[Row]): The rows.
+
+        Returns:
+        - tuple[int, list[tuple[int, str]]]: The number of loaded devices, and the line
+          numbers and reasons of the rejected rows.
+        """
+        by_shard, rejected = _route(batch, self.layout)
+        recorded_at = now_ms()
+        loaded = 0
+        for index, shard_rows in by_shard.items():
+            if index not in self.shards:
+                self.shards[index] = _ShardLoader(shard_path(self.db_name, index,
+                                                             self.layout.count))
+            shard_rejected = self.shards[index].load(shard_rows, recorded_at)
+            loaded += len(shard_rows) - len(shard_rejected)
+            rejected += shard_rejected
+        return loaded, rejected
+
+    def close(self) -> None:
+        """
+        Closes the loads of the shards.
+        """
+        for loader in self.shards.values():
+            loader.close()
+
+
+def load_devices(path: str, load_format: Optional[str] = None,
+                 rejects_path: Optional[str] = None, batch_size: int = 100_000,
+                 db_name: str = DATABASE_PATH) -> LoadReport:
+    """
+    Loads the devices of a CSV or NDJSON file into the database.
+
+    The database is set up first if needed. The API must not be running on it.
+
+    Parameters:
+    - path (str): The file to load.
+    - load_format (str, optional): 'csv' or 'ndjson'. Default is the file extension.
+    - rejects_path (str, optional): The side file of the rejected rows. Default is the
+      file name followed by '.rejected.ndjson'.
+    - batch_size (int): The number of rows validated and committed at a time.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - LoadReport: The number of rows read, loaded and rejected.
+
+    Raises:
+    - ValueError: If the format is unknown, or the CSV header misses a column.
+    """
+    load_format = load_format or Path(path).suffix.lstrip(".").lower()
+    if load_format not in LOAD_FORMATS:
+        raise ValueError(f"The load format must be one of {', '.join(LOAD_FORMATS)}, "
+                         f"not {load_format!r}")
+    rejects_path = rejects_path or f"{path}.rejected.ndjson"
+
+    start = time.perf_counter()
+    loader = _DatabaseLoader(db_name, get_layout(db_name))
+    setup_database(db_name, loader.layout)
+    report = LoadReport()
+    try:
+        with open(path, newline="", encoding="utf-8") as source, \
+                open(rejects_path, "wb") as rejects:
+            rows = _read_csv(source) if load_format == "csv" else _read_ndjson(source)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                loaded, rejected = loader.load(batch)
+                report.rows += len(batch)
+                report.loaded += loaded
+                report.rejected += len(rejected)
+                _write_rejections(rejects, batch, rejected)
+    finally:
+        loader.close()
+    report.seconds = time.perf_counter() - start
+    return report
@@ -0,0 +1,658 @@
+"""
+Module containing the in-memory storage engine of the devices.
+
+The devices are held in a dictionary of compact records keyed by the integer encoding of
+their UUID (see `app.database.encoding`), with a sorted list of the identifiers for the
+listings and UUID prefixes, a sorted list of identifiers per owner, and a grid of one
+degree cells for the spatial searches. The number of devices per deployment month and per
+grid cell of the statistics (see `app.database.operations.stats`) is kept up to date along
+with the indexes. Reads and writes run on the event loop without any I/O beyond the append
+to the log, so they neither wait for a connection nor for the group-commit writer, and the
+device cache is bypassed. Every write records a version of the device in its history,
+with strictly increasing times, as the SQLite backend does.
+
+The devices are persisted to files next to the data path, by default the SQLite database
+file:
+- every write is appended to the log ('<data path>.log'), one JSON entry per line: the
+  [device_id, latitude, longitude, deployment_date, owner, recorded_at] state of a
+  written device and time of its version, or the [device_id] of a deleted one. The log is
+  flushed to the operating system, not synced to disk, so a crash of the application
+  loses no write, unlike a crash of the machine;
+- the snapshot ('<data path>.snapshot') holds the state of every device and its history,
+  in lines of up to SNAPSHOT_CHUNK_SIZE devices or histories. It is written periodically
+  and at shutdown, in a worker thread from the records and versions at the time it
+  starts, which are never changed in place, then synced and swapped in atomically, and
+  the log is cut down to the entries written since.
+
+On startup the snapshot is loaded, then the log replayed over it. Since entries hold the
+whole state of a device, and versions are only added when more recent than the last one,
+replaying entries already in the snapshot leaves it unchanged. A torn entry at the end of
+the log, left by a crash during a write, is discarded.
+"""
+import asyncio
+import logging
+import math
+import os
+import sys
+import time
+from bisect import bisect_left, insort
+from datetime import date
+from operator import attrgetter
+from typing import (AsyncIterator, BinaryIO, Dict, Hashable, Iterator, List, Optional, Set,
+                    Tuple)
+import orjson
+from app.config import settings
+from app.models.device import Device, DevicePatch
+from app.database.startup import DATABASE_PATH
+from app.database.backend import StorageBackend, get_backend
+from app.database.changes import CREATED, DELETED, UPDATED, get_feed
+from app.database.encoding import MAX_DEVICE_ID, decode_uuid, encode_uuid, prefix_range
+from app.database.exceptions import DeviceAlreadyExistsError, DeviceNotFoundError
+from app.database.migrations import GRID_PRECISIONS
+from app.database.spatial import Box
+from app.database.operations.history import now_ms, version_from_row
+from app.database.operations.stats import grid_cell
+
+logger = logging.getLogger(__name__)
+
+# Number of devices, or device histories, per line of the snapshot
+SNAPSHOT_CHUNK_SIZE = 10_000
+
+# Number of device histories compacted between two yields to the event loop
+COMPACTION_CHUNK_SIZE = 10_000
+
+# Number of records written at once up to which the identifiers of new devices are each
+# inserted in order, rather than appended then sorted with every other identifier
+SORTED_INSERT_MAX_RECORDS = 32
+
+Cell = Tuple[int, int]
+
+# A version of a device: its time, deployment date, owner, latitude and longitude, in the
+# order of the rows read by `app.database.operations.history`
+Version = Tuple[int, Optional[str], str, float, float]
+
+
+class DeviceRecord:
+    """
+    Represents a device stored in memory. Records are replaced, never changed in place.
+
+    Attributes:
+    - device_id (int): The integer encoding of the device UUID.
+    - latitude (float): The latitude of the device.
+    - longitude (float): The longitude of the device.
+    - deployment_date (str, optional): The deployment date, in the format YYYY-MM-DD.
+    - owner (str): The email address of the owner of the device.
+    """
+    __slots__ = ("device_id", "latitude", "longitude", "deployment_date", "owner")
+
+    def __init__(self, device_id: int, latitude: float, longitude: float,
+                 deployment_date: Optional[str], owner: str):
+        self.device_id = device_id
+        self.latitude = latitude
+        self.longitude = longitude
+        # Dates and owners are shared by many devices, so a single copy of each is kept
+        self.deployment_date = (sys.intern(deployment_date) if deployment_date is not None
+                                else None)
+        self.owner = sys.intern(owner)
+
+    @classmethod
+    def from_device(cls, device: Device) -> "DeviceRecord":
+        """
+        Builds the record of a device.
+
+        Parameters:
+        - device (Device): The device.
+
+        Returns:
+        - DeviceRecord: The record.
+        """
+        return cls(encode_uuid(device.device_uuid), device.localisation.latitude,
+                   device.localisation.longitude,
+                   device.deployment_date.isoformat() if device.deployment_date is not None
+                   else None, device.owner)
+
+    def patched(self, patch: DevicePatch) -> "DeviceRecord":
+        """
+        Builds the record of the device once patched.
+
+        Parameters:
+        - patch (DevicePatch): The fields to change.
+
+        Returns:
+        - DeviceRecord: The new record.
+        """
+        latitude, longitude = self.latitude, self.longitude
+        deployment_date, owner = self.deployment_date, self.owner
+        if "localisation" in patch.model_fields_set:
+            latitude, longitude = patch.localisation.latitude, patch.localisation.longitude
+        if "deployment_date" in patch.model_fields_set:
+            deployment_date = (patch.deployment_date.isoformat()
+                               if patch.deployment_date is not None else None)
+        if "owner" in patch.model_fields_set:
+            owner = patch.owner
+        return DeviceRecord(self.device_id, latitude, longitude, deployment_date, owner)
+
+    @property
+    def cell(self) -> Cell:
+        """
+        The grid cell of the device.
+        """
+        return math.floor(self.latitude), math.floor(self.longitude)
+
+    @property
+    def month(self) -> str:
+        """
+        The deployment month of the device, in the format YYYY-MM, '' without a deployment
+        date.
+        """
+        return self.deployment_date[:7] if self.deployment_date is not None else ""
+
+    def entry(self) -> list:
+        """
+        Returns the entry of the record in the log and the snapshot.
+        """
+        return [self.device_id, self.latitude, self.longitude, self.deployment_date,
+                self.owner]
+
+    def to_dict(self) -> dict:
+        """
+        Builds the dictionary of the device, as read back from the SQLite database.
+
+        Returns:
+        - dict: The device information, with a nested 'localisation' dictionary.
+        """
+        return {
+            'device_uuid': decode_uuid(self.device_id),
+            'localisation': {'latitude': self.latitude, 'longitude': self.longitude},
+            'deployment_date': self.deployment_date,
+            'owner': self.owner
+        }
+
+
+class MemoryEngine(StorageBackend):
+    """
+    Represents the in-memory storage engine of the devices of a database.
+
+    Attributes:
+    - db_name (str): The name of the SQLite database file, under which the engine is
+      registered and whose change feed publishes the writes of the devices.
+    - data_path (str): The path next to which the snapshot and the log are written, the
+      database file unless given.
+    - snapshot_path (str): The path of the snapshot.
+    - log_path (str): The path of the log.
+    """
+
+    def __init__(self, db_name: str = DATABASE_PATH, data_path: Optional[str] = None):
+        self.db_name = db_name
+        self.data_path = data_path if data_path is not None else db_name
+        self.snapshot_path = f"{self.data_path}.snapshot"
+        self.log_path = f"{self.data_path}.log"
+        self._records: Dict[int, DeviceRecord] = {}
+        self._ids: List[int] = []
+        self._owners: Dict[str, List[int]] = {}
+        self._cells: Dict[Cell, Set[int]] = {}
+        self._months: Dict[str, int] = {}
+        self._grid: Dict[int, Dict[Cell, int]] = {precision: {}
+                                                  for precision in GRID_PRECISIONS}
+        self._history: Dict[int, List[Version]] = {}
+        self._log: Optional[BinaryIO] = None
+        self._writing: Optional[asyncio.Future] = None
+
+    @property
+    def device_count(self) -> int:
+        """
+        The number of stored devices.
+        """
+        return len(self._records)
+
+    async def open(self) -> None:
+        if self._log is not None:
+            return
+        await asyncio.to_thread(self._load)
+        # pylint: disable-next=consider-using-with
+        self._log = open(self.log_path, "ab")
+
+    async def close(self) -> None:
+        if self._log is None:
+            return
+        await self.snapshot()
+        self._log.close()
+        self._log = None
+        self._records, self._ids, self._owners, self._cells = {}, [], {}, {}
+        self._months, self._history = {}, {}
+        self._grid = {precision: {} for precision in GRID_PRECISIONS}
+
+    def _load(self) -> None:
+        """
+        Loads the snapshot, replays the log over it and indexes the devices. A torn entry
+        at the end of the log is cut off, so that the next entries are appended after the
+        last complete one.
+        """
+        entries: Dict[int, list] = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as snapshot_file:
+                for line in snapshot_file:
+                    chunk = orjson.loads(line)
+                    entries.update((entry[0], entry) for entry in chunk.get("devices", ()))
+                    self._history.update((device_id, [tuple(version) for version in versions])
+                                         for device_id, versions in chunk.get("history", ()))
+        if os.path.exists(self.log_path):
+            complete = 0
+            with open(self.log_path, "rb") as log_file:
+                for line in log_file:
+                    try:
+                        entry = orjson.loads(line) if line.endswith(b"\n") else None
+                    except orjson.JSONDecodeError:
+                        entry = None
+                    if entry is None:
+                        logger.warning("Discarding a torn entry at offset %d of %s",
+                                       complete, self.log_path)
+                        break
+                    complete += len(line)
+                    if len(entry) == 1:
+                        entries.pop(entry[0], None)
+                        continue
+                    entries[entry[0]] = entry[:5]
+                    versions = self._history.setdefault(entry[0], [])
+                    if not versions or entry[5] > versions[-1][0]:
+                        versions.append((entry[5], entry[3], entry[4], entry[1], entry[2]))
+            if complete < os.path.getsize(self.log_path):
+                os.truncate(self.log_path, complete)
+
+        for entry in entries.values():
+            record = DeviceRecord(*entry)
+            self._records[record.device_id] = record
+            self._owners.setdefault(record.owner, []).append(record.device_id)
+            self._cells.setdefault(record.cell, set()).add(record.device_id)
+            self._count(record, 1)
+        self._ids = sorted(self._records)
+        for owner_ids in self._owners.values():
+            owner_ids.sort()
+
+    def _unindex(self, record: DeviceRecord) -> None:
+        """
+        Removes a record from the owner and grid indexes.
+        """
+        owner_ids = self._owners[record.owner]
+        del owner_ids[bisect_left(owner_ids, record.device_id)]
+        if not owner_ids:
+            del self._owners[record.owner]
+        cell_ids = self._cells[record.cell]
+        cell_ids.discard(record.device_id)
+        if not cell_ids:
+            del self._cells[record.cell]
+        self._count(record, -1)
+
+    def _count(self, record: DeviceRecord, delta: int) -> None:
+        """
+        Adds a delta to the deployment month and grid cell counts of a record, dropping the
+        groups left without a device.
+        """
+        groups: List[Tuple[Dict[Hashable, int], Hashable]] = [(self._months, record.month)]
+        groups.extend((cells, grid_cell(record.latitude, record.longitude, precision))
+                      for precision, cells in self._grid.items())
+        for counts, group in groups:
+            devices = counts.get(group, 0) + delta
+            if devices:
+                counts[group] = devices
+            else:
+                del counts[group]
+
+    def _store(self, record: DeviceRecord, sort: bool = True) -> None:
+        """
+        Stores a new or replaced record and indexes it.
+
+        Parameters:
+        - record (DeviceRecord): The record.
+        - sort (bool): Whether the identifier of a new device is inserted in order, or only
+          appended for the caller to sort the identifiers once.
+        """
+        previous = self._records.get(record.device_id)
+        if previous is not None:
+            self._unindex(previous)
+        elif sort:
+            insort(self._ids, record.device_id)
+        else:
+            self._ids.append(record.device_id)
+        self._records[record.device_id] = record
+        insort(self._owners.setdefault(record.owner, []), record.device_id)
+        self._cells.setdefault(record.cell, set()).add(record.device_id)
+        self._count(record, 1)
+
+    def _remove(self, record: DeviceRecord) -> None:
+        """
+        Removes a stored record and its index entries. Its history is kept.
+        """
+        del self._records[record.device_id]
+        del self._ids[bisect_left(self._ids, record.device_id)]
+        self._unindex(record)
+
+    def _append(self, entries: List[list]) -> None:
+        """
+        Appends entries to the log, with a single write, and flushes it.
+
+        Raises:
+        - RuntimeError: If the engine is not open.
+        """
+        if self._log is None:
+            raise RuntimeError(f"The memory engine of {self.db_name} is not open")
+        self._log.write(b"".join(orjson.dumps(entry) + b"\n" for entry in entries))
+        self._log.flush()
+
+    def _write(self, records: List[DeviceRecord]) -> None:
+        """
+        Logs, stores and records a version of a set of new or replaced records.
+
+        The identifiers of new devices are inserted in order, except for the writes of more
+        than SORTED_INSERT_MAX_RECORDS records, which append them, then sort the whole list
+        once as two ordered runs.
+
+        Parameters:
+        - records (list[DeviceRecord]): The records, at most one per device.
+        """
+        recorded_at = now_ms()
+        times = []
+        for record in records:
+            versions = self._history.get(record.device_id)
+            times.append(max(recorded_at, versions[-1][0] + 1) if versions else recorded_at)
+        self._append([record.entry() + [version_time]
+                      for record, version_time in zip(records, times)])
+        bulk = len(records) > SORTED_INSERT_MAX_RECORDS
+        created = False
+        for record, version_time in zip(records, times):
+            created = created or record.device_id not in self._records
+            self._store(record, sort=not bulk)
+            self._history.setdefault(record.device_id, []).append(
+                (version_time, record.deployment_date, record.owner, record.latitude,
+                 record.longitude))
+        if bulk and created:
+            self._ids.sort()
+
+    async def snapshot(self) -> int:
+        """
+        Writes the snapshot of the devices and their history, then cuts the log down to the
+        entries written since it started. A snapshot already being written is waited for
+        first.
+
+        Returns:
+        - int: The number of devices in the snapshot.
+        """
+        while self._writing is not None:
+            await asyncio.shield(self._writing)
+        if self._log is None:
+            return 0
+        records = list(self._records.values())
+        histories = [[device_id, tuple(versions)]
+                     for device_id, versions in self._history.items()]
+        self._log.flush()
+        offset = self._log.tell()
+        self._writing = asyncio.ensure_future(asyncio.to_thread(self._write_snapshot,
+                                                                records, histories))
+        try:
+            # Shielded so that a cancelled snapshot does not leave a thread writing it
+            await asyncio.shield(self._writing)
+        finally:
+            if self._writing.done():
+                self._writing = None
+            else:
+                self._writing.add_done_callback(self._written)
+        self._cut_log(offset)
+        return len(records)
+
+    def _written(self, _future: asyncio.Future) -> None:
+        """
+        Marks the snapshot written once a cancelled snapshot is done.
+        """
+        self._writing = None
+
+    def _write_snapshot(self, records: List[DeviceRecord], histories: List[list]) -> None:
+        """
+        Writes the snapshot of a set of records and histories to a temporary file, syncs
+        it, then swaps it in.
+        """
+        partial_path = f"{self.snapshot_path}.partial"
+        with open(partial_path, "wb") as snapshot_file:
+            for start in range(0, len(records), SNAPSHOT_CHUNK_SIZE):
+                snapshot_file.write(orjson.dumps({"devices": [
+                    record.entry()
+                    for record in records[start:start + SNAPSHOT_CHUNK_SIZE]]}) + b"\n")
+            for start in range(0, len(histories), SNAPSHOT_CHUNK_SIZE):
+                snapshot_file.write(orjson.dumps({
+                    "history": histories[start:start + SNAPSHOT_CHUNK_SIZE]}) + b"\n")
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(partial_path, self.snapshot_path)
+
+    def _cut_log(self, offset: int) -> None:
+        """
+        Replaces the log with its entries written after an offset.
+        """
+        self._log.flush()
+        with open(self.log_path, "rb") as log_file:
+            log_file.seek(offset)
+            tail = log_file.read()
+        partial_path = f"{self.log_path}.partial"
+        with open(partial_path, "wb") as partial_file:
+            partial_file.write(tail)
+        self._log.close()
+        os.replace(partial_path, self.log_path)
+        # pylint: disable-next=consider-using-with
+        self._log = open(self.log_path, "ab")
+
+    def _select(self, after: Optional[str], owner: Optional[str],
+                deployed_from: Optional[date], deployed_to: Optional[date],
+                prefix: Optional[str]) -> Iterator[DeviceRecord]:
+        """
+        Iterates over the records matching the filters of a listing, ordered by identifier.
+        The records must not be written while the iteration is in progress.
+        """
+        low, high = prefix_range(prefix) if prefix is not None else (0, MAX_DEVICE_ID)
+        if after is not None:
+            low = max(low, encode_uuid(after) + 1)
+        ids = self._ids if owner is None else self._owners.get(owner, [])
+        from_date = deployed_from.isoformat() if deployed_from is not None else None
+        to_date = deployed_to.isoformat() if deployed_to is not None else None
+        for index in range(bisect_left(ids, low), len(ids)):
+            if ids[index] > high:
+                return
+            record = self._records[ids[index]]
+            # Like in SQL, devices without a deployment date never match a date filter
+            if from_date is not None and (record.deployment_date is None
+                                          or record.deployment_date < from_date):
+                continue
+            if to_date is not None and (record.deployment_date is None
+                                        or record.deployment_date > to_date):
+                continue
+            yield record
+
+    async def create_device(self, device: Device) -> None:
+        record = DeviceRecord.from_device(device)
+        if record.device_id in self._records:
+            raise DeviceAlreadyExistsError(device.device_uuid)
+        self._write([record])
+        get_feed(self.db_name).publish(CREATED, device.device_uuid, record.to_dict(),
+                                       record.owner)
+
+    async def get_device(self, device_uuid: str) -> Optional[dict]:
+        record = self._records.get(encode_uuid(device_uuid))
+        return record.to_dict() if record is not None else None
+
+    async def get_devices(self, device_uuids: List[str]) -> Dict[str, Optional[dict]]:
+        found: Dict[str, Optional[dict]] = {}
+        for device_uuid in device_uuids:
+            if device_uuid not in found:
+                found[device_uuid] = await self.get_device(device_uuid)
+        return found
+
+    async def update_device(self, device: Device) -> None:
+        record = DeviceRecord.from_device(device)
+        previous = self._records.get(record.device_id)
+        if previous is None:
+            raise DeviceNotFoundError(device.device_uuid)
+        self._write([record])
+        get_feed(self.db_name).publish(UPDATED, device.device_uuid, record.to_dict(),
+                                       record.owner, previous.owner)
+
+    async def patch_device(self, device_uuid: str, patch: DevicePatch) -> dict:
+        previous = self._records.get(encode_uuid(device_uuid))
+        if previous is None:
+            raise DeviceNotFoundError(device_uuid)
+        record = previous.patched(patch)
+        self._write([record])
+        device = record.to_dict()
+        get_feed(self.db_name).publish(UPDATED, device_uuid, device, record.owner,
+                                       previous.owner)
+        return device
+
+    async def patch_devices(self, patch: DevicePatch, owner: Optional[str],
+                            deployed_from: Optional[date], deployed_to: Optional[date],
+                            prefix: Optional[str]) -> int:
+        previous_records = list(self._select(None, owner, deployed_from, deployed_to,
+                                             prefix))
+        records = [previous.patched(patch) for previous in previous_records]
+        self._write(records)
+        feed = get_feed(self.db_name)
+        for previous, record in zip(previous_records, records):
+            device = record.to_dict()
+            feed.publish(UPDATED, device['device_uuid'], device, record.owner,
+                         previous.owner)
+        return len(records)
+
+    async def delete_device(self, device_uuid: str) -> None:
+        previous = self._records.get(encode_uuid(device_uuid))
+        if previous is None:
+            raise DeviceNotFoundError(device_uuid)
+        self._append([[previous.device_id]])
+        self._remove(previous)
+        get_feed(self.db_name).publish(DELETED, device_uuid, None, previous.owner)
+
+    async def create_devices(self, device_list: List[Device]) -> Dict[str, bool]:
+        created: Dict[str, bool] = {}
+        records = []
+        for device in device_list:
+            if device.device_uuid in created:
+                continue
+            record = DeviceRecord.from_device(device)
+            created[device.device_uuid] = record.device_id not in self._records
+            if created[device.device_uuid]:
+                records.append(record)
+        if records:
+            self._write(records)
+            feed = get_feed(self.db_name)
+            for record in records:
+                device = record.to_dict()
+                feed.publish(CREATED, device['device_uuid'], device, record.owner)
+        return created
+
+    async def list_devices(self, limit: int, after: Optional[str], owner: Optional[str],
+                           deployed_from: Optional[date], deployed_to: Optional[date],
+                           prefix: Optional[str]) -> List[dict]:
+        devices = []
+        for record in self._select(after, owner, deployed_from, deployed_to, prefix):
+            if len(devices) == limit:
+                break
+            devices.append(record.to_dict())
+        return devices
+
+    async def find_devices_in_boxes(self, boxes: List[Box], limit: Optional[int]
+                                    ) -> List[dict]:
+        found: List[DeviceRecord] = []
+        for min_latitude, max_latitude, min_longitude, max_longitude in boxes:
+            if limit is not None and len(found) >= limit:
+                break
+            matched = []
+            for latitude_cell in range(math.floor(min_latitude),
+                                       math.floor(max_latitude) + 1):
+                for longitude_cell in range(math.floor(min_longitude),
+                                            math.floor(max_longitude) + 1):
+                    for device_id in self._cells.get((latitude_cell, longitude_cell), ()):
+                        record = self._records[device_id]
+                        if (min_latitude <= record.latitude <= max_latitude
+                                and min_longitude <= record.longitude <= max_longitude):
+                            matched.append(record)
+            matched.sort(key=attrgetter("device_id"))
+            found += matched
+        return [record.to_dict() for record in found[:limit]]
+
+    async def get_device_history(self, device_uuid: str, start: Optional[int],
+                                 end: Optional[int], limit: int) -> Optional[List[dict]]:
+        versions = self._history.get(encode_uuid(device_uuid))
+        if not versions:
+            return None
+        first = bisect_left(versions, (start,)) if start is not None else 0
+        last = bisect_left(versions, (end + 1,)) if end is not None else len(versions)
+        return [version_from_row(version)
+                for version in versions[first:min(last, first + limit)]]
+
+    async def compact_history(self, downsample_before: int, bucket_ms: int,
+                              expire_before: int) -> Tuple[int, int]:
+        downsampled = expired = 0
+        device_ids = list(self._history)
+        for start in range(0, len(device_ids), COMPACTION_CHUNK_SIZE):
+            for device_id in device_ids[start:start + COMPACTION_CHUNK_SIZE]:
+                versions = self._history[device_id]
+                # An old version is dropped when a later one falls in the same bucket
+                kept = [version for index, version in enumerate(versions)
+                        if version[0] >= downsample_before or index + 1 == len(versions)
+                        or versions[index + 1][0] >= (version[0] // bucket_ms + 1)
+                        * bucket_ms]
+                downsampled += len(versions) - len(kept)
+                # The current version of an existing device is kept whatever its age
+                current = kept[-1] if device_id in self._records else None
+                versions = [version for version in kept
+                            if version[0] >= expire_before or version is current]
+                expired += len(kept) - len(versions)
+                if versions:
+                    self._history[device_id] = versions
+                else:
+                    del self._history[device_id]
+            await asyncio.sleep(0)
+        return downsampled, expired
+
+    async def iter_batches(self, batch_size: int) -> AsyncIterator[List[tuple]]:
+        # Records are never changed in place, so the list is a consistent snapshot
+        records = [self._records[device_id] for device_id in self._ids]
+        for start in range(0, len(records), batch_size):
+            yield [(decode_uuid(record.device_id), record.latitude, record.longitude,
+                    record.deployment_date, record.owner)
+                   for record in records[start:start + batch_size]]
+
+    async def count_devices_by_owner(self) -> Dict[str, int]:
+        return {owner: len(owner_ids) for owner, owner_ids in self._owners.items()}
+
+    async def count_devices_by_deployment_month(self) -> Dict[str, int]:
+        return dict(self._months)
+
+    async def count_devices_by_grid_cell(self, precision: int) -> Dict[Tuple[int, int], int]:
+        return dict(self._grid[precision])
+
+    async def rebuild_device_counts(self) -> None:
+        self._months = {}
+        self._grid = {precision: {} for precision in GRID_PRECISIONS}
+        for record in self._records.values():
+            self._count(record, 1)
+
+
+async def run_snapshots(
+        interval_seconds: float = settings.memory_snapshot_interval_seconds,
+        db_name: str = DATABASE_PATH) -> None:
+    """
+    Snapshots the devices stored in memory periodically, until cancelled.
+
+    Parameters:
+    - interval_seconds (float): The time between two snapshots.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        engine = get_backend(db_name)
+        if not isinstance(engine, MemoryEngine):
+            continue
+        start = time.perf_counter()
+        try:
+            devices = await engine.snapshot()
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Failed to snapshot the devices stored in memory")
+            continue
+        logger.info("Snapshotted %d devices stored in memory in %.3fs", devices,
+                    time.perf_counter() - start)
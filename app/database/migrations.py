@@ -0,0 +1,561 @@
+"""
+Module containing the versioned schema migrations of the device database.
+
+The schema version is stored in `PRAGMA user_version`. At startup, every migration whose
+version is greater than the stored one is applied in order, each within its own
+transaction along with the update of the version, except the few steps SQLite cannot run
+in a transaction, such as VACUUM. Steps are idempotent so that databases created before
+versioning (version 0) are upgraded in place.
+"""
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Tuple
+from app.database.encoding import UUID_PATTERN_SQL, UUID_TO_ID_SQL
+
+logger = logging.getLogger(__name__)
+
+# Precisions of the grid cells the devices are counted in: a cell of precision p spans
+# 10^-p degrees of latitude and longitude
+GRID_PRECISIONS = (0, 1, 2)
+
+# The precision and scale of each grid, as a table of a FROM clause
+_GRID_SCALES_SQL = "(VALUES " + ", ".join(f"({precision}, {10 ** precision}.0)"
+                                          for precision in GRID_PRECISIONS) + ") AS grids"
+
+
+def _cell_sql(column: str, scale: str = "grids.column2") -> str:
+    """
+    Returns the SQL expression of the grid cell index of a coordinate, i.e. the floor of
+    the coordinate scaled to the grid, without the floor function that SQLite only has
+    when built with its math functions. The scaled coordinate is rounded first, so that a
+    coordinate on the edge of a cell (e.g. 151.2 scaled to 15119.999999999998) lies in it.
+
+    Parameters:
+    - column (str): The latitude or longitude column.
+    - scale (str): The number of cells per degree. Default is the scale of the grids of
+      _GRID_SCALES_SQL.
+
+    Returns:
+    - str: The expression.
+    """
+    scaled = f"round({column} * {scale}, 6)"
+    return f"(CAST({scaled} AS INTEGER) - ({scaled} < CAST({scaled} AS INTEGER)))"
+
+
+# The cells of a coordinate in every grid
+_CELLS_SELECT = (f"SELECT grids.column1, {_cell_sql('coordinates.latitude')}, "
+                 f"{_cell_sql('coordinates.longitude')} "
+                 f"FROM coordinates, {_GRID_SCALES_SQL} WHERE coordinates.id = {{id}}")
+
+# Month of a deployment date, and '' for the devices without one
+_MONTH_SQL = "coalesce(substr({date}, 1, 7), '')"
+
+# Recompute the device counts from the devices
+DEVICE_COUNTS_REBUILD = (
+    "DELETE FROM device_counts_by_owner",
+    "INSERT INTO device_counts_by_owner (owner, devices) "
+    "SELECT owner, count(*) FROM devices GROUP BY owner",
+    "DELETE FROM device_counts_by_month",
+    f"INSERT INTO device_counts_by_month (month, devices) "
+    f"SELECT {_MONTH_SQL.format(date='deployment_date')}, count(*) FROM devices GROUP BY 1",
+    "DELETE FROM device_counts_by_cell",
+    *(f"INSERT INTO device_counts_by_cell (precision, latitude_cell, longitude_cell, devices) "
+      f"SELECT {precision}, {_cell_sql('coordinates.latitude', f'{10 ** precision}.0')}, "
+      f"{_cell_sql('coordinates.longitude', f'{10 ** precision}.0')}, count(*) "
+      f"FROM devices INNER JOIN coordinates ON coordinates.id = devices.localisation_id "
+      f"GROUP BY 2, 3" for precision in GRID_PRECISIONS),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    """
+    Represents a schema migration step.
+
+    Attributes:
+    - version (int): The schema version reached once the step is applied.
+    - description (str): A short description of the step.
+    - apply (Callable[[sqlite3.Cursor], None]): The function running the step statements.
+    - transactional (bool): Whether the step runs within a transaction. A step that does
+      not is followed by the update of the version, so it must be safe to run again.
+    """
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Cursor], None]
+    transactional: bool = True
+
+
+@dataclass(frozen=True)
+class MigrationReport:
+    """
+    Represents the outcome of an applied migration.
+
+    Attributes:
+    - version (int): The schema version reached.
+    - description (str): The description of the step.
+    - seconds (float): The time taken to apply the step.
+    """
+    version: int
+    description: str
+    seconds: float
+
+
+def _create_tables(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the 'coordinates' and 'devices' tables.
+
+    - The 'coordinates' table stores latitude and longitude values.
+    - The 'devices' table stores device information, including UUID, deployment date, and owner.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): The cursor used to run the statements.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS coordinates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS devices (
+            device_uuid TEXT PRIMARY KEY,
+            localisation_id INTEGER,
+            deployment_date TEXT,
+            owner TEXT NOT NULL,
+            FOREIGN KEY (localisation_id) REFERENCES coordinates(id)
+        )
+    ''')
+
+
+def _index_devices_by_location(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the index of the devices by location, used to join coordinates to devices.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): The cursor used to run the statements.
+    """
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS devices_localisation_id ON devices (localisation_id)
+    ''')
+
+
+def _unique_coordinates(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the unique index of the coordinates by latitude and longitude.
+
+    The index lets writes get or create a coordinate with a single upsert. Duplicated
+    coordinates left by earlier versions are merged before the index is created.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): The cursor used to run the statements.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'coordinates_location'")
+    if cursor.fetchone() is not None:
+        return
+
+    cursor.execute('''
+        CREATE TEMP TABLE duplicate_coordinates (
+            id INTEGER PRIMARY KEY,
+            kept_id INTEGER NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        INSERT INTO temp.duplicate_coordinates
+        SELECT coordinates.id, kept.id
+        FROM coordinates
+        INNER JOIN (
+            SELECT MIN(id) AS id, latitude, longitude FROM coordinates
+            GROUP BY latitude, longitude HAVING COUNT(*) > 1
+        ) AS kept
+        ON kept.latitude = coordinates.latitude AND kept.longitude = coordinates.longitude
+        WHERE coordinates.id != kept.id
+    ''')
+
+    cursor.execute('''
+        UPDATE devices
+        SET localisation_id = (SELECT kept_id FROM temp.duplicate_coordinates
+                               WHERE duplicate_coordinates.id = devices.localisation_id)
+        WHERE localisation_id IN (SELECT id FROM temp.duplicate_coordinates)
+    ''')
+
+    cursor.execute('''
+        DELETE FROM coordinates WHERE id IN (SELECT id FROM temp.duplicate_coordinates)
+    ''')
+
+    cursor.execute("DROP TABLE temp.duplicate_coordinates")
+
+    cursor.execute('''
+        CREATE UNIQUE INDEX coordinates_location ON coordinates (latitude, longitude)
+    ''')
+
+
+def _spatial_index(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the R*Tree spatial index of the coordinates.
+
+    Each coordinate is stored as a degenerate box identified by the coordinate id.
+    Triggers keep the index in sync with the 'coordinates' table, and the existing
+    coordinates are indexed when the index is first created.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): The cursor used to run the statements.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'coordinates_rtree'")
+    created = cursor.fetchone() is None
+
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS coordinates_rtree USING rtree (
+            id,
+            min_latitude, max_latitude,
+            min_longitude, max_longitude
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS coordinates_rtree_insert AFTER INSERT ON coordinates
+        BEGIN
+            INSERT INTO coordinates_rtree
+            VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS coordinates_rtree_update AFTER UPDATE ON coordinates
+        WHEN old.latitude IS NOT new.latitude OR old.longitude IS NOT new.longitude
+        BEGIN
+            UPDATE coordinates_rtree
+            SET min_latitude = new.latitude, max_latitude = new.latitude,
+                min_longitude = new.longitude, max_longitude = new.longitude
+            WHERE id = new.id;
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS coordinates_rtree_delete AFTER DELETE ON coordinates
+        BEGIN
+            DELETE FROM coordinates_rtree WHERE id = old.id;
+        END
+    ''')
+
+    if created:
+        cursor.execute('''
+            INSERT INTO coordinates_rtree
+            SELECT id, latitude, latitude, longitude, longitude FROM coordinates
+        ''')
+
+
+def _index_devices_by_owner_and_date(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the indexes of the devices by owner and by deployment date.
+
+    The owner index also holds the UUID so that listings filtered by owner are read
+    in UUID order straight from the index.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): The cursor used to run the statements.
+    """
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS devices_owner ON devices (owner, device_uuid)
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS devices_deployment_date ON devices (deployment_date)
+    ''')
+
+
+def _key_devices_by_integer(cursor: sqlite3.Cursor) -> None:
+    """
+    Rebuilds the 'devices' table keyed by the integer encoding of the device UUIDs.
+
+    The UUID becomes the `INTEGER PRIMARY KEY` of the table, i.e. its rowid, which removes
+    the separate text index that backed the UUID primary key. Rows whose UUID does not
+    follow the device UUID format cannot be encoded: they are moved as they are to the
+    'unencodable_devices' table instead of being dropped.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): The cursor used to run the statements.
+    """
+    encodable = UUID_PATTERN_SQL.format(column="device_uuid")
+
+    cursor.execute('''
+        CREATE TABLE devices_by_id (
+            device_id INTEGER PRIMARY KEY,
+            localisation_id INTEGER,
+            deployment_date TEXT,
+            owner TEXT NOT NULL,
+            FOREIGN KEY (localisation_id) REFERENCES coordinates(id)
+        )
+    ''')
+
+    cursor.execute(f'''
+        INSERT INTO devices_by_id (device_id, localisation_id, deployment_date, owner)
+        SELECT {UUID_TO_ID_SQL.format(column="device_uuid")},
+               localisation_id, deployment_date, owner
+        FROM devices WHERE {encodable}
+        ORDER BY device_uuid
+    ''')
+
+    cursor.execute(f"SELECT COUNT(*) FROM devices WHERE NOT {encodable}")
+    unencodable = cursor.fetchone()[0]
+    if unencodable:
+        logger.warning("Moving %d devices with an invalid UUID to 'unencodable_devices'",
+                       unencodable)
+        cursor.execute(f'''
+            CREATE TABLE unencodable_devices AS
+            SELECT * FROM devices WHERE NOT {encodable}
+        ''')
+
+    cursor.execute("DROP TABLE devices")
+    cursor.execute("ALTER TABLE devices_by_id RENAME TO devices")
+
+    cursor.execute('''
+        CREATE INDEX devices_localisation_id ON devices (localisation_id)
+    ''')
+
+    # Index entries end with the rowid, i.e. the device identifier, so listings filtered by
+    # owner are still read in UUID order straight from the index
+    cursor.execute('''
+        CREATE INDEX devices_owner ON devices (owner)
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX devices_deployment_date ON devices (deployment_date)
+    ''')
+
+
+def _record_device_history(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the 'device_history' table, holding every version of the devices.
+
+    A version is recorded, with its time in milliseconds since the epoch, each time a
+    device is created or updated. The table is clustered by device and time, without a
+    rowid, so that the history of a device over a time range is a single range scan of
+    the primary key. The current version of the existing devices is recorded as of the
+    migration.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): The cursor used to run the statements.
+    """
+    cursor.execute('''
+        CREATE TABLE device_history (
+            device_id INTEGER NOT NULL,
+            recorded_at INTEGER NOT NULL,
+            localisation_id INTEGER,
+            deployment_date TEXT,
+            owner TEXT NOT NULL,
+            PRIMARY KEY (device_id, recorded_at)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        INSERT INTO device_history (device_id, recorded_at, localisation_id,
+                                    deployment_date, owner)
+        SELECT device_id, ?, localisation_id, deployment_date, owner FROM devices
+    ''', (time.time_ns() // 1_000_000,))
+
+
+def _index_history_by_location(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the index of the device history by location, so that the coordinates still
+    referenced by the history are found when unreferenced coordinates are deleted.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): The cursor used to run the statements.
+    """
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS device_history_localisation_id
+        ON device_history (localisation_id)
+    ''')
+
+
+def _incremental_auto_vacuum(cursor: sqlite3.Cursor) -> None:
+    """
+    Switches the database to incremental auto-vacuum, so that the pages freed by deletions
+    can be returned to the file system with `PRAGMA incremental_vacuum`.
+
+    The mode of an existing database only changes once it is rebuilt, so the database is
+    vacuumed, which takes a while on a large database but only happens once.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): The cursor used to run the statements.
+    """
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    cursor.execute("VACUUM")
+
+
+def _count_devices(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the tables counting the devices per owner, per deployment month and per grid
+    cell of each precision, and the triggers maintaining them within the transaction of
+    every insertion, update and deletion of a device. The counts of the existing devices
+    are computed as of the migration.
+
+    Groups are deleted once they count no device, so that reading every count costs the
+    number of groups rather than the number of devices.
+
+    Parameters:
+    - cursor (sqlite3.Cursor): The cursor used to run the statements.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_counts_by_owner (
+            owner TEXT PRIMARY KEY,
+            devices INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_counts_by_month (
+            month TEXT PRIMARY KEY,
+            devices INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_counts_by_cell (
+            precision INTEGER NOT NULL,
+            latitude_cell INTEGER NOT NULL,
+            longitude_cell INTEGER NOT NULL,
+            devices INTEGER NOT NULL,
+            PRIMARY KEY (precision, latitude_cell, longitude_cell)
+        ) WITHOUT ROWID
+    ''')
+
+    def added(row: str) -> str:
+        """
+        Returns the statements counting the new or old device row in its groups.
+        """
+        month = _MONTH_SQL.format(date=f"{row}.deployment_date")
+        return f'''
+            INSERT INTO device_counts_by_owner (owner, devices) VALUES ({row}.owner, 1)
+            ON CONFLICT (owner) DO UPDATE SET devices = devices + 1;
+            INSERT INTO device_counts_by_month (month, devices) VALUES ({month}, 1)
+            ON CONFLICT (month) DO UPDATE SET devices = devices + 1;
+            INSERT INTO device_counts_by_cell (precision, latitude_cell, longitude_cell,
+                                               devices)
+            SELECT cells.*, 1 FROM ({_CELLS_SELECT.format(id=f"{row}.localisation_id")})
+            AS cells WHERE true
+            ON CONFLICT (precision, latitude_cell, longitude_cell)
+            DO UPDATE SET devices = devices + 1;
+        '''
+
+    def removed(row: str) -> str:
+        """
+        Returns the statements uncounting the old device row from its groups, and deleting
+        the groups left without a device.
+        """
+        month = _MONTH_SQL.format(date=f"{row}.deployment_date")
+        cells = _CELLS_SELECT.format(id=f"{row}.localisation_id")
+        return f'''
+            UPDATE device_counts_by_owner SET devices = devices - 1 WHERE owner = {row}.owner;
+            DELETE FROM device_counts_by_owner WHERE owner = {row}.owner AND devices = 0;
+            UPDATE device_counts_by_month SET devices = devices - 1 WHERE month = {month};
+            DELETE FROM device_counts_by_month WHERE month = {month} AND devices = 0;
+            UPDATE device_counts_by_cell SET devices = devices - 1
+            WHERE (precision, latitude_cell, longitude_cell) IN ({cells});
+            DELETE FROM device_counts_by_cell
+            WHERE (precision, latitude_cell, longitude_cell) IN ({cells}) AND devices = 0;
+        '''
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS device_counts_insert AFTER INSERT ON devices
+        BEGIN {added("new")} END
+    ''')
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS device_counts_update
+        AFTER UPDATE OF owner, deployment_date, localisation_id ON devices
+        WHEN old.owner IS NOT new.owner OR old.deployment_date IS NOT new.deployment_date
+        OR old.localisation_id IS NOT new.localisation_id
+        BEGIN {removed("old")} {added("new")} END
+    ''')
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS device_counts_delete AFTER DELETE ON devices
+        BEGIN {removed("old")} END
+    ''')
+
+    for statement in DEVICE_COUNTS_REBUILD:
+        cursor.execute(statement)
+
+
+MIGRATIONS: Tuple[Migration, ...] = (
+    Migration(1, "Create the coordinates and devices tables", _create_tables),
+    Migration(2, "Index devices by location", _index_devices_by_location),
+    Migration(3, "Merge duplicated coordinates and index them by location",
+              _unique_coordinates),
+    Migration(4, "Create the R*Tree spatial index of the coordinates", _spatial_index),
+    Migration(5, "Index devices by owner and by deployment date",
+              _index_devices_by_owner_and_date),
+    Migration(6, "Key devices by the integer encoding of their UUID", _key_devices_by_integer),
+    Migration(7, "Record the history of the devices", _record_device_history),
+    Migration(8, "Index the device history by location", _index_history_by_location),
+    Migration(9, "Switch to incremental auto-vacuum", _incremental_auto_vacuum,
+              transactional=False),
+    Migration(10, "Count the devices per owner, deployment month and grid cell",
+              _count_devices),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def get_schema_version(database: sqlite3.Connection) -> int:
+    """
+    Reads the schema version of a database.
+
+    Parameters:
+    - database (sqlite3.Connection): The connection to the database.
+
+    Returns:
+    - int: The schema version, 0 for a database created before versioning.
+    """
+    return database.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(database: sqlite3.Connection) -> List[MigrationReport]:
+    """
+    Applies the migrations the database has not reached yet.
+
+    Each step runs in its own immediate transaction, unless it is not transactional. In
+    WAL mode, readers keep being served from the last committed state while an index is
+    built.
+
+    Parameters:
+    - database (sqlite3.Connection): The connection to the database.
+
+    Returns:
+    - list[MigrationReport]: The applied migrations along with their duration.
+    """
+    isolation_level = database.isolation_level
+    database.isolation_level = None
+    reports = []
+    try:
+        cursor = database.cursor()
+        for migration in MIGRATIONS:
+            if migration.version <= get_schema_version(database):
+                continue
+            start = time.perf_counter()
+            if migration.transactional:
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    migration.apply(cursor)
+                    cursor.execute(f"PRAGMA user_version = {migration.version}")
+                except BaseException:
+                    cursor.execute("ROLLBACK")
+                    raise
+                cursor.execute("COMMIT")
+            else:
+                migration.apply(cursor)
+                cursor.execute(f"PRAGMA user_version = {migration.version}")
+            report = MigrationReport(migration.version, migration.description,
+                                     time.perf_counter() - start)
+            logger.info("Applied migration %d (%s) in %.3fs",
+                        report.version, report.description, report.seconds)
+            reports.append(report)
+    finally:
+        database.isolation_level = isolation_level
+    return reports
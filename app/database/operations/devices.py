@@ -1,47 +1,186 @@
 """
 Module containing CRUD operations for devices using an SQLite database.
+
+Connections are borrowed from the database pool: queries use a reader connection,
+single-device writes are submitted to the group-commit writer, which commits concurrent
+writes together, and bulk writes run as a single transaction on the writer connection.
+Single device reads go through the device cache, which the write operations keep up to
+date once committed. Committed writes are also published to the change feed (see
+`app.database.changes`), and creations and updates record a version of the device in its
+history (see `app.database.operations.history`) within the same transaction.
+
+Devices are keyed in the database by the integer encoding of their UUID (see
+`app.database.encoding`): UUIDs are encoded when bound to a statement and decoded when
+read back, so the rest of the application only deals with UUIDs.
+
+When the database is split into shards (see `app.database.sharding`), operations on a
+single device go to the pool of its shard, operations on several devices run on each of
+their shards concurrently, and listings and spatial searches query every shard
+concurrently and merge the results. The device cache stays shared by every shard.
+
+Every statement is timed into the SQL_STATEMENT_SECONDS histogram, labeled by operation.
+
+SQLite is the default storage backend of the devices: when another backend is registered
+for the database (see `app.database.backend`), the operations are delegated to it.
 """
-from typing import Optional
+import asyncio
+import heapq
+import json
+import sqlite3
+from datetime import date
+from itertools import islice
+from operator import itemgetter
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple, Union
 import aiosqlite
-from app.models.device import Device
+from app.models.device import Device, DevicePatch
 from app.database.startup import DATABASE_PATH
+from app.database.pool import get_pool
+from app.database.backend import get_backend
+from app.database.cache import get_cache
+from app.database.changes import CREATED, DELETED, UPDATED, get_feed
+from app.database.exceptions import DeviceAlreadyExistsError, DeviceNotFoundError
+from app.database import spatial
+from app.database.sharding import get_layout, group_by_shard, shard_of, shards
+from app.database.encoding import decode_uuid, encode_uuid, prefix_range
+from app.database.operations.history import HISTORY_INSERT, now_ms
+from app.metrics import SQL_STATEMENT_SECONDS
+
+NEAREST_INITIAL_RADIUS_KM = 1.0
+
+_timed = SQL_STATEMENT_SECONDS.time
+
+DEVICE_SELECT = ("SELECT devices.device_id, devices.deployment_date, devices.owner, "
+                 "coordinates.latitude, coordinates.longitude "
+                 "FROM devices INNER JOIN coordinates "
+                 "ON coordinates.id = devices.localisation_id ")
+
+# Gets or creates a coordinate in one statement. The no-op update on conflict is what
+# makes RETURNING yield the id of an existing coordinate.
+COORDINATE_UPSERT = ("INSERT INTO coordinates (latitude, longitude) VALUES (?, ?) "
+                     "ON CONFLICT (latitude, longitude) DO UPDATE SET latitude = excluded.latitude "
+                     "RETURNING id")
+
+NEARBY_SELECT = ("SELECT devices.device_id, devices.deployment_date, devices.owner, "
+                 "coordinates.latitude, coordinates.longitude "
+                 "FROM coordinates_rtree "
+                 "INNER JOIN coordinates ON coordinates.id = coordinates_rtree.id "
+                 "INNER JOIN devices ON devices.localisation_id = coordinates.id "
+                 "WHERE coordinates_rtree.max_latitude >= ? "
+                 "AND coordinates_rtree.min_latitude <= ? "
+                 "AND coordinates_rtree.max_longitude >= ? "
+                 "AND coordinates_rtree.min_longitude <= ? "
+                 "AND coordinates.latitude BETWEEN ? AND ? "
+                 "AND coordinates.longitude BETWEEN ? AND ? ")
+
+# Returns a patched device as selected with DEVICE_SELECT, followed by its coordinate id
+PATCH_RETURNING = ("RETURNING devices.device_id, devices.deployment_date, devices.owner, "
+                   "(SELECT latitude FROM coordinates "
+                   "WHERE coordinates.id = devices.localisation_id), "
+                   "(SELECT longitude FROM coordinates "
+                   "WHERE coordinates.id = devices.localisation_id), "
+                   "devices.localisation_id")
+
+
+def _device_to_dict(device: Device) -> dict:
+    """
+    Builds the dictionary of a device as it is read back from the database.
+
+    Parameters:
+    - device (Device): The device.
+
+    Returns:
+    - dict: The device information, with a nested 'localisation' dictionary.
+    """
+    return {
+        'device_uuid': device.device_uuid,
+        'localisation': {'latitude': device.localisation.latitude,
+                         'longitude': device.localisation.longitude},
+        'deployment_date': (device.deployment_date.isoformat()
+                            if device.deployment_date is not None else None),
+        'owner': device.owner
+    }
+
+
+def _device_from_row(row: tuple) -> dict:
+    """
+    Builds the dictionary of a device from a row selected with DEVICE_SELECT.
+
+    Parameters:
+    - row (tuple): The device identifier, deployment date, owner, latitude and longitude.
+
+    Returns:
+    - dict: The device information, with a nested 'localisation' dictionary.
+    """
+    device_id, deployment_date, owner, latitude, longitude = row
+    return {
+        'device_uuid': decode_uuid(device_id),
+        'localisation': {'latitude': latitude, 'longitude': longitude},
+        'deployment_date': deployment_date,
+        'owner': owner
+    }
 
 
 async def create_device(device: Device, db_name: str = DATABASE_PATH) -> None:
     """
     Creates a new device in the database.
 
-    If the coordinates for the device's location do not exist, they are first created
-    in the 'coordinates' table.
-    The device information, including UUID, deployment date, and owner, is then inserted
-    into the 'devices' table.
+    The coordinates of the device's location are fetched or created in the 'coordinates'
+    table, and the device information, including UUID, deployment date, and owner,
+    is inserted into the 'devices' table and recorded in the 'device_history' table, all
+    within a single transaction.
 
     Parameters:
     - device (Device): The device object containing information to be inserted.
     - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Raises:
+    - DeviceAlreadyExistsError: If a device with the same UUID already exists.
     """
-    async with aiosqlite.connect(db_name) as database:
-        async with database.cursor() as cursor:
-            # Check if the coordinates exist
-            await cursor.execute("SELECT id FROM coordinates WHERE latitude = ? AND longitude = ?",
-                                 (device.localisation.latitude, device.localisation.longitude))
-            coordinate = await cursor.fetchone()
-
-            if coordinate:
-                coordinate_id = coordinate[0]
-            else:
-                # If coordinate_id doesn't exist, create a new coordinate
-                await cursor.execute("INSERT INTO coordinates (latitude, longitude) VALUES (?, ?)",
-                                     (device.localisation.latitude, device.localisation.longitude))
-                await database.commit()
-                coordinate_id = cursor.lastrowid  # Retrieve the last inserted row ID
-
-            # Insert the device
-            await cursor.execute(
-                "INSERT INTO devices (device_uuid, localisation_id, deployment_date, owner) "
-                "VALUES (?, ?, ?, ?)",
-                (device.device_uuid, coordinate_id, device.deployment_date, device.owner))
-            await database.commit()
+    backend = get_backend(db_name)
+    if backend is not None:
+        await backend.create_device(device)
+        return
+
+    async def operation(database: aiosqlite.Connection) -> None:
+        coordinate_id = await _upsert_coordinate(database, device)
+        row = (encode_uuid(device.device_uuid), coordinate_id, device.deployment_date,
+               device.owner)
+        try:
+            with _timed("create_device"):
+                await database.execute(
+                    "INSERT INTO devices (device_id, localisation_id, deployment_date, owner) "
+                    "VALUES (?, ?, ?, ?)", row)
+        except sqlite3.IntegrityError as error:
+            raise DeviceAlreadyExistsError(device.device_uuid) from error
+        with _timed("create_device"):
+            await database.execute(HISTORY_INSERT, (row[0], now_ms(), *row[1:]))
+
+    pool = await get_pool(shard_of(device.device_uuid, db_name))
+    await pool.submit(operation)
+
+    device_dict = _device_to_dict(device)
+    get_cache(db_name).write(device.device_uuid, device_dict)
+    get_feed(db_name).publish(CREATED, device.device_uuid, device_dict, device.owner)
+
+
+async def _upsert_coordinate(database: Union[aiosqlite.Connection, aiosqlite.Cursor],
+                             device: Union[Device, DevicePatch]) -> int:
+    """
+    Gets or creates the coordinate of a device's location.
+
+    Parameters:
+    - database (aiosqlite.Connection or aiosqlite.Cursor): The writer connection, or one of
+      its cursors, inside a transaction.
+    - device (Device or DevicePatch): The device, or the patch, whose location is stored.
+
+    Returns:
+    - int: The identifier of the coordinate.
+    """
+    with _timed("upsert_coordinate"):
+        async with database.execute(COORDINATE_UPSERT,
+                                    (device.localisation.latitude,
+                                     device.localisation.longitude)) as cursor:
+            return (await cursor.fetchone())[0]
 
 
 async def get_device(device_uuid: str, db_name: str = DATABASE_PATH) -> Optional[dict]:
@@ -54,71 +193,336 @@ async def get_device(device_uuid: str, db_name: str = DATABASE_PATH) -> Optional
 
     Returns:
     - dict or None: A dictionary containing device information if found, else None.
+      The dictionary may be shared with the device cache and must not be mutated.
     """
-    async with aiosqlite.connect(db_name) as database:
-        async with database.cursor() as cursor:
-            await cursor.execute(
-                "SELECT devices.device_uuid, devices.deployment_date, devices.owner, "
-                "coordinates.latitude, coordinates.longitude "
-                "FROM devices INNER JOIN coordinates "
-                "ON coordinates.id = devices.localisation_id "
-                "WHERE device_uuid = ?",
-                (device_uuid,))
-            device_data = await cursor.fetchone()
+    backend = get_backend(db_name)
+    if backend is not None:
+        return await backend.get_device(device_uuid)
+
+    cache = get_cache(db_name)
+    cached = cache.get(device_uuid)
+    if cached is not cache.MISSING:
+        return cached
+
+    token = cache.read_token()
+    pool = await get_pool(shard_of(device_uuid, db_name))
+    async with pool.reader() as database:
+        with _timed("get_device"):
+            async with database.execute(DEVICE_SELECT + "WHERE devices.device_id = ?",
+                                        (encode_uuid(device_uuid),)) as cursor:
+                device_data = await cursor.fetchone()
 
-            if device_data:
-                # Get column names from the cursor's description attribute
-                column_names = [desc[0] for desc in cursor.description]
+    device_dict = _device_from_row(device_data) if device_data else None
+    cache.fill(device_uuid, device_dict, token)
+    return device_dict
 
-                # Create a dictionary to associate column names with values
-                device_dict = dict(zip(column_names, device_data))
 
-                # Create a 'localisation' dictionary with latitude and longitude keys
-                device_dict['localisation'] = {
-                    'latitude': device_dict.pop('latitude'),
-                    'longitude': device_dict.pop('longitude')
-                }
+async def get_devices(device_uuids: List[str],
+                      db_name: str = DATABASE_PATH) -> Dict[str, Optional[dict]]:
+    """
+    Retrieves several devices from the database based on their UUIDs.
+
+    Devices found in the device cache are served from it, and the others are read with a
+    single query per shard joining the list of their identifiers, then cached.
+
+    Parameters:
+    - device_uuids (list[str]): The UUIDs of the devices to retrieve.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - dict[str, dict or None]: The device information of each distinct UUID, in request
+      order, or None if it was not found. The dictionaries may be shared with the device
+      cache and must not be mutated.
+    """
+    backend = get_backend(db_name)
+    if backend is not None:
+        return await backend.get_devices(device_uuids)
+
+    cache = get_cache(db_name)
+    found: Dict[str, Optional[dict]] = {}
+    uncached = []
+    for device_uuid in device_uuids:
+        if device_uuid in found:
+            continue
+        found[device_uuid] = cache.get(device_uuid)
+        if found[device_uuid] is cache.MISSING:
+            uncached.append(device_uuid)
 
-                return device_dict
+    if not uncached:
+        return found
 
-            return None
+    token = cache.read_token()
+    groups = group_by_shard(uncached, lambda device_uuid: device_uuid, db_name)
+    read = {}
+    for rows in await asyncio.gather(*(_select_devices(shard, shard_uuids)
+                                       for shard, shard_uuids in groups.items())):
+        read.update((device['device_uuid'], device) for device in map(_device_from_row, rows))
+    for device_uuid in uncached:
+        found[device_uuid] = read.get(device_uuid)
+        cache.fill(device_uuid, found[device_uuid], token)
+    return found
+
+
+async def _select_devices(shard: str, device_uuids: List[str]) -> List[tuple]:
+    """
+    Reads several devices of a shard with a single query.
+
+    Parameters:
+    - shard (str): The name of the shard file.
+    - device_uuids (list[str]): The UUIDs of the devices to read.
+
+    Returns:
+    - list[tuple]: The rows of the devices found, selected with DEVICE_SELECT.
+    """
+    pool = await get_pool(shard)
+    async with pool.reader() as database:
+        with _timed("get_devices"):
+            # Integers, unlike floats, go through JSON unchanged
+            async with database.execute(
+                    DEVICE_SELECT + "WHERE devices.device_id IN "
+                                    "(SELECT value FROM json_each(?))",
+                    (json.dumps([encode_uuid(device_uuid) for device_uuid in device_uuids]),)
+            ) as cursor:
+                return await cursor.fetchall()
 
 
 async def update_device(device: Device, db_name: str = DATABASE_PATH) -> None:
     """
     Updates an existing device in the database with new information.
 
-    If the coordinates for the updated location do not exist, they are first created
-    in the 'coordinates' table.
+    The coordinates of the updated location are fetched or created in the 'coordinates'
+    table, and the new version of the device recorded in the 'device_history' table,
+    within the same transaction as the device update.
 
     Parameters:
     - device (Device): The updated device object.
     - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Raises:
+    - DeviceNotFoundError: If no device has this UUID.
     """
-    async with aiosqlite.connect(db_name) as database:
-        async with database.cursor() as cursor:
-            # Check if the coordinates exist
-            await cursor.execute("SELECT id FROM coordinates WHERE latitude = ? AND longitude = ?",
-                                 (device.localisation.latitude, device.localisation.longitude))
-            coordinate = await cursor.fetchone()
-
-            if coordinate:
-                coordinate_id = coordinate[0]
-            else:
-                # If coordinate_id doesn't exist, create a new coordinate
-                await cursor.execute("INSERT INTO coordinates (latitude, longitude) VALUES (?, ?)",
-                                     (device.localisation.latitude, device.localisation.longitude))
-                await database.commit()
-                coordinate_id = cursor.lastrowid  # Retrieve the last inserted row ID
-
-            # Update the device with the new data
-            await cursor.execute(
+    backend = get_backend(db_name)
+    if backend is not None:
+        await backend.update_device(device)
+        return
+
+    async def operation(database: aiosqlite.Connection) -> str:
+        # The previous owner is read for the change feed, within the same transaction
+        with _timed("update_device"):
+            async with database.execute("SELECT owner FROM devices WHERE device_id = ?",
+                                        (encode_uuid(device.device_uuid),)) as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            raise DeviceNotFoundError(device.device_uuid)
+
+        coordinate_id = await _upsert_coordinate(database, device)
+
+        # Update the device with the new data
+        with _timed("update_device"):
+            await database.execute(
                 "UPDATE devices "
                 "SET deployment_date = ?, owner = ?, localisation_id = ? "
-                "WHERE devices.device_uuid = ?",
-                (device.deployment_date, device.owner, coordinate_id, device.device_uuid)
-            )
-            await database.commit()
+                "WHERE devices.device_id = ?",
+                (device.deployment_date, device.owner, coordinate_id,
+                 encode_uuid(device.device_uuid)))
+            await database.execute(HISTORY_INSERT,
+                                   (encode_uuid(device.device_uuid), now_ms(), coordinate_id,
+                                    device.deployment_date, device.owner))
+        return row[0]
+
+    pool = await get_pool(shard_of(device.device_uuid, db_name))
+    try:
+        previous_owner = await pool.submit(operation)
+    except DeviceNotFoundError:
+        get_cache(db_name).write(device.device_uuid, None)
+        raise
+
+    device_dict = _device_to_dict(device)
+    get_cache(db_name).write(device.device_uuid, device_dict)
+    get_feed(db_name).publish(UPDATED, device.device_uuid, device_dict, device.owner,
+                              previous_owner)
+
+
+async def _patch_assignments(database: Union[aiosqlite.Connection, aiosqlite.Cursor],
+                             patch: DevicePatch) -> Tuple[str, list]:
+    """
+    Builds the SET clause of a patch, covering only its supplied fields.
+
+    The coordinate of the new location is fetched or created only when the patch changes
+    the location, and the indexes of the columns left out are not written by the update.
+
+    Parameters:
+    - database (aiosqlite.Connection or aiosqlite.Cursor): The writer connection, or one of
+      its cursors, inside a transaction.
+    - patch (DevicePatch): The patch.
+
+    Returns:
+    - tuple[str, list]: The SET clause and its parameters.
+    """
+    assignments = []
+    parameters = []
+    if "localisation" in patch.model_fields_set:
+        assignments.append("localisation_id = ?")
+        parameters.append(await _upsert_coordinate(database, patch))
+    if "deployment_date" in patch.model_fields_set:
+        assignments.append("deployment_date = ?")
+        parameters.append(patch.deployment_date)
+    if "owner" in patch.model_fields_set:
+        assignments.append("owner = ?")
+        parameters.append(patch.owner)
+    return "SET " + ", ".join(assignments) + " ", parameters
+
+
+async def patch_device(device_uuid: str, patch: DevicePatch,
+                       db_name: str = DATABASE_PATH) -> dict:
+    """
+    Updates the supplied fields of an existing device, leaving the others unchanged.
+
+    Unlike `update_device`, the coordinates are only resolved when the location changes,
+    and only the supplied columns are written. The new version of the device is recorded
+    in the 'device_history' table within the same transaction.
+
+    Parameters:
+    - device_uuid (str): The UUID of the device to patch.
+    - patch (DevicePatch): The fields to change.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - dict: The device information once patched.
+
+    Raises:
+    - DeviceNotFoundError: If no device has this UUID.
+    """
+    backend = get_backend(db_name)
+    if backend is not None:
+        return await backend.patch_device(device_uuid, patch)
+
+    device_id = encode_uuid(device_uuid)
+
+    async def operation(database: aiosqlite.Connection) -> Tuple[tuple, Optional[str]]:
+        previous_owner = None
+        if "owner" in patch.model_fields_set:
+            # The previous owner is read for the change feed, within the same transaction
+            with _timed("patch_device"):
+                async with database.execute("SELECT owner FROM devices WHERE device_id = ?",
+                                            (device_id,)) as cursor:
+                    row = await cursor.fetchone()
+            if row is None:
+                raise DeviceNotFoundError(device_uuid)
+            previous_owner = row[0]
+
+        assignments, parameters = await _patch_assignments(database, patch)
+        with _timed("patch_device"):
+            async with database.execute("UPDATE devices " + assignments +
+                                        "WHERE device_id = ? " + PATCH_RETURNING,
+                                        (*parameters, device_id)) as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            raise DeviceNotFoundError(device_uuid)
+        with _timed("patch_device"):
+            await database.execute(HISTORY_INSERT, (device_id, now_ms(), row[5], row[1],
+                                                    row[2]))
+        return row, previous_owner
+
+    pool = await get_pool(shard_of(device_uuid, db_name))
+    try:
+        row, previous_owner = await pool.submit(operation)
+    except DeviceNotFoundError:
+        get_cache(db_name).write(device_uuid, None)
+        raise
+
+    device = _device_from_row(row[:5])
+    get_cache(db_name).write(device_uuid, device)
+    get_feed(db_name).publish(UPDATED, device_uuid, device, device['owner'],
+                              previous_owner if previous_owner is not None
+                              else device['owner'])
+    return device
+
+
+async def patch_devices(patch: DevicePatch, owner: Optional[str] = None,
+                        deployed_from: Optional[date] = None,
+                        deployed_to: Optional[date] = None, prefix: Optional[str] = None,
+                        db_name: str = DATABASE_PATH) -> int:
+    """
+    Applies a patch to every device matching the filters of the listing, with a single
+    UPDATE statement per shard.
+
+    The shards are patched concurrently, each within a single transaction that also
+    records the new version of every patched device in its history.
+
+    Parameters:
+    - patch (DevicePatch): The fields to change.
+    - owner (str, optional): Only the devices of this owner are patched.
+    - deployed_from (date, optional): Only devices deployed on or after this date are patched.
+    - deployed_to (date, optional): Only devices deployed on or before this date are patched.
+    - prefix (str, optional): Only devices whose UUID starts with this prefix are patched.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - int: The number of patched devices.
+    """
+    backend = get_backend(db_name)
+    if backend is not None:
+        return await backend.patch_devices(patch, owner, deployed_from, deployed_to,
+                                           prefix)
+
+    where, parameters = _device_filters(None, owner, deployed_from, deployed_to, prefix)
+    # The previous owner of every device is only unknown when the owner changes and the
+    # devices are not selected by owner
+    read_owners = "owner" in patch.model_fields_set and owner is None
+    results = await asyncio.gather(*(_patch_shard_devices(shard, patch, where, parameters,
+                                                          read_owners)
+                                     for shard in shards(db_name, prefix)))
+
+    cache = get_cache(db_name)
+    feed = get_feed(db_name)
+    patched = 0
+    for rows, previous_owners in results:
+        patched += len(rows)
+        for row in rows:
+            device = _device_from_row(row[:5])
+            cache.invalidate(device['device_uuid'])
+            feed.publish(UPDATED, device['device_uuid'], device, device['owner'],
+                         previous_owners.get(row[0], owner or device['owner']))
+    return patched
+
+
+async def _patch_shard_devices(shard: str, patch: DevicePatch, where: str,
+                               parameters: list,
+                               read_owners: bool) -> Tuple[List[tuple], Dict[int, str]]:
+    """
+    Applies a patch to the devices of a shard matching a WHERE clause.
+
+    Parameters:
+    - shard (str): The name of the shard file.
+    - patch (DevicePatch): The fields to change.
+    - where (str): The WHERE clause built by `_device_filters`.
+    - parameters (list): The parameters of the WHERE clause.
+    - read_owners (bool): Whether the owners of the devices are read before the update.
+
+    Returns:
+    - tuple[list[tuple], dict[int, str]]: The patched devices, as returned by
+      PATCH_RETURNING, and the previous owner of each device identifier if read.
+    """
+    pool = await get_pool(shard)
+    async with pool.transaction() as database:
+        async with database.cursor() as cursor:
+            previous_owners: Dict[int, str] = {}
+            if read_owners:
+                with _timed("patch_devices"):
+                    await cursor.execute("SELECT devices.device_id, devices.owner "
+                                         "FROM devices " + where, parameters)
+                    previous_owners = dict(await cursor.fetchall())
+            assignments, assigned = await _patch_assignments(cursor, patch)
+            with _timed("patch_devices"):
+                await cursor.execute("UPDATE devices " + assignments + where +
+                                     PATCH_RETURNING, (*assigned, *parameters))
+                rows = await cursor.fetchall()
+                recorded_at = now_ms()
+                await cursor.executemany(HISTORY_INSERT,
+                                         [(row[0], recorded_at, row[5], row[1], row[2])
+                                          for row in rows])
+    return rows, previous_owners
 
 
 async def delete_device(device_uuid: str, db_name: str = DATABASE_PATH) -> None:
@@ -128,10 +532,407 @@ async def delete_device(device_uuid: str, db_name: str = DATABASE_PATH) -> None:
     Parameters:
     - device_uuid (str): The UUID of the device to delete.
     - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Raises:
+    - DeviceNotFoundError: If no device has this UUID.
+    """
+    backend = get_backend(db_name)
+    if backend is not None:
+        await backend.delete_device(device_uuid)
+        return
+
+    async def operation(database: aiosqlite.Connection) -> Optional[str]:
+        with _timed("delete_device"):
+            async with database.execute("DELETE FROM devices "
+                                        "WHERE device_id = ? RETURNING owner",
+                                        (encode_uuid(device_uuid),)) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row is not None else None
+
+    pool = await get_pool(shard_of(device_uuid, db_name))
+    owner = await pool.submit(operation)
+
+    get_cache(db_name).write(device_uuid, None)
+    if owner is None:
+        raise DeviceNotFoundError(device_uuid)
+    get_feed(db_name).publish(DELETED, device_uuid, None, owner)
+
+
+async def create_devices(device_list: List[Device],
+                         db_name: str = DATABASE_PATH) -> Dict[str, bool]:
+    """
+    Creates several devices in the database within a single transaction per shard.
+
+    The devices of each shard are inserted concurrently with those of the other shards.
+
+    Parameters:
+    - device_list (list[Device]): The devices to insert.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - dict[str, bool]: Whether each device UUID was created (False if it already existed).
     """
-    async with aiosqlite.connect(db_name) as database:
+    backend = get_backend(db_name)
+    if backend is not None:
+        return await backend.create_devices(device_list)
+
+    groups = group_by_shard(device_list, lambda device: device.device_uuid, db_name)
+    created: Dict[str, bool] = {}
+    for shard_created in await asyncio.gather(*(_create_shard_devices(shard, shard_devices)
+                                                for shard, shard_devices
+                                                in groups.items())):
+        created.update(shard_created)
+
+    cache = get_cache(db_name)
+    feed = get_feed(db_name)
+    published = set()
+    for device in device_list:
+        if created[device.device_uuid] and device.device_uuid not in published:
+            published.add(device.device_uuid)
+            cache.invalidate(device.device_uuid)
+            feed.publish(CREATED, device.device_uuid, _device_to_dict(device), device.owner)
+    return {device.device_uuid: created[device.device_uuid] for device in device_list}
+
+
+async def _create_shard_devices(shard: str, device_list: List[Device]) -> Dict[str, bool]:
+    """
+    Creates several devices of a shard within a single transaction.
+
+    Existing devices and duplicated UUIDs are found with one set-based query, the missing
+    coordinates are inserted and resolved together, and the devices are then inserted,
+    and recorded in their history, with a single `executemany` each.
+
+    Parameters:
+    - shard (str): The name of the shard file.
+    - device_list (list[Device]): The devices to insert, all routed to this shard.
+
+    Returns:
+    - dict[str, bool]: Whether each device UUID was created (False if it already existed).
+    """
+    pool = await get_pool(shard)
+    async with pool.transaction() as database:
         async with database.cursor() as cursor:
-            await cursor.execute("DELETE FROM devices "
-                                 "WHERE device_uuid = ?",
-                                 (device_uuid,))
-            await database.commit()
+            # Find the devices already in the database
+            with _timed("create_devices"):
+                await cursor.execute(
+                    "SELECT device_id FROM devices "
+                    "WHERE device_id IN (SELECT value FROM json_each(?))",
+                    (json.dumps([encode_uuid(device.device_uuid) for device in device_list]),))
+                existing = {decode_uuid(row[0]) for row in await cursor.fetchall()}
+
+            created: Dict[str, bool] = {}
+            new_devices = []
+            for device in device_list:
+                if device.device_uuid in existing or device.device_uuid in created:
+                    created.setdefault(device.device_uuid, False)
+                    continue
+                created[device.device_uuid] = True
+                new_devices.append(device)
+
+            if not new_devices:
+                return created
+
+            coordinate_ids = await _upsert_coordinates(
+                cursor, {(device.localisation.latitude, device.localisation.longitude)
+                         for device in new_devices})
+
+            rows = [(encode_uuid(device.device_uuid),
+                     coordinate_ids[(device.localisation.latitude,
+                                     device.localisation.longitude)],
+                     device.deployment_date,
+                     device.owner) for device in new_devices]
+            with _timed("create_devices"):
+                await cursor.executemany(
+                    "INSERT INTO devices (device_id, localisation_id, deployment_date, owner) "
+                    "VALUES (?, ?, ?, ?)", rows)
+                recorded_at = now_ms()
+                await cursor.executemany(HISTORY_INSERT,
+                                         [(row[0], recorded_at, *row[1:]) for row in rows])
+    return created
+
+
+async def _upsert_coordinates(cursor: aiosqlite.Cursor,
+                              locations: Set[Tuple[float, float]]) -> Dict[Tuple[float, float],
+                                                                           int]:
+    """
+    Gets or creates a set of coordinates with set-based statements.
+
+    The locations are staged in a temporary table, bound as floats so that they compare
+    exactly with the stored coordinates, then the missing ones are inserted and every
+    identifier is read back with a join on the unique index of the coordinates.
+
+    Parameters:
+    - cursor (aiosqlite.Cursor): A cursor of the writer connection, inside a transaction.
+    - locations (set[tuple[float, float]]): The (latitude, longitude) pairs.
+
+    Returns:
+    - dict[tuple[float, float], int]: The identifier of each coordinate.
+    """
+    with _timed("upsert_coordinates"):
+        await cursor.execute("CREATE TEMP TABLE IF NOT EXISTS staged_locations "
+                             "(latitude REAL NOT NULL, longitude REAL NOT NULL)")
+        await cursor.executemany("INSERT INTO temp.staged_locations VALUES (?, ?)", locations)
+        await cursor.execute("INSERT INTO coordinates (latitude, longitude) "
+                             "SELECT latitude, longitude FROM temp.staged_locations WHERE true "
+                             "ON CONFLICT (latitude, longitude) DO NOTHING")
+        await cursor.execute("SELECT coordinates.id, coordinates.latitude, "
+                             "coordinates.longitude "
+                             "FROM temp.staged_locations INNER JOIN coordinates "
+                             "ON coordinates.latitude = staged_locations.latitude "
+                             "AND coordinates.longitude = staged_locations.longitude")
+        rows = await cursor.fetchall()
+        await cursor.execute("DELETE FROM temp.staged_locations")
+    return {(latitude, longitude): coordinate_id for coordinate_id, latitude, longitude in rows}
+
+
+def _device_filters(after: Optional[str], owner: Optional[str],
+                    deployed_from: Optional[date], deployed_to: Optional[date],
+                    prefix: Optional[str] = None) -> Tuple[str, list]:
+    """
+    Builds the WHERE clause of a device listing.
+
+    Parameters:
+    - after (str, optional): Only devices whose UUID sorts after this one are kept.
+    - owner (str, optional): Only devices of this owner are kept.
+    - deployed_from (date, optional): Only devices deployed on or after this date are kept.
+    - deployed_to (date, optional): Only devices deployed on or before this date are kept.
+    - prefix (str, optional): Only devices whose UUID starts with this prefix are kept.
+
+    Returns:
+    - tuple[str, list]: The WHERE clause and its parameters.
+    """
+    conditions = []
+    parameters = []
+    if after is not None:
+        conditions.append("devices.device_id > ?")
+        parameters.append(encode_uuid(after))
+    if prefix is not None:
+        # UUIDs sharing a prefix are a contiguous range of the primary key
+        conditions.append("devices.device_id BETWEEN ? AND ?")
+        parameters.extend(prefix_range(prefix))
+    if owner is not None:
+        conditions.append("devices.owner = ?")
+        parameters.append(owner)
+    if deployed_from is not None:
+        conditions.append("devices.deployment_date >= ?")
+        parameters.append(deployed_from.isoformat())
+    if deployed_to is not None:
+        conditions.append("devices.deployment_date <= ?")
+        parameters.append(deployed_to.isoformat())
+    where = "WHERE " + " AND ".join(conditions) + " " if conditions else ""
+    return where, parameters
+
+
+async def list_devices(limit: int, after: Optional[str] = None, owner: Optional[str] = None,
+                       deployed_from: Optional[date] = None, deployed_to: Optional[date] = None,
+                       prefix: Optional[str] = None,
+                       db_name: str = DATABASE_PATH) -> List[dict]:
+    """
+    Retrieves a page of devices ordered by UUID.
+
+    Pages are delimited by keyset pagination: the next page starts after the last UUID of
+    the previous one, so reading any page costs the same as reading the first one.
+
+    When shards hold contiguous UUID ranges, they are read one after the other until the
+    page is full. Otherwise, every shard is read concurrently and their pages are merged.
+
+    Parameters:
+    - limit (int): The maximum number of devices to return.
+    - after (str, optional): The UUID after which the page starts.
+    - owner (str, optional): Only devices of this owner are returned.
+    - deployed_from (date, optional): Only devices deployed on or after this date are returned.
+    - deployed_to (date, optional): Only devices deployed on or before this date are returned.
+    - prefix (str, optional): Only devices whose UUID starts with this prefix are returned.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - list[dict]: The devices of the page.
+    """
+    backend = get_backend(db_name)
+    if backend is not None:
+        return await backend.list_devices(limit, after, owner, deployed_from,
+                                          deployed_to, prefix)
+
+    where, parameters = _device_filters(after, owner, deployed_from, deployed_to, prefix)
+    listed_shards = shards(db_name, prefix, after)
+    if get_layout(db_name).ordered:
+        rows = []
+        for shard in listed_shards:
+            rows += await _list_shard_devices(shard, where, parameters, limit - len(rows))
+            if len(rows) == limit:
+                break
+    else:
+        pages = await asyncio.gather(*(_list_shard_devices(shard, where, parameters, limit)
+                                       for shard in listed_shards))
+        rows = islice(heapq.merge(*pages, key=itemgetter(0)), limit)
+    return [_device_from_row(row) for row in rows]
+
+
+async def _list_shard_devices(shard: str, where: str, parameters: list,
+                              limit: int) -> List[tuple]:
+    """
+    Reads a page of the devices of a shard, ordered by identifier.
+
+    Parameters:
+    - shard (str): The name of the shard file.
+    - where (str): The WHERE clause built by `_device_filters`.
+    - parameters (list): The parameters of the WHERE clause.
+    - limit (int): The maximum number of devices to return.
+
+    Returns:
+    - list[tuple]: The rows of the devices, selected with DEVICE_SELECT.
+    """
+    pool = await get_pool(shard)
+    async with pool.reader() as database:
+        with _timed("list_devices"):
+            async with database.execute(
+                    DEVICE_SELECT + where + "ORDER BY devices.device_id LIMIT ?",
+                    (*parameters, limit)) as cursor:
+                return await cursor.fetchall()
+
+
+async def iter_devices(after: Optional[str] = None, owner: Optional[str] = None,
+                       deployed_from: Optional[date] = None, deployed_to: Optional[date] = None,
+                       prefix: Optional[str] = None, chunk_size: int = 500,
+                       db_name: str = DATABASE_PATH) -> AsyncIterator[dict]:
+    """
+    Iterates over every device matching the filters, ordered by UUID.
+
+    Devices are read in keyset chunks, releasing the pooled connection between chunks, so
+    a full scan neither holds the table in memory nor monopolizes a reader connection.
+
+    Parameters:
+    - after (str, optional): The UUID after which the iteration starts.
+    - owner (str, optional): Only devices of this owner are returned.
+    - deployed_from (date, optional): Only devices deployed on or after this date are returned.
+    - deployed_to (date, optional): Only devices deployed on or before this date are returned.
+    - prefix (str, optional): Only devices whose UUID starts with this prefix are returned.
+    - chunk_size (int): The number of devices read per query.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Yields:
+    - dict: The devices, one at a time.
+    """
+    while True:
+        chunk = await list_devices(chunk_size, after, owner, deployed_from, deployed_to,
+                                   prefix, db_name)
+        for device in chunk:
+            yield device
+        if len(chunk) < chunk_size:
+            return
+        after = chunk[-1]['device_uuid']
+
+
+async def _find_devices_in_boxes(boxes: List[spatial.Box], limit: Optional[int],
+                                 db_name: str) -> List[dict]:
+    """
+    Retrieves the devices located in a set of bounding boxes, using the R*Tree index of
+    every shard concurrently.
+
+    Parameters:
+    - boxes (list[Box]): The (min_latitude, max_latitude, min_longitude, max_longitude) boxes.
+    - limit (int, optional): The maximum number of devices to return, or None for all.
+    - db_name (str): The name of the SQLite database file.
+
+    Returns:
+    - list[dict]: The devices found.
+    """
+    backend = get_backend(db_name)
+    if backend is not None:
+        return await backend.find_devices_in_boxes(boxes, limit)
+
+    found = []
+    for rows in await asyncio.gather(*(_find_shard_devices_in_boxes(shard, boxes, limit)
+                                       for shard in shards(db_name))):
+        found += rows
+    return [_device_from_row(row) for row in found[:limit]]
+
+
+async def _find_shard_devices_in_boxes(shard: str, boxes: List[spatial.Box],
+                                       limit: Optional[int]) -> List[tuple]:
+    """
+    Retrieves the devices of a shard located in a set of bounding boxes.
+
+    Parameters:
+    - shard (str): The name of the shard file.
+    - boxes (list[Box]): The (min_latitude, max_latitude, min_longitude, max_longitude) boxes.
+    - limit (int, optional): The maximum number of devices to return, or None for all.
+
+    Returns:
+    - list[tuple]: The rows of the devices found, selected with NEARBY_SELECT.
+    """
+    found = []
+    pool = await get_pool(shard)
+    async with pool.reader() as database:
+        for min_latitude, max_latitude, min_longitude, max_longitude in boxes:
+            remaining = -1 if limit is None else limit - len(found)
+            with _timed("find_devices_in_boxes"):
+                async with database.execute(
+                        NEARBY_SELECT + "LIMIT ?",
+                        (min_latitude, max_latitude, min_longitude, max_longitude,
+                         min_latitude, max_latitude, min_longitude, max_longitude,
+                         remaining)) as cursor:
+                    found += await cursor.fetchall()
+    return found
+
+
+async def find_devices_in_box(min_latitude: float, max_latitude: float,
+                              min_longitude: float, max_longitude: float, limit: int,
+                              db_name: str = DATABASE_PATH) -> List[dict]:
+    """
+    Retrieves the devices located in a bounding box.
+
+    Parameters:
+    - min_latitude (float): The southern edge of the box.
+    - max_latitude (float): The northern edge of the box.
+    - min_longitude (float): The western edge of the box. A value greater than max_longitude
+      designates a box crossing the antimeridian.
+    - max_longitude (float): The eastern edge of the box.
+    - limit (int): The maximum number of devices to return.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - list[dict]: The devices found.
+    """
+    boxes = spatial.split_box(min_latitude, max_latitude, min_longitude, max_longitude)
+    return await _find_devices_in_boxes(boxes, limit, db_name)
+
+
+async def find_devices_near(latitude: float, longitude: float, radius_km: Optional[float],
+                            limit: int, db_name: str = DATABASE_PATH) -> List[dict]:
+    """
+    Retrieves the devices closest to a point, ordered by distance.
+
+    Without a radius, the search radius starts small and doubles until enough devices
+    are found, so that only the neighbourhood of the point is read.
+
+    Parameters:
+    - latitude (float): The latitude of the point.
+    - longitude (float): The longitude of the point.
+    - radius_km (float, optional): Only devices within this distance are returned.
+    - limit (int): The maximum number of devices to return.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - list[dict]: The devices found, each with its 'distance_km' from the point.
+    """
+    search_radius = radius_km if radius_km is not None else NEAREST_INITIAL_RADIUS_KM
+    while True:
+        boxes = spatial.radius_boxes(latitude, longitude, search_radius)
+        candidates = await _find_devices_in_boxes(boxes, None, db_name)
+        nearby = []
+        for device in candidates:
+            distance = spatial.haversine_km(latitude, longitude,
+                                            device['localisation']['latitude'],
+                                            device['localisation']['longitude'])
+            if distance <= search_radius:
+                device['distance_km'] = distance
+                nearby.append(device)
+
+        # Every device closer than the search radius is a candidate, so once there are
+        # enough of them they are the nearest ones
+        if (radius_km is not None or len(nearby) >= limit
+                or search_radius >= spatial.MAX_DISTANCE_KM):
+            nearby.sort(key=lambda item: item['distance_km'])
+            return nearby[:limit]
+        search_radius = min(search_radius * 2, spatial.MAX_DISTANCE_KM)
@@ -0,0 +1,273 @@
+"""
+Module containing the operations on the history of the devices.
+
+Every creation and update of a device records a version of it in the 'device_history'
+table, within the same transaction, keyed by the device identifier and the time of the
+write in milliseconds since the epoch. The history of a device over a time range is read
+with a range scan of that key.
+
+To keep the storage bounded for devices that move often, the history is compacted
+periodically: versions older than the full resolution period are downsampled to the last
+version of each bucket (e.g. one per day), and versions older than the retention period
+are deleted, except the current version of the devices that still exist.
+
+When the devices are stored by another backend (see `app.database.backend`), their history
+is read and compacted by it, with the same rules.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional
+import aiosqlite
+from app.config import settings
+from app.database.startup import DATABASE_PATH
+from app.database.pool import get_pool
+from app.database.backend import get_backend
+from app.database.sharding import shard_of, shards
+from app.database.encoding import MAX_DEVICE_ID, encode_uuid
+from app.metrics import SQL_STATEMENT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_timed = SQL_STATEMENT_SECONDS.time
+
+# Number of device identifiers compacted per transaction, so that the compaction does not
+# hold the writer connection for long
+COMPACTION_CHUNK_SIZE = 100_000
+
+# Versions of a device get strictly increasing times, even when written within the same
+# millisecond or after the clock went back, so that no version is overwritten
+HISTORY_INSERT = ("INSERT INTO device_history (device_id, recorded_at, localisation_id, "
+                  "deployment_date, owner) VALUES (?1, max(?2, coalesce("
+                  "(SELECT max(recorded_at) + 1 FROM device_history WHERE device_id = ?1), "
+                  "0)), ?3, ?4, ?5)")
+
+HISTORY_SELECT = ("SELECT device_history.recorded_at, device_history.deployment_date, "
+                  "device_history.owner, coordinates.latitude, coordinates.longitude "
+                  "FROM device_history LEFT JOIN coordinates "
+                  "ON coordinates.id = device_history.localisation_id "
+                  "WHERE device_history.device_id = ? "
+                  "AND device_history.recorded_at BETWEEN ? AND ? "
+                  "ORDER BY device_history.recorded_at LIMIT ?")
+
+# Deletes the versions older than the full resolution period followed by a later version
+# of the same bucket
+DOWNSAMPLE_DELETE = ("DELETE FROM device_history "
+                     "WHERE device_id BETWEEN ? AND ? AND recorded_at < ? "
+                     "AND EXISTS (SELECT 1 FROM device_history AS later "
+                     "WHERE later.device_id = device_history.device_id "
+                     "AND later.recorded_at > device_history.recorded_at "
+                     "AND later.recorded_at < (device_history.recorded_at / ? + 1) * ?)")
+
+# Deletes the versions older than the retention period, unless they are the current
+# version of an existing device
+EXPIRE_DELETE = ("DELETE FROM device_history "
+                 "WHERE device_id BETWEEN ? AND ? AND recorded_at < ? "
+                 "AND (EXISTS (SELECT 1 FROM device_history AS later "
+                 "WHERE later.device_id = device_history.device_id "
+                 "AND later.recorded_at > device_history.recorded_at) "
+                 "OR NOT EXISTS (SELECT 1 FROM devices "
+                 "WHERE devices.device_id = device_history.device_id))")
+
+MS_PER_HOUR = 3_600_000
+MS_PER_DAY = 24 * MS_PER_HOUR
+
+
+def now_ms() -> int:
+    """
+    Returns the current time in milliseconds since the epoch, as recorded in the history.
+
+    Returns:
+    - int: The current time.
+    """
+    return time.time_ns() // 1_000_000
+
+
+def datetime_to_ms(moment: datetime) -> int:
+    """
+    Converts a datetime to milliseconds since the epoch.
+
+    Parameters:
+    - moment (datetime): The datetime, assumed in UTC if it has no time zone.
+
+    Returns:
+    - int: The time in milliseconds since the epoch.
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def version_from_row(row: tuple) -> dict:
+    """
+    Builds the dictionary of a device version from a row selected with HISTORY_SELECT.
+
+    Parameters:
+    - row (tuple): The time, deployment date, owner, latitude and longitude of the version.
+
+    Returns:
+    - dict: The version, with its time in ISO 8601 format and a nested 'localisation'.
+    """
+    recorded_at, deployment_date, owner, latitude, longitude = row
+    return {
+        'recorded_at': datetime.fromtimestamp(recorded_at / 1000, timezone.utc)
+                               .isoformat(timespec="milliseconds"),
+        'localisation': ({'latitude': latitude, 'longitude': longitude}
+                         if latitude is not None else None),
+        'deployment_date': deployment_date,
+        'owner': owner
+    }
+
+
+async def get_device_history(device_uuid: str, start: Optional[int] = None,
+                             end: Optional[int] = None, limit: int = 1000,
+                             db_name: str = DATABASE_PATH) -> Optional[List[dict]]:
+    """
+    Retrieves the versions of a device recorded within a time range, oldest first.
+
+    Parameters:
+    - device_uuid (str): The UUID of the device.
+    - start (int, optional): Only versions recorded at or after this time, in milliseconds
+      since the epoch, are returned.
+    - end (int, optional): Only versions recorded at or before this time, in milliseconds
+      since the epoch, are returned.
+    - limit (int): The maximum number of versions to return.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - list[dict] or None: The versions, or None if the device has no history at all.
+    """
+    backend = get_backend(db_name)
+    if backend is not None:
+        return await backend.get_device_history(device_uuid, start, end, limit)
+
+    device_id = encode_uuid(device_uuid)
+    pool = await get_pool(shard_of(device_uuid, db_name))
+    async with pool.reader() as database:
+        with _timed("get_device_history"):
+            async with database.execute(
+                    HISTORY_SELECT,
+                    (device_id, start if start is not None else 0,
+                     end if end is not None else 2 ** 62, limit)) as cursor:
+                rows = await cursor.fetchall()
+            if not rows:
+                async with database.execute("SELECT 1 FROM device_history "
+                                            "WHERE device_id = ? LIMIT 1",
+                                            (device_id,)) as cursor:
+                    if await cursor.fetchone() is None:
+                        return None
+    return [version_from_row(row) for row in rows]
+
+
+@dataclass
+class HistoryCompaction:
+    """
+    Represents the outcome of a compaction of the device history.
+
+    Attributes:
+    - downsampled (int): Number of versions deleted by the downsampling.
+    - expired (int): Number of versions deleted because they passed the retention period.
+    - seconds (float): The time taken by the compaction.
+    """
+    downsampled: int = 0
+    expired: int = 0
+    seconds: float = 0.0
+
+
+async def _compact_chunk(database: aiosqlite.Connection, low: int, high: int,
+                         downsample_before: int, bucket_ms: int,
+                         expire_before: int) -> tuple:
+    """
+    Compacts the history of a range of device identifiers.
+
+    Parameters:
+    - database (aiosqlite.Connection): The writer connection, inside a transaction.
+    - low (int): The first device identifier of the range.
+    - high (int): The last device identifier of the range.
+    - downsample_before (int): The time before which versions are downsampled.
+    - bucket_ms (int): The period of which a single version is kept, in milliseconds.
+    - expire_before (int): The time before which versions are deleted.
+
+    Returns:
+    - tuple[int, int]: The number of downsampled and expired versions.
+    """
+    with _timed("compact_history"):
+        async with database.execute(DOWNSAMPLE_DELETE, (low, high, downsample_before,
+                                                        bucket_ms, bucket_ms)) as cursor:
+            downsampled = cursor.rowcount
+        async with database.execute(EXPIRE_DELETE, (low, high, expire_before)) as cursor:
+            expired = cursor.rowcount
+    return downsampled, expired
+
+
+async def compact_history(now: Optional[int] = None,
+                          full_resolution_days: float = settings.history_full_resolution_days,
+                          bucket_hours: float = settings.history_bucket_hours,
+                          retention_days: float = settings.history_retention_days,
+                          db_name: str = DATABASE_PATH) -> HistoryCompaction:
+    """
+    Downsamples and expires the old versions of the device history.
+
+    The history is compacted COMPACTION_CHUNK_SIZE device identifiers at a time, each
+    chunk in its own transaction, so that device writes proceed in between.
+
+    Parameters:
+    - now (int, optional): The current time in milliseconds since the epoch. Default is
+      the clock.
+    - full_resolution_days (float): Age up to which every version is kept.
+    - bucket_hours (float): Period of which a single version, the last, is kept beyond
+      the full resolution age.
+    - retention_days (float): Age after which versions are deleted, except the current
+      version of existing devices.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - HistoryCompaction: The number of deleted versions.
+    """
+    start = time.perf_counter()
+    now = now if now is not None else now_ms()
+    downsample_before = now - int(full_resolution_days * MS_PER_DAY)
+    bucket_ms = max(1, int(bucket_hours * MS_PER_HOUR))
+    expire_before = now - int(retention_days * MS_PER_DAY)
+
+    outcome = HistoryCompaction()
+    backend = get_backend(db_name)
+    if backend is not None:
+        outcome.downsampled, outcome.expired = await backend.compact_history(
+            downsample_before, bucket_ms, expire_before)
+        outcome.seconds = time.perf_counter() - start
+        return outcome
+    for shard in shards(db_name):
+        pool = await get_pool(shard)
+        for low in range(0, MAX_DEVICE_ID + 1, COMPACTION_CHUNK_SIZE):
+            async with pool.transaction() as database:
+                downsampled, expired = await _compact_chunk(
+                    database, low, low + COMPACTION_CHUNK_SIZE - 1, downsample_before,
+                    bucket_ms, expire_before)
+            outcome.downsampled += downsampled
+            outcome.expired += expired
+    outcome.seconds = time.perf_counter() - start
+    return outcome
+
+
+async def run_history_compaction(
+        interval_seconds: float = settings.history_compaction_interval_seconds,
+        db_name: str = DATABASE_PATH) -> None:
+    """
+    Compacts the device history periodically, until cancelled.
+
+    Parameters:
+    - interval_seconds (float): The time between two compactions.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            outcome = await compact_history(db_name=db_name)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Failed to compact the device history")
+            continue
+        logger.info("Compacted the device history in %.3fs: %d versions downsampled, "
+                    "%d expired", outcome.seconds, outcome.downsampled, outcome.expired)
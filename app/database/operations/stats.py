@@ -0,0 +1,191 @@
+"""
+Module containing the statistics of the fleet of devices.
+
+The number of devices per owner, per deployment month and per grid cell is maintained in
+summary tables by triggers on the 'devices' table (see `app.database.migrations`), within
+the transaction of every creation, update and deletion of a device. Reading the counts
+therefore costs the number of groups, whatever the number of devices. The tables can be
+rebuilt from the devices, should they ever drift, e.g. after the devices were edited with
+the triggers dropped.
+
+When the devices are stored by another backend (see `app.database.backend`), the counts
+are maintained and rebuilt by it.
+"""
+import math
+import time
+from typing import Dict, Hashable, List, Tuple
+from app.database.startup import DATABASE_PATH
+from app.database.pool import get_pool
+from app.database.backend import get_backend
+from app.database.migrations import DEVICE_COUNTS_REBUILD, GRID_PRECISIONS
+from app.database.sharding import shards
+from app.metrics import SQL_STATEMENT_SECONDS
+
+_timed = SQL_STATEMENT_SECONDS.time
+
+OWNER_COUNTS_SELECT = "SELECT owner, devices FROM device_counts_by_owner"
+
+MONTH_COUNTS_SELECT = "SELECT month, devices FROM device_counts_by_month"
+
+CELL_COUNTS_SELECT = ("SELECT latitude_cell, longitude_cell, devices "
+                      "FROM device_counts_by_cell WHERE precision = ?")
+
+
+def grid_cell(latitude: float, longitude: float, precision: int) -> Tuple[int, int]:
+    """
+    Returns the grid cell of a location, as computed by the triggers counting the devices.
+
+    Parameters:
+    - latitude (float): The latitude.
+    - longitude (float): The longitude.
+    - precision (int): One of GRID_PRECISIONS, the cells spanning 10^-precision degrees.
+
+    Returns:
+    - tuple[int, int]: The indexes of the cell, its south-west corner in 10^-precision
+      degrees.
+    """
+    scale = float(10 ** precision)
+    return (math.floor(round(latitude * scale, 6)),
+            math.floor(round(longitude * scale, 6)))
+
+
+def check_precision(precision: int) -> None:
+    """
+    Checks that the devices are counted in grid cells of a precision.
+
+    Parameters:
+    - precision (int): The precision of the grid cells.
+
+    Raises:
+    - ValueError: If the precision is not one of GRID_PRECISIONS.
+    """
+    if precision not in GRID_PRECISIONS:
+        raise ValueError(f"The grid precision must be one of "
+                         f"{', '.join(map(str, GRID_PRECISIONS))}, not {precision!r}")
+
+
+async def _sum_counts(statement: str, parameters: tuple, db_name: str
+                      ) -> Dict[Hashable, int]:
+    """
+    Reads the counts of a summary table in every shard, and sums them per group.
+
+    Parameters:
+    - statement (str): The query of the groups, whose last column is the count.
+    - parameters (tuple): The parameters of the query.
+    - db_name (str): The name of the SQLite database file.
+
+    Returns:
+    - dict: The number of devices per group, keyed by the other columns, or the single
+      one.
+    """
+    counts: Dict[Hashable, int] = {}
+    for shard in shards(db_name):
+        pool = await get_pool(shard)
+        async with pool.reader() as database:
+            with _timed("count_devices"):
+                async with database.execute(statement, parameters) as cursor:
+                    rows = await cursor.fetchall()
+        for row in rows:
+            group = row[0] if len(row) == 2 else tuple(row[:-1])
+            counts[group] = counts.get(group, 0) + row[-1]
+    return counts
+
+
+async def count_devices_by_owner(db_name: str = DATABASE_PATH) -> List[dict]:
+    """
+    Counts the devices of each owner.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - list[dict]: The 'owner' and number of 'devices' of every owner with a device,
+      ordered by owner.
+    """
+    backend = get_backend(db_name)
+    if backend is not None:
+        counts = await backend.count_devices_by_owner()
+    else:
+        counts = await _sum_counts(OWNER_COUNTS_SELECT, (), db_name)
+    return [{"owner": owner, "devices": devices}
+            for owner, devices in sorted(counts.items())]
+
+
+async def count_devices_by_deployment_month(db_name: str = DATABASE_PATH) -> List[dict]:
+    """
+    Counts the devices deployed each month.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - list[dict]: The 'month', in the format YYYY-MM, and number of 'devices' of every
+      month with a deployed device, ordered by month, then the devices without a
+      deployment date under a null month.
+    """
+    backend = get_backend(db_name)
+    if backend is not None:
+        counts = await backend.count_devices_by_deployment_month()
+    else:
+        counts = await _sum_counts(MONTH_COUNTS_SELECT, (), db_name)
+    # The devices without a deployment date are counted under an empty month, listed last
+    ordered = sorted(counts.items(), key=lambda item: (item[0] == "", item[0]))
+    return [{"month": month or None, "devices": devices} for month, devices in ordered]
+
+
+async def count_devices_by_grid_cell(precision: int = 0, db_name: str = DATABASE_PATH
+                                     ) -> List[dict]:
+    """
+    Counts the devices located in each cell of a grid.
+
+    Parameters:
+    - precision (int): One of GRID_PRECISIONS, the cells spanning 10^-precision degrees of
+      latitude and longitude. Default is 0, cells of one degree.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - list[dict]: The 'latitude' and 'longitude' of the south-west corner, the
+      'size_degrees' and the number of 'devices' of every cell with a device, ordered by
+      latitude then longitude.
+
+    Raises:
+    - ValueError: If the precision is not one of GRID_PRECISIONS.
+    """
+    check_precision(precision)
+    backend = get_backend(db_name)
+    if backend is not None:
+        counts = await backend.count_devices_by_grid_cell(precision)
+    else:
+        counts = await _sum_counts(CELL_COUNTS_SELECT, (precision,), db_name)
+    size = 10 ** -precision
+    return [{"latitude": round(latitude_cell * size, precision),
+             "longitude": round(longitude_cell * size, precision),
+             "size_degrees": size, "devices": devices}
+            for (latitude_cell, longitude_cell), devices in sorted(counts.items())]
+
+
+async def rebuild_device_counts(db_name: str = DATABASE_PATH) -> float:
+    """
+    Recomputes the device counts from the devices.
+
+    Each shard is rebuilt in a single transaction, so that the counts read meanwhile are
+    either the previous or the rebuilt ones, and no device write is missed.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - float: The time taken by the rebuild, in seconds.
+    """
+    start = time.perf_counter()
+    backend = get_backend(db_name)
+    if backend is not None:
+        await backend.rebuild_device_counts()
+        return time.perf_counter() - start
+    for shard in shards(db_name):
+        pool = await get_pool(shard)
+        async with pool.transaction() as database:
+            with _timed("rebuild_device_counts"):
+                for statement in DEVICE_COUNTS_REBUILD:
+                    await database.execute(statement)
+    return time.perf_counter() - start
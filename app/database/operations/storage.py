@@ -0,0 +1,212 @@
+"""
+Module containing the reclaiming of the storage of the database.
+
+Updates and deletions of devices leave behind the coordinates no device, nor any version
+of the device history, refers to anymore. They are deleted periodically, a range of
+coordinate identifiers at a time, through the group-commit writer: each range is checked
+and deleted atomically with respect to the device writes, so that a coordinate reused by
+a concurrent write is never deleted.
+
+The database is in incremental auto-vacuum mode (see `app.database.migrations`): the pages
+freed by deletions are kept in the file until `PRAGMA incremental_vacuum` returns them to
+the file system, which is done after each collection, a number of pages at a time, also
+through the writer.
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import List
+import aiosqlite
+from app.config import settings
+from app.database.startup import DATABASE_PATH
+from app.database.pool import get_pool
+from app.database.sharding import shards
+from app.metrics import SQL_STATEMENT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_timed = SQL_STATEMENT_SECONDS.time
+
+# Number of coordinate identifiers checked per write operation
+COLLECTION_CHUNK_SIZE = 10_000
+
+# Number of free pages returned to the file system per write operation
+VACUUM_CHUNK_PAGES = 1024
+
+UNREFERENCED_COORDINATES_DELETE = (
+    "DELETE FROM coordinates WHERE id BETWEEN ? AND ? "
+    "AND NOT EXISTS (SELECT 1 FROM devices WHERE devices.localisation_id = coordinates.id) "
+    "AND NOT EXISTS (SELECT 1 FROM device_history "
+    "WHERE device_history.localisation_id = coordinates.id)")
+
+# Size of each table, its indexes included
+TABLE_SIZES_SELECT = ("SELECT coalesce(sqlite_master.tbl_name, dbstat.name), "
+                      "sum(dbstat.pgsize) "
+                      "FROM dbstat LEFT JOIN sqlite_master "
+                      "ON sqlite_master.name = dbstat.name "
+                      "WHERE dbstat.aggregate = TRUE GROUP BY 1 ORDER BY 1")
+
+
+@dataclass
+class StorageMaintenance:
+    """
+    Represents the outcome of a storage maintenance.
+
+    Attributes:
+    - deleted_coordinates (int): Number of unreferenced coordinates deleted.
+    - released_bytes (int): Size of the free pages returned to the file system.
+    - seconds (float): The time taken by the maintenance.
+    """
+    deleted_coordinates: int = 0
+    released_bytes: int = 0
+    seconds: float = 0.0
+
+
+async def _pragma(database: aiosqlite.Connection, name: str) -> int:
+    """
+    Reads an integer PRAGMA.
+
+    Parameters:
+    - database (aiosqlite.Connection): The connection.
+    - name (str): The name of the PRAGMA.
+
+    Returns:
+    - int: Its value.
+    """
+    async with database.execute(f"PRAGMA {name}") as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def collect_coordinates(db_name: str = DATABASE_PATH) -> int:
+    """
+    Deletes the coordinates no device and no version of the device history refers to.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - int: The number of deleted coordinates.
+    """
+    deleted = 0
+    for shard in shards(db_name):
+        pool = await get_pool(shard)
+        async with pool.reader() as database:
+            async with database.execute("SELECT max(id) FROM coordinates") as cursor:
+                last_id = (await cursor.fetchone())[0] or 0
+
+        for low in range(0, last_id + 1, COLLECTION_CHUNK_SIZE):
+            async def operation(database: aiosqlite.Connection, low: int = low) -> int:
+                with _timed("collect_coordinates"):
+                    async with database.execute(UNREFERENCED_COORDINATES_DELETE,
+                                                (low, low + COLLECTION_CHUNK_SIZE - 1)
+                                                ) as cursor:
+                        return cursor.rowcount
+
+            deleted += await pool.submit(operation)
+    return deleted
+
+
+async def release_free_pages(db_name: str = DATABASE_PATH) -> int:
+    """
+    Returns the free pages of the database to the file system.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - int: The size of the released pages, in bytes.
+    """
+    released = 0
+    for shard in shards(db_name):
+        pool = await get_pool(shard)
+
+        async def operation(database: aiosqlite.Connection) -> int:
+            free_pages = await _pragma(database, "freelist_count")
+            with _timed("release_free_pages"):
+                await database.execute(f"PRAGMA incremental_vacuum({VACUUM_CHUNK_PAGES})")
+            page_size = await _pragma(database, "page_size")
+            return (free_pages - await _pragma(database, "freelist_count")) * page_size
+
+        while True:
+            shard_released = await pool.submit(operation)
+            if not shard_released:
+                break
+            released += shard_released
+    return released
+
+
+async def maintain_storage(db_name: str = DATABASE_PATH) -> StorageMaintenance:
+    """
+    Deletes the unreferenced coordinates, then returns the free pages to the file system.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - StorageMaintenance: The number of deleted coordinates and the released size.
+    """
+    start = time.perf_counter()
+    outcome = StorageMaintenance(deleted_coordinates=await collect_coordinates(db_name),
+                                 released_bytes=await release_free_pages(db_name))
+    outcome.seconds = time.perf_counter() - start
+    return outcome
+
+
+async def storage_stats(db_name: str = DATABASE_PATH) -> List[dict]:
+    """
+    Returns the disk usage of each shard of the database.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - list[dict]: For each shard file, the size of the database, which the file reaches
+      once the write-ahead log is checkpointed, the sizes of the file and of the log, the
+      size of each table with its indexes, and the size of its free pages, which the next
+      maintenance returns to the file system.
+    """
+    stats = []
+    for shard in shards(db_name):
+        pool = await get_pool(shard)
+        async with pool.reader() as database:
+            page_size = await _pragma(database, "page_size")
+            page_count = await _pragma(database, "page_count")
+            free_pages = await _pragma(database, "freelist_count")
+            with _timed("storage_stats"):
+                async with database.execute(TABLE_SIZES_SELECT) as cursor:
+                    tables = dict(await cursor.fetchall())
+        wal_name = f"{shard}-wal"
+        stats.append({
+            "database": shard,
+            "database_bytes": page_count * page_size,
+            "file_bytes": os.path.getsize(shard),
+            "wal_bytes": os.path.getsize(wal_name) if os.path.exists(wal_name) else 0,
+            "page_size": page_size,
+            "table_bytes": tables,
+            "reclaimable_bytes": free_pages * page_size,
+        })
+    return stats
+
+
+async def run_storage_maintenance(
+        interval_seconds: float = settings.storage_maintenance_interval_seconds,
+        db_name: str = DATABASE_PATH) -> None:
+    """
+    Maintains the storage of the database periodically, until cancelled.
+
+    Parameters:
+    - interval_seconds (float): The time between two maintenances.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            outcome = await maintain_storage(db_name)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Failed to maintain the database storage")
+            continue
+        logger.info("Maintained the database storage in %.3fs: %d coordinates deleted, "
+                    "%d bytes released", outcome.seconds, outcome.deleted_coordinates,
+                    outcome.released_bytes)
@@ -0,0 +1,325 @@
+"""
+Module containing the pooled SQLite connection manager.
+
+Each database file gets a single writer connection, since SQLite only allows one writer
+at a time, and a fixed set of read-only connections. Connections are opened once, tuned
+with PRAGMAs and then borrowed by the CRUD operations instead of reconnecting per call.
+Single-device writes are submitted to the group-commit writer of the pool, which shares
+the writer connection with the explicit transactions of bulk operations.
+
+A database split into shards (see `app.database.sharding`) has one pool per shard file,
+so that each shard has its own writer.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+import aiosqlite
+from app.config import settings
+from app.database.startup import DATABASE_PATH
+from app.database.sharding import shards
+from app.database.writer import GroupCommitWriter, WriteOperation
+
+
+@dataclass
+class RoleStats:
+    """
+    Represents the usage statistics of one kind of pooled connection.
+
+    Attributes:
+    - size (int): Number of connections of this kind.
+    - in_use (int): Number of connections currently borrowed.
+    - acquisitions (int): Total number of times a connection was borrowed.
+    - waits (int): Number of acquisitions that had to wait for a free connection.
+    - total_wait_seconds (float): Cumulated time spent waiting for a connection.
+    - max_wait_seconds (float): Longest time spent waiting for a connection.
+    """
+    size: int = 0
+    in_use: int = 0
+    acquisitions: int = 0
+    waits: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    def record(self, waited: float, contended: bool) -> None:
+        """
+        Records one acquisition.
+
+        Parameters:
+        - waited (float): Time spent waiting for the connection, in seconds.
+        - contended (bool): Whether no connection was free when it was requested.
+        """
+        self.acquisitions += 1
+        self.in_use += 1
+        if contended:
+            self.waits += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+class ConnectionPool:
+    """
+    Represents a pool of connections to a single SQLite database file.
+
+    The writer connection runs in autocommit mode so that transactions are delimited
+    explicitly with `transaction()`. Reader connections are read-only and, thanks to WAL
+    mode, never block on the writer. A released reader is handed over to the longest
+    waiting request, so that requests arriving later cannot take it first and starve the
+    ones already waiting.
+    """
+
+    def __init__(self, db_name: str = DATABASE_PATH, readers: int = settings.pool_readers):
+        self.db_name = db_name
+        self.reader_count = max(1, readers)
+        self._idle_readers: Deque[aiosqlite.Connection] = deque()
+        self._reader_waiters: Deque[asyncio.Future] = deque()
+        self._all_readers: List[aiosqlite.Connection] = []
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._writer_lock: Optional[asyncio.Lock] = None
+        self._open_lock: Optional[asyncio.Lock] = None
+        self._group_writer: Optional[GroupCommitWriter] = None
+        self.reader_stats = RoleStats()
+        self.writer_stats = RoleStats()
+
+    @property
+    def is_open(self) -> bool:
+        """
+        Whether the pool connections are open.
+        """
+        return self._writer is not None
+
+    async def _connect(self, read_only: bool) -> aiosqlite.Connection:
+        """
+        Opens and tunes a single connection.
+
+        Parameters:
+        - read_only (bool): Whether the connection is restricted to queries.
+
+        Returns:
+        - aiosqlite.Connection: The opened connection.
+        """
+        database = await aiosqlite.connect(self.db_name,
+                                           isolation_level=None,
+                                           cached_statements=settings.statement_cache_size)
+        await database.execute(f"PRAGMA busy_timeout = {settings.busy_timeout_ms}")
+        await database.execute(f"PRAGMA cache_size = -{settings.cache_size_kib}")
+        await database.execute(f"PRAGMA mmap_size = {settings.mmap_size}")
+        await database.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            await database.execute("PRAGMA query_only = ON")
+        else:
+            # WAL lets readers proceed while a write is in progress, and with it
+            # synchronous=NORMAL only syncs at checkpoints instead of every commit.
+            await database.execute("PRAGMA journal_mode = WAL")
+            await database.execute("PRAGMA synchronous = NORMAL")
+        return database
+
+    async def open(self) -> None:
+        """
+        Opens the writer and reader connections. Calling it on an open pool does nothing.
+        """
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self.is_open:
+                return
+            # The writer is opened first so that WAL mode is set before the readers connect
+            writer = await self._connect(read_only=False)
+            self._all_readers = [await self._connect(read_only=True)
+                                 for _ in range(self.reader_count)]
+            self._idle_readers = deque(self._all_readers)
+            self._reader_waiters = deque()
+            self._writer_lock = asyncio.Lock()
+            self._writer = writer
+            self._group_writer = GroupCommitWriter(self)
+            self._group_writer.start()
+            self.reader_stats.size = self.reader_count
+            self.writer_stats.size = 1
+
+    async def close(self) -> None:
+        """
+        Closes every connection of the pool.
+        """
+        if not self.is_open:
+            return
+        await self._group_writer.stop()
+        async with self._writer_lock:
+            await self._writer.execute("PRAGMA optimize")
+            await self._writer.close()
+            self._writer = None
+        for reader in self._all_readers:
+            await reader.close()
+        self._all_readers = []
+        self._idle_readers = deque()
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        Borrows a read-only connection for the duration of the block.
+
+        Yields:
+        - aiosqlite.Connection: The borrowed connection.
+        """
+        contended = not self._idle_readers
+        start = time.perf_counter()
+        database = await self._acquire_reader()
+        self.reader_stats.record(time.perf_counter() - start, contended)
+        try:
+            yield database
+        finally:
+            self.reader_stats.in_use -= 1
+            self._release_reader(database)
+
+    async def _acquire_reader(self) -> aiosqlite.Connection:
+        """
+        Takes an idle reader connection, or waits in line for one to be released.
+
+        Returns:
+        - aiosqlite.Connection: The reader connection.
+        """
+        if self._idle_readers:
+            return self._idle_readers.popleft()
+        waiter = asyncio.get_running_loop().create_future()
+        self._reader_waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            # The connection may have been handed over just before the cancellation
+            if waiter.done() and not waiter.cancelled():
+                self._release_reader(waiter.result())
+            raise
+
+    def _release_reader(self, database: aiosqlite.Connection) -> None:
+        """
+        Hands a reader connection over to the longest waiting request, or marks it idle.
+
+        Parameters:
+        - database (aiosqlite.Connection): The released connection.
+        """
+        while self._reader_waiters:
+            waiter = self._reader_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(database)
+                return
+        self._idle_readers.append(database)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        Borrows the writer connection for the duration of the block.
+
+        Yields:
+        - aiosqlite.Connection: The writer connection.
+        """
+        contended = self._writer_lock.locked()
+        start = time.perf_counter()
+        async with self._writer_lock:
+            self.writer_stats.record(time.perf_counter() - start, contended)
+            try:
+                yield self._writer
+            finally:
+                self.writer_stats.in_use -= 1
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        Borrows the writer connection and wraps the block in a single transaction.
+
+        The transaction is committed when the block exits normally and rolled back
+        if it raises.
+
+        Yields:
+        - aiosqlite.Connection: The writer connection, inside an open transaction.
+        """
+        async with self.writer() as database:
+            await database.execute("BEGIN IMMEDIATE")
+            try:
+                yield database
+            except BaseException:
+                await database.execute("ROLLBACK")
+                raise
+            await database.execute("COMMIT")
+
+    async def submit(self, operation: WriteOperation) -> Any:
+        """
+        Executes a write operation through the group-commit writer.
+
+        Parameters:
+        - operation (WriteOperation): The coroutine function running the statements on the
+          writer connection. It must neither commit nor roll back.
+
+        Returns:
+        - The value returned by the operation, once committed.
+        """
+        return await self._group_writer.submit(operation)
+
+    def stats(self) -> dict:
+        """
+        Returns the usage statistics of the pool.
+
+        Returns:
+        - dict: The reader, writer and group-commit statistics.
+        """
+        return {
+            "database": self.db_name,
+            "readers": asdict(self.reader_stats),
+            "writer": asdict(self.writer_stats),
+            "group_commit": {**asdict(self._group_writer.stats),
+                             "queue_depth": self._group_writer.queue_depth()}
+            if self._group_writer is not None else None,
+        }
+
+
+_POOLS: Dict[str, ConnectionPool] = {}
+
+
+async def get_pool(db_name: str = DATABASE_PATH) -> ConnectionPool:
+    """
+    Returns the open pool of a database, opening it on first use.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - ConnectionPool: The pool of the database.
+    """
+    pool = _POOLS.get(db_name)
+    if pool is None:
+        pool = _POOLS[db_name] = ConnectionPool(db_name)
+    if not pool.is_open:
+        await pool.open()
+    return pool
+
+
+async def get_pools(db_name: str = DATABASE_PATH) -> List[ConnectionPool]:
+    """
+    Returns the open pools of every shard of a database, opening them on first use.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - list[ConnectionPool]: The pool of each shard.
+    """
+    return [await get_pool(shard) for shard in shards(db_name)]
+
+
+async def close_pools() -> None:
+    """
+    Closes every open pool.
+    """
+    while _POOLS:
+        _, pool = _POOLS.popitem()
+        await pool.close()
+
+
+def pool_stats() -> List[dict]:
+    """
+    Returns the usage statistics of every open pool.
+
+    Returns:
+    - list[dict]: The statistics of each pool.
+    """
+    return [pool.stats() for pool in _POOLS.values()]
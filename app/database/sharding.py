@@ -0,0 +1,195 @@
+"""
+Module containing the routing of devices to the shards of a database.
+
+SQLite allows a single writer per file, so a database can be split into several files,
+its shards, each holding a complete schema and its own writer. A device lives in a single
+shard, chosen from the integer encoding of its UUID (see `app.database.encoding`):
+- with the 'letter' key, by the letter of its UUID: each shard holds a contiguous range of
+  letters (one letter per shard with 26 shards), so that a listing in UUID order reads the
+  shards one after the other and a UUID prefix scan only reads the shard of its letter;
+- with the 'hash' key, by the identifier modulo the shard count, which spreads devices
+  evenly even when most of them share a letter, but makes listings read every shard.
+
+The shards of `/data/devices.db` are `/data/devices-00.db`, `/data/devices-01.db`, and so
+on. With a single shard, the database file itself is used.
+
+The layout must not change once devices are stored: devices are not moved between shards.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+from app.config import settings
+from app.database.encoding import LETTER_COUNT, SERIAL_RANGE, encode_uuid
+
+SHARD_KEYS = ("letter", "hash")
+
+Item = TypeVar("Item")
+
+
+@dataclass(frozen=True)
+class ShardLayout:
+    """
+    Represents how the devices of a database are split into shards.
+
+    Attributes:
+    - count (int): The number of shards, 1 to keep a single database file.
+    - key (str): How a device is assigned to a shard, 'letter' or 'hash'.
+    """
+    count: int = settings.shard_count
+    key: str = settings.shard_key
+
+    def __post_init__(self):
+        if self.count < 1:
+            raise ValueError(f"The shard count must be at least 1, not {self.count}")
+        if self.key not in SHARD_KEYS:
+            raise ValueError(f"The shard key must be one of {', '.join(SHARD_KEYS)}, "
+                             f"not {self.key!r}")
+        if self.key == "letter" and self.count > LETTER_COUNT:
+            raise ValueError(f"The letter shard key allows at most {LETTER_COUNT} shards, "
+                             f"not {self.count}")
+
+    @property
+    def ordered(self) -> bool:
+        """
+        Whether each shard holds a contiguous range of UUIDs, the shards following UUID order.
+        """
+        return self.key == "letter"
+
+    def index(self, device_id: int) -> int:
+        """
+        Returns the shard of a device.
+
+        Parameters:
+        - device_id (int): The integer encoding of the device UUID.
+
+        Returns:
+        - int: The index of the shard.
+        """
+        if self.key == "letter":
+            return device_id // SERIAL_RANGE * self.count // LETTER_COUNT
+        return device_id % self.count
+
+    def indexes_for_listing(self, prefix: Optional[str] = None,
+                            after: Optional[str] = None) -> List[int]:
+        """
+        Returns the shards that may hold devices of a listing.
+
+        Parameters:
+        - prefix (str, optional): Only devices whose UUID starts with this prefix are listed.
+        - after (str, optional): Only devices whose UUID sorts after this one are listed.
+
+        Returns:
+        - list[int]: The indexes of the shards, in ascending order.
+        """
+        if not self.ordered:
+            return list(range(self.count))
+        first, last = 0, self.count - 1
+        if prefix is not None and len(prefix) > 3:
+            first = last = self.index(encode_uuid(prefix[:4] + "0" * 6))
+        if after is not None:
+            first = max(first, self.index(encode_uuid(after)))
+        return list(range(first, last + 1))
+
+
+def shard_path(db_name: str, index: int, count: int) -> str:
+    """
+    Returns the file of a shard.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file.
+    - index (int): The index of the shard.
+    - count (int): The number of shards.
+
+    Returns:
+    - str: The name of the shard file, db_name itself if there is a single shard.
+    """
+    if count == 1:
+        return db_name
+    path = Path(db_name)
+    return str(path.with_name(f"{path.stem}-{index:0{len(str(count - 1))}d}{path.suffix}"))
+
+
+_LAYOUTS: Dict[str, ShardLayout] = {}
+
+
+def set_layout(db_name: str, layout: ShardLayout) -> None:
+    """
+    Sets the shard layout of a database.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file.
+    - layout (ShardLayout): The layout.
+    """
+    _LAYOUTS[db_name] = layout
+
+
+def get_layout(db_name: str) -> ShardLayout:
+    """
+    Returns the shard layout of a database.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file.
+
+    Returns:
+    - ShardLayout: The layout set up for the database, or the configured one.
+    """
+    layout = _LAYOUTS.get(db_name)
+    if layout is None:
+        layout = _LAYOUTS[db_name] = ShardLayout()
+    return layout
+
+
+def shards(db_name: str, prefix: Optional[str] = None,
+           after: Optional[str] = None) -> List[str]:
+    """
+    Returns the shard files of a database.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file.
+    - prefix (str, optional): Only the shards that may hold devices whose UUID starts with
+      this prefix are returned.
+    - after (str, optional): Only the shards that may hold devices whose UUID sorts after
+      this one are returned.
+
+    Returns:
+    - list[str]: The names of the shard files, in ascending order.
+    """
+    layout = get_layout(db_name)
+    return [shard_path(db_name, index, layout.count)
+            for index in layout.indexes_for_listing(prefix, after)]
+
+
+def shard_of(device_uuid: str, db_name: str) -> str:
+    """
+    Returns the shard file holding a device.
+
+    Parameters:
+    - device_uuid (str): The UUID of the device.
+    - db_name (str): The name of the SQLite database file.
+
+    Returns:
+    - str: The name of the shard file.
+    """
+    layout = get_layout(db_name)
+    if layout.count == 1:
+        return db_name
+    return shard_path(db_name, layout.index(encode_uuid(device_uuid)), layout.count)
+
+
+def group_by_shard(items: Iterable[Item], uuid_of: Callable[[Item], str],
+                   db_name: str) -> Dict[str, List[Item]]:
+    """
+    Groups items by the shard of their device, keeping their order within each shard.
+
+    Parameters:
+    - items (Iterable): The items, e.g. devices or UUIDs.
+    - uuid_of (Callable): Returns the device UUID of an item.
+    - db_name (str): The name of the SQLite database file.
+
+    Returns:
+    - dict[str, list]: The items of each shard file holding at least one of them.
+    """
+    groups: Dict[str, List[Item]] = {}
+    for item in items:
+        groups.setdefault(shard_of(uuid_of(item), db_name), []).append(item)
+    return groups
@@ -0,0 +1,92 @@
+"""
+Module containing the geometry helpers of the spatial device queries.
+
+Proximity queries first select candidates with the R*Tree index using a latitude and
+longitude bounding box, then compute the exact great-circle distance of each candidate.
+"""
+import math
+from typing import List, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+
+# (min_latitude, max_latitude, min_longitude, max_longitude)
+Box = Tuple[float, float, float, float]
+
+
+def haversine_km(latitude_1: float, longitude_1: float,
+                 latitude_2: float, longitude_2: float) -> float:
+    """
+    Computes the great-circle distance between two coordinates.
+
+    Parameters:
+    - latitude_1 (float): The latitude of the first coordinate, in decimal degrees.
+    - longitude_1 (float): The longitude of the first coordinate, in decimal degrees.
+    - latitude_2 (float): The latitude of the second coordinate, in decimal degrees.
+    - longitude_2 (float): The longitude of the second coordinate, in decimal degrees.
+
+    Returns:
+    - float: The distance in kilometers.
+    """
+    phi_1 = math.radians(latitude_1)
+    phi_2 = math.radians(latitude_2)
+    delta_phi = phi_2 - phi_1
+    delta_lambda = math.radians(longitude_2 - longitude_1)
+    chord = (math.sin(delta_phi / 2) ** 2
+             + math.cos(phi_1) * math.cos(phi_2) * math.sin(delta_lambda / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord)))
+
+
+def split_box(min_latitude: float, max_latitude: float,
+              min_longitude: float, max_longitude: float) -> List[Box]:
+    """
+    Splits a bounding box crossing the antimeridian into boxes the R*Tree can query.
+
+    A box crosses the antimeridian when its minimum longitude is greater than its maximum
+    longitude (e.g. from 170 to -170).
+
+    Parameters:
+    - min_latitude (float): The southern edge of the box.
+    - max_latitude (float): The northern edge of the box.
+    - min_longitude (float): The western edge of the box.
+    - max_longitude (float): The eastern edge of the box.
+
+    Returns:
+    - list[Box]: One box, or two when the antimeridian is crossed.
+    """
+    if min_longitude <= max_longitude:
+        return [(min_latitude, max_latitude, min_longitude, max_longitude)]
+    return [(min_latitude, max_latitude, min_longitude, 180.0),
+            (min_latitude, max_latitude, -180.0, max_longitude)]
+
+
+def radius_boxes(latitude: float, longitude: float, radius_km: float) -> List[Box]:
+    """
+    Computes the bounding boxes enclosing every coordinate within a radius of a point.
+
+    Parameters:
+    - latitude (float): The latitude of the center, in decimal degrees.
+    - longitude (float): The longitude of the center, in decimal degrees.
+    - radius_km (float): The radius in kilometers.
+
+    Returns:
+    - list[Box]: The boxes to query, two when the antimeridian is crossed.
+    """
+    angular_radius = radius_km / EARTH_RADIUS_KM
+    delta_latitude = math.degrees(angular_radius)
+    min_latitude = latitude - delta_latitude
+    max_latitude = latitude + delta_latitude
+
+    # Every longitude is within the radius once a pole is
+    if min_latitude <= -90 or max_latitude >= 90 or angular_radius >= math.pi / 2:
+        return [(max(min_latitude, -90.0), min(max_latitude, 90.0), -180.0, 180.0)]
+
+    delta_longitude = math.degrees(math.asin(math.sin(angular_radius)
+                                             / math.cos(math.radians(latitude))))
+    min_longitude = longitude - delta_longitude
+    max_longitude = longitude + delta_longitude
+    if min_longitude < -180:
+        min_longitude += 360
+    if max_longitude > 180:
+        max_longitude -= 360
+    return split_box(min_latitude, max_latitude, min_longitude, max_longitude)
@@ -2,38 +2,48 @@
 Module containing functions related to database setup.
 """
 import sqlite3
+from typing import List, Optional
+from app.config import settings
+from app.database.migrations import MigrationReport, run_migrations
+from app.database.sharding import ShardLayout, set_layout, shards
 
-DATABASE_PATH = "/data/devices.db"
+DATABASE_PATH = settings.database_path
 
 
-def setup_database(db_name=DATABASE_PATH):
+def setup_database(db_name=DATABASE_PATH,
+                   layout: Optional[ShardLayout] = None) -> List[MigrationReport]:
     """
     Sets up the device management database.
 
-    This function creates two tables: 'coordinates' and 'devices'.
+    This function brings the schema to its latest version by applying the pending
+    migrations of `app.database.migrations`, which create and evolve two tables:
+    'coordinates' and 'devices'.
     - The 'coordinates' table stores latitude and longitude values.
     - The 'devices' table stores device information, including UUID, deployment date, and owner.
 
+    The database is switched to WAL mode first so that migrations building indexes on an
+    existing database do not block its readers.
+
+    When the devices are split into shards, every shard file is set up, and the layout is
+    recorded for the operations of `app.database.operations.devices` to route devices.
+
     Parameters:
-    - db_name (str): The name of the SQLite database file. Default is '/data/devices.db'.
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH, i.e.
+      the EDGEMATRIX_DATABASE_PATH setting ('/data/devices.db' unless overridden).
+    - layout (ShardLayout, optional): The shard layout. Default is the one configured with
+      the EDGEMATRIX_SHARD_COUNT and EDGEMATRIX_SHARD_KEY settings.
+
+    Returns:
+    - list[MigrationReport]: The applied migrations along with their duration, for every
+      shard in turn.
     """
-    with sqlite3.connect(db_name) as database:
-        cursor = database.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS coordinates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                latitude REAL NOT NULL,
-                longitude REAL NOT NULL
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS devices (
-                device_uuid TEXT PRIMARY KEY,
-                localisation_id INTEGER,
-                deployment_date TEXT,
-                owner TEXT NOT NULL,
-                FOREIGN KEY (localisation_id) REFERENCES coordinates(id)
-            )
-        ''')
-        database.commit()
+    set_layout(db_name, layout if layout is not None else ShardLayout())
+    reports = []
+    for shard in shards(db_name):
+        database = sqlite3.connect(shard)
+        try:
+            database.execute("PRAGMA journal_mode = WAL")
+            reports += run_migrations(database)
+        finally:
+            database.close()
+    return reports
@@ -0,0 +1,215 @@
+"""
+Module containing the warm-up of the database after startup.
+
+A freshly started process serves its first requests from a cold device cache and, after a
+reboot, from a database file that is not in the operating system page cache yet, so every
+lookup waits on the disk. The warm-up runs in the background once the application has
+started, and the readiness endpoint reports the application ready only when it is done:
+- the tables and indexes of the devices and of their coordinates are read through once,
+  which brings their pages into the page cache shared by every connection (the device
+  history, only read by the history endpoint, is left out);
+- the devices that were the most recently used in the device cache when the application
+  last shut down, saved next to the database file, are read back into the cache.
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import List
+import aiosqlite
+from app.config import settings
+from app.database.startup import DATABASE_PATH
+from app.database.pool import get_pool
+from app.database.sharding import shards
+from app.database.cache import get_cache
+from app.database.operations.devices import get_devices
+from app.metrics import SQL_STATEMENT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_timed = SQL_STATEMENT_SECONDS.time
+
+# Tables read through by the warm-up, along with their indexes
+WARMUP_TABLES = ("devices", "coordinates", "coordinates_rtree_node",
+                 "coordinates_rtree_parent", "coordinates_rtree_rowid")
+
+# Number of hot devices read from the database per query
+PRELOAD_CHUNK_SIZE = 1_000
+
+INDEXES_SELECT = ("SELECT name, tbl_name FROM sqlite_master "
+                  "WHERE type = 'index' AND tbl_name IN "
+                  f"({', '.join('?' for _ in WARMUP_TABLES)}) ORDER BY name")
+
+
+@dataclass
+class WarmUp:
+    """
+    Represents the outcome of a warm-up.
+
+    Attributes:
+    - scanned (list[str]): The tables and indexes read through.
+    - preloaded_devices (int): Number of hot devices read into the device cache.
+    - seconds (float): The time taken by the warm-up.
+    """
+    scanned: List[str]
+    preloaded_devices: int = 0
+    seconds: float = 0.0
+
+
+def hot_devices_path(db_name: str = DATABASE_PATH) -> str:
+    """
+    Returns the path of the file listing the hot devices of a database.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - str: The path, next to the database file.
+    """
+    return f"{db_name}.hot"
+
+
+def save_hot_devices(limit: int = settings.warmup_devices,
+                     db_name: str = DATABASE_PATH) -> int:
+    """
+    Saves the UUIDs of the most recently used devices of the device cache, for the next
+    warm-up to preload them.
+
+    Parameters:
+    - limit (int): The maximum number of devices saved (0 saves none).
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - int: The number of saved devices.
+    """
+    if limit <= 0:
+        return 0
+    device_uuids = get_cache(db_name).hot_keys(limit)
+    path = hot_devices_path(db_name)
+    with open(f"{path}.partial", "w", encoding="utf-8") as output:
+        output.writelines(f"{device_uuid}\n" for device_uuid in device_uuids)
+    os.replace(f"{path}.partial", path)
+    return len(device_uuids)
+
+
+async def _scan(statement: str, db_name: str) -> None:
+    """
+    Reads through a table or an index of a shard.
+
+    Parameters:
+    - statement (str): The query reading every page of the table or index.
+    - db_name (str): The name of the shard file.
+    """
+    pool = await get_pool(db_name)
+    async with pool.reader() as database:
+        with _timed("warm_up"):
+            async with database.execute(statement) as cursor:
+                await cursor.fetchall()
+
+
+async def _index_statements(database: aiosqlite.Connection) -> List[tuple]:
+    """
+    Returns the queries reading through the indexes of the warmed up tables.
+
+    `count(*)` is answered from the smallest index whatever the INDEXED BY clause, so each
+    index is read by counting its first column, which is covered by the index.
+
+    Parameters:
+    - database (aiosqlite.Connection): A connection to the shard.
+
+    Returns:
+    - list[tuple]: The name of each index and its query.
+    """
+    async with database.execute(INDEXES_SELECT, WARMUP_TABLES) as cursor:
+        indexes = await cursor.fetchall()
+    statements = []
+    for index, table in indexes:
+        async with database.execute(f'PRAGMA index_info("{index}")') as cursor:
+            columns = await cursor.fetchall()
+        if columns and columns[0][2] is not None:
+            statements.append((index, f'SELECT count("{columns[0][2]}") FROM "{table}" '
+                                      f'INDEXED BY "{index}"'))
+    return statements
+
+
+async def page_in(db_name: str = DATABASE_PATH) -> List[str]:
+    """
+    Reads through the tables and indexes of the devices and of their coordinates.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - list[str]: The tables and indexes read through.
+    """
+    scanned = []
+    for shard in shards(db_name):
+        pool = await get_pool(shard)
+        async with pool.reader() as database:
+            statements = await _index_statements(database)
+        statements += [(table, f'SELECT count(*) FROM "{table}" NOT INDEXED')
+                       for table in WARMUP_TABLES]
+        for name, statement in statements:
+            await _scan(statement, shard)
+            scanned.append(name)
+    return scanned
+
+
+async def preload_hot_devices(db_name: str = DATABASE_PATH) -> int:
+    """
+    Reads the devices saved by `save_hot_devices` into the device cache.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - int: The number of devices read into the cache, 0 if none was saved.
+    """
+    path = hot_devices_path(db_name)
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as saved:
+        device_uuids = saved.read().split()
+    preloaded = 0
+    # The least recently used devices are read first, so that the cache ends up in the
+    # order it was saved in
+    device_uuids.reverse()
+    for start in range(0, len(device_uuids), PRELOAD_CHUNK_SIZE):
+        found = await get_devices(device_uuids[start:start + PRELOAD_CHUNK_SIZE], db_name)
+        preloaded += sum(device is not None for device in found.values())
+    return preloaded
+
+
+async def warm_up(db_name: str = DATABASE_PATH) -> WarmUp:
+    """
+    Brings the database into the page cache, then preloads the hot devices.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+
+    Returns:
+    - WarmUp: The tables and indexes read through and the number of preloaded devices.
+    """
+    start = time.perf_counter()
+    outcome = WarmUp(scanned=await page_in(db_name),
+                     preloaded_devices=await preload_hot_devices(db_name))
+    outcome.seconds = time.perf_counter() - start
+    return outcome
+
+
+async def run_warm_up(db_name: str = DATABASE_PATH) -> None:
+    """
+    Warms the database up, logging the outcome instead of raising, since the application
+    can serve requests without it.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file. Default is DATABASE_PATH.
+    """
+    try:
+        outcome = await warm_up(db_name)
+    except Exception:  # pylint: disable=broad-exception-caught
+        logger.exception("Failed to warm the database up")
+        return
+    logger.info("Warmed the database up in %.3fs: %d tables and indexes read, "
+                "%d devices preloaded", outcome.seconds, len(outcome.scanned),
+                outcome.preloaded_devices)
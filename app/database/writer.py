@@ -0,0 +1,203 @@
+"""
+Module containing the group-commit writer of a database.
+
+SQLite allows a single writer, so instead of having each request wait for the write lock
+and commit on its own, write operations are submitted to a queue drained by a dedicated
+task. The task runs every queued operation within one transaction, each under its own
+savepoint so that a failing operation does not abort the others, and commits once.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, List, Optional, Tuple
+import aiosqlite
+from app.config import settings
+
+if TYPE_CHECKING:
+    from app.database.pool import ConnectionPool
+
+WriteOperation = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+@dataclass
+class WriterStats:
+    """
+    Represents the counters of a group-commit writer.
+
+    Attributes:
+    - operations (int): Number of operations executed.
+    - failed_operations (int): Number of operations that raised and were rolled back.
+    - batches (int): Number of transactions committed.
+    - max_batch_size (int): Largest number of operations committed together.
+    """
+    operations: int = 0
+    failed_operations: int = 0
+    batches: int = 0
+    max_batch_size: int = 0
+
+
+class GroupCommitWriter:
+    """
+    Represents the task executing the write operations of a database in batches.
+
+    Attributes:
+    - batch_size (int): Maximum number of operations committed together.
+    - max_latency (float): Time, in seconds, the task waits for more operations once a first
+      one is queued and the batch is not full. The task only waits when the previous batch
+      held several operations.
+    """
+
+    def __init__(self, pool: "ConnectionPool", batch_size: int = settings.writer_batch_size,
+                 max_latency_ms: float = settings.writer_max_latency_ms,
+                 queue_size: int = settings.writer_queue_size):
+        self.pool = pool
+        self.batch_size = max(1, batch_size)
+        self.max_latency = max_latency_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._last_batch_size = 0
+        self.stats = WriterStats()
+
+    def start(self) -> None:
+        """
+        Starts the writer task.
+        """
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Executes the queued operations, then stops the writer task.
+        """
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, operation: WriteOperation) -> Any:
+        """
+        Queues a write operation and waits until it is committed.
+
+        The operation receives the writer connection, inside a transaction, and must not
+        commit nor roll back. If it raises, its statements are rolled back and the
+        exception is raised here.
+
+        Parameters:
+        - operation (WriteOperation): The coroutine function running the statements.
+
+        Returns:
+        - The value returned by the operation, once committed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operation, future))
+        return await future
+
+    def queue_depth(self) -> int:
+        """
+        Returns the number of operations waiting to be executed.
+
+        Returns:
+        - int: The queue depth.
+        """
+        return self._queue.qsize()
+
+    async def _run(self) -> None:
+        """
+        Drains the queue into transactions until stopped.
+        """
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await self._commit(batch)
+
+    async def _next_batch(self) -> Tuple[List[Tuple[WriteOperation, asyncio.Future]], bool]:
+        """
+        Waits for a first operation, then gathers the following ones into a batch.
+
+        Returns:
+        - tuple: The batch, and whether the writer was asked to stop.
+        """
+        batch = []
+        item = await self._queue.get()
+        loop = asyncio.get_running_loop()
+        # Lingering only pays off when writes are concurrent: a lone writer awaiting each
+        # commit before submitting the next operation would only be slowed down
+        linger = self.max_latency if self._last_batch_size > 1 else 0
+        deadline = loop.time() + linger
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, False
+            if self._queue.empty():
+                # Linger once for the rest of the window, then take whatever arrived
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    return batch, False
+                await asyncio.sleep(timeout)
+                if self._queue.empty():
+                    return batch, False
+            item = self._queue.get_nowait()
+        return batch, True
+
+    async def _commit(self, batch: List[Tuple[WriteOperation, asyncio.Future]]) -> None:
+        """
+        Executes a batch of operations within a single transaction.
+
+        Parameters:
+        - batch (list): The operations along with the futures awaiting their outcome.
+        """
+        outcomes = []
+        try:
+            async with self.pool.writer() as database:
+                await database.execute("BEGIN IMMEDIATE")
+                try:
+                    for operation, future in batch:
+                        if future.cancelled():
+                            continue
+                        outcomes.append((future, *await self._execute(database, operation)))
+                    await database.execute("COMMIT")
+                except BaseException:
+                    await database.execute("ROLLBACK")
+                    raise
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            # The whole transaction was lost, every operation of the batch failed with it
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        self._last_batch_size = len(outcomes)
+        self.stats.batches += 1
+        self.stats.max_batch_size = max(self.stats.max_batch_size, len(outcomes))
+        for future, result, error in outcomes:
+            self.stats.operations += 1
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                self.stats.failed_operations += 1
+                future.set_exception(error)
+
+    @staticmethod
+    async def _execute(database: aiosqlite.Connection,
+                       operation: WriteOperation) -> Tuple[Any, Optional[Exception]]:
+        """
+        Executes one operation under a savepoint.
+
+        Parameters:
+        - database (aiosqlite.Connection): The writer connection, inside a transaction.
+        - operation (WriteOperation): The operation.
+
+        Returns:
+        - tuple: The result of the operation, and the exception it raised if any.
+        """
+        await database.execute("SAVEPOINT operation")
+        try:
+            result = await operation(database)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            await database.execute("ROLLBACK TO operation")
+            await database.execute("RELEASE operation")
+            return None, error
+        await database.execute("RELEASE operation")
+        return result, None
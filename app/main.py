@@ -2,13 +2,73 @@
 Module containing the setup for the FastAPI application.
 """
 
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
+from app.config import settings
 from app.database.startup import setup_database
-from app.api.routers import devices
+from app.database.pool import get_pools, close_pools
+from app.database.cache import clear_caches
+from app.database.backend import configure_backend
+from app.database.memory import MemoryEngine, run_snapshots
+from app.database.operations.history import run_history_compaction
+from app.database.operations.storage import run_storage_maintenance
+from app.database.warmup import run_warm_up, save_hot_devices
+from app.api.admission import AdmissionMiddleware
+from app.api.middleware import MetricsMiddleware
+from app.api.responses import ORJSONResponse
+from app.api.routers import admin, devices, health, metrics
 
-setup_database()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """
+    Sets up the database and opens its connection pools and storage backend, then starts
+    the history compaction on startup, with the warm-up and the storage maintenance of the
+    SQLite database, or the snapshots of the devices stored in memory. On shutdown, stops
+    them, closes the storage backend, saves the hot devices for the next warm-up and drops
+    the device cache.
+
+    The migrations use blocking sqlite3 calls, so they run in a worker thread rather than
+    on the event loop, and only when the application starts instead of on import.
+    """
+    await asyncio.to_thread(setup_database)
+    await get_pools()
+    backend = configure_backend()
+    if backend is not None:
+        await backend.open()
+    tasks = []
+    _app.state.warm_up = None
+    if settings.history_compaction_interval_seconds > 0:
+        tasks.append(asyncio.create_task(run_history_compaction()))
+    if backend is None:
+        if settings.warmup:
+            _app.state.warm_up = asyncio.create_task(run_warm_up())
+            tasks.append(_app.state.warm_up)
+        if settings.storage_maintenance_interval_seconds > 0:
+            tasks.append(asyncio.create_task(run_storage_maintenance()))
+    elif isinstance(backend, MemoryEngine) and settings.memory_snapshot_interval_seconds > 0:
+        tasks.append(asyncio.create_task(run_snapshots()))
+    yield
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    if backend is not None:
+        await backend.close()
+    else:
+        save_hot_devices()
+    await close_pools()
+    clear_caches()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+# The metrics middleware is added last to run first, and count the shed requests too
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # Include the API routers
 app.include_router(devices.router, prefix="/devices", tags=["devices"])
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
+app.include_router(metrics.router, tags=["monitoring"])
+app.include_router(health.router, tags=["monitoring"])
@@ -0,0 +1,257 @@
+"""
+Module containing the application metrics, exposed in the Prometheus text format.
+
+Metrics are plain in-process counters updated on the hot path without locking, since the
+application runs on a single event loop, and are only formatted when scraped.
+"""
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# Latency buckets, in seconds, from a cached read to a large bulk insertion
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    """
+    Escapes a label value for the Prometheus text format.
+
+    Parameters:
+    - value (str): The label value.
+
+    Returns:
+    - str: The escaped value.
+    """
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    """
+    Formats the labels of a sample.
+
+    Parameters:
+    - names (Sequence[str]): The label names.
+    - values (tuple[str, ...]): The label values.
+    - extra (str): An already formatted label appended to the others, e.g. the 'le' label.
+
+    Returns:
+    - str: The labels between braces, or an empty string if there are none.
+    """
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """
+    Represents a metric family, with one sample per combination of label values.
+
+    Attributes:
+    - name (str): The metric name.
+    - documentation (str): The help text of the metric.
+    - label_names (tuple[str, ...]): The names of the labels of the metric.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+
+    def samples(self) -> List[str]:
+        """
+        Formats the samples of the metric.
+
+        Returns:
+        - list[str]: One line per sample.
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        Formats the metric in the Prometheus text format.
+
+        Returns:
+        - str: The HELP and TYPE lines followed by the samples.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += self.samples()
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """
+    Represents a value that only increases, such as a number of requests.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        """
+        Increments the value of a sample.
+
+        Parameters:
+        - label_values (str): The values of the labels, in the order of their names.
+        - amount (float): The increment. Default is 1.
+        """
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        """
+        Returns the value of a sample.
+
+        Parameters:
+        - label_values (str): The values of the labels, in the order of their names.
+
+        Returns:
+        - float: The value, 0 if the sample was never incremented.
+        """
+        return self._values.get(label_values, 0.0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, values)} {value}"
+                for values, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """
+    Represents a value that goes up and down, such as a number of requests in progress.
+    """
+    kind = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1.0) -> None:
+        """
+        Decrements the value of a sample.
+
+        Parameters:
+        - label_values (str): The values of the labels, in the order of their names.
+        - amount (float): The decrement. Default is 1.
+        """
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value: float, *label_values: str) -> None:
+        """
+        Sets the value of a sample.
+
+        Parameters:
+        - value (float): The new value.
+        - label_values (str): The values of the labels, in the order of their names.
+        """
+        self._values[label_values] = value
+
+
+class Histogram(Metric):
+    """
+    Represents a distribution of observed values, such as latencies, in buckets.
+
+    Attributes:
+    - buckets (tuple[float, ...]): The upper bounds of the buckets, in ascending order.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+        # Per sample: the count of each bucket (not cumulated, plus +Inf), and the sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """
+        Records an observed value.
+
+        Parameters:
+        - value (float): The observed value.
+        - label_values (str): The values of the labels, in the order of their names.
+        """
+        sample = self._values.get(label_values)
+        if sample is None:
+            sample = self._values[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+        sample[0][bisect.bisect_left(self.buckets, value)] += 1
+        sample[1][0] += value
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        """
+        Observes the duration of the block, in seconds.
+
+        Parameters:
+        - label_values (str): The values of the labels, in the order of their names.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def count(self, *label_values: str) -> int:
+        """
+        Returns the number of observed values of a sample.
+
+        Parameters:
+        - label_values (str): The values of the labels, in the order of their names.
+
+        Returns:
+        - int: The number of observations.
+        """
+        sample = self._values.get(label_values)
+        return sum(sample[0]) if sample is not None else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for values, (counts, total) in sorted(self._values.items()):
+            cumulated = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulated += count
+                bound_text = "+Inf" if bound == float("inf") else str(bound)
+                bound_label = f'le="{bound_text}"'
+                lines.append(f"{self.name}_bucket"
+                             f"{_labels(self.label_names, values, bound_label)} {cumulated}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, values)} {total[0]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, values)} {cumulated}")
+        return lines
+
+
+HTTP_REQUESTS = Counter("edgematrix_http_requests_total",
+                        "Number of HTTP requests handled.", ("method", "handler", "status"))
+HTTP_REQUEST_SECONDS = Histogram("edgematrix_http_request_duration_seconds",
+                                 "Time taken to handle HTTP requests.", ("method", "handler"))
+HTTP_REQUESTS_IN_FLIGHT = Gauge("edgematrix_http_requests_in_flight",
+                                "Number of HTTP requests being handled.")
+SQL_STATEMENT_SECONDS = Histogram("edgematrix_sql_statement_duration_seconds",
+                                  "Time taken to run SQL statements, including the wait "
+                                  "for a connection thread.", ("operation",))
+SLOW_REQUESTS = Counter("edgematrix_slow_requests_total",
+                        "Number of sampled HTTP requests slower than the profiling threshold.")
+
+ADMISSION_LIMIT = Gauge("edgematrix_admission_limit",
+                        "Number of device requests of a kind handled concurrently at most.",
+                        ("kind",))
+ADMISSION_QUEUE_DEPTH = Gauge("edgematrix_admission_queue_depth",
+                              "Number of device requests of a kind waiting to be handled.",
+                              ("kind",))
+ADMISSION_SHED = Counter("edgematrix_admission_shed_total",
+                         "Number of device requests answered 503 by the admission control.",
+                         ("kind", "reason"))
+
+REGISTRY: List[Metric] = [HTTP_REQUESTS, HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_FLIGHT,
+                          SQL_STATEMENT_SECONDS, SLOW_REQUESTS, ADMISSION_LIMIT,
+                          ADMISSION_QUEUE_DEPTH, ADMISSION_SHED]
+
+
+def render_metrics() -> str:
+    """
+    Formats every registered metric in the Prometheus text format.
+
+    Returns:
+    - str: The metrics exposition.
+    """
+    return "".join(metric.render() for metric in REGISTRY)
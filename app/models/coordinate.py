@@ -20,8 +20,8 @@ class Coordinate(BaseModel):
                              description="Longitude in decimal degrees. "
                                          "Must be between -180 and 180.")
 
-    @classmethod
     @field_validator('latitude')
+    @classmethod
     def validate_latitude(cls, value: float) -> float:
         """
         Validates the latitude value to ensure it falls within the range of -90 to 90 degrees.
@@ -39,8 +39,8 @@ class Coordinate(BaseModel):
             raise ValueError("Latitude must be between -90 and 90 degrees")
         return value
 
-    @classmethod
     @field_validator('longitude')
+    @classmethod
     def validate_longitude(cls, value: float) -> float:
         """
         Validates the longitude value to ensure it falls within the range of -180 to 180 degrees.
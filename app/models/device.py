@@ -2,10 +2,11 @@
 Module containing the Device model definition.
 """
 
-from typing import ClassVar
-from datetime import date
+from typing import Annotated, Any, ClassVar, List, Optional
+from datetime import date, datetime
+from enum import Enum
 import re
-from pydantic import BaseModel, Field, field_validator, EmailStr
+from pydantic import BaseModel, Field, field_validator, model_validator, EmailStr
 from app.models.coordinate import Coordinate
 
 
@@ -38,8 +39,8 @@ class Device(BaseModel):
     owner: EmailStr = Field(default=...,
                             description="The email address of the owner of the device")
 
-    @classmethod
     @field_validator('device_uuid')
+    @classmethod
     def name_must_be_uuid_format(cls, uuid: str) -> str:
         """
         Validates the format of the device UUID.
@@ -93,3 +94,388 @@ class DeviceDeletionResponse(BaseModel):
     Represents a response indicating that the device was successfully deleted.
     """
     message: str = "Device successfully deleted"
+
+
+class BulkItemStatus(str, Enum):
+    """
+    Represents the outcome of one item of a bulk device ingestion.
+    """
+    CREATED = "created"
+    CONFLICT = "conflict"
+    INVALID = "invalid"
+
+
+class BulkItemResult(BaseModel):
+    """
+    Represents the outcome of one item of a bulk device ingestion.
+
+    Attributes:
+    - index (int): The position of the item in the request body.
+    - device_uuid (str, optional): The UUID of the device, when one could be read.
+    - status (BulkItemStatus): Whether the device was created, already existed or was invalid.
+    - detail (list, optional): The validation errors of an invalid item.
+    """
+    index: int
+    device_uuid: Optional[str] = None
+    status: BulkItemStatus
+    detail: Optional[List[Any]] = None
+
+
+class BulkIngestResponse(BaseModel):
+    """
+    Represents the response of a bulk device ingestion.
+
+    Attributes:
+    - created (int): Number of devices created.
+    - conflicts (int): Number of devices that already existed.
+    - invalid (int): Number of items that failed validation.
+    - results (list[BulkItemResult]): The outcome of each item, in request order.
+    """
+    created: int = 0
+    conflicts: int = 0
+    invalid: int = 0
+    results: List[BulkItemResult] = []
+
+
+class InvalidBulkPayloadResponse(BaseModel):
+    """
+    Represents a response indicating that a bulk request body could not be parsed.
+    """
+    message: str = "Request body must be a JSON array or NDJSON stream of devices"
+
+
+class BulkPayloadTooLargeResponse(BaseModel):
+    """
+    Represents a response indicating that a bulk request holds too many items.
+    """
+    message: str = "Too many devices in a single bulk request"
+
+
+class ServiceOverloadedResponse(BaseModel):
+    """
+    Represents a response indicating that a request was shed by the admission control.
+    """
+    message: str = "Too many requests are waiting, retry after the delay advised"
+
+
+class DevicePage(BaseModel):
+    """
+    Represents a page of devices ordered by UUID.
+
+    Attributes:
+    - items (list[Device]): The devices of the page.
+    - next_cursor (str, optional): The cursor of the next page, or None on the last page.
+    """
+    items: List[Device] = []
+    next_cursor: Optional[str] = None
+
+
+class ListingFormat(str, Enum):
+    """
+    Represents the output format of a device listing.
+    """
+    JSON = "json"
+    NDJSON = "ndjson"
+
+
+class ExportFormat(str, Enum):
+    """
+    Represents the output format of a device export.
+    """
+    NDJSON = "ndjson"
+    CSV = "csv"
+    ARROW = "arrow"
+    PARQUET = "parquet"
+
+
+class ExportFormatUnavailableResponse(BaseModel):
+    """
+    Represents a response indicating that an export format is not available.
+    """
+    message: str = "This export format requires the pyarrow package"
+
+
+class DeviceList(BaseModel):
+    """
+    Represents a list of devices.
+
+    Attributes:
+    - items (list[Device]): The devices.
+    """
+    items: List[Device] = []
+
+
+class NearbyDevice(Device):
+    """
+    Represents a device along with its distance from a point.
+
+    Attributes:
+    - distance_km (float): The great-circle distance between the device and the point,
+      in kilometers.
+    """
+    distance_km: float = Field(default=...,
+                               description="The distance from the queried point in kilometers")
+
+
+class NearbyDeviceList(BaseModel):
+    """
+    Represents a list of devices ordered by distance from a point.
+
+    Attributes:
+    - items (list[NearbyDevice]): The devices, closest first.
+    """
+    items: List[NearbyDevice] = []
+
+
+class InvalidBoundingBoxResponse(BaseModel):
+    """
+    Represents a response indicating that a bounding box is invalid.
+    """
+    message: str = "min_latitude must not be greater than max_latitude"
+
+
+class DeviceBatchGetRequest(BaseModel):
+    """
+    Represents a request for several devices at once.
+
+    Attributes:
+    - device_uuids (list[str]): The UUIDs of the devices, at most MAX_ITEMS of them.
+    """
+    MAX_ITEMS: ClassVar[int] = 1000
+
+    device_uuids: List[Annotated[str, Field(pattern=Device.UUID_REGEX_PATTERN)]] = Field(
+        default=..., max_length=MAX_ITEMS,
+        description="The UUIDs of the devices to read (e.g., DEVX000001)")
+
+
+class DeviceBatchGetResponse(BaseModel):
+    """
+    Represents the devices found for a batch request.
+
+    Attributes:
+    - items (list[Device]): The devices found, in request order.
+    - missing (list[str]): The requested UUIDs with no device, in request order.
+    """
+    items: List[Device] = []
+    missing: List[str] = []
+
+
+class DeviceVersion(BaseModel):
+    """
+    Represents a version of a device recorded in its history.
+
+    Attributes:
+    - recorded_at (datetime): When the version was written, in UTC.
+    - localisation (Coordinate): Geographical location of the device as coordinates.
+    - deployment_date (date): The deployment date of the device.
+    - owner (str): The email address of the owner of the device.
+    """
+    recorded_at: datetime
+    localisation: Optional[Coordinate] = None
+    deployment_date: Optional[date] = None
+    owner: str
+
+
+class DeviceHistory(BaseModel):
+    """
+    Represents the versions of a device recorded within a time range.
+
+    Attributes:
+    - device_uuid (str): The UUID of the device.
+    - items (list[DeviceVersion]): The versions, oldest first.
+    """
+    device_uuid: str
+    items: List[DeviceVersion] = []
+
+
+class DevicePatch(BaseModel):
+    """
+    Represents a partial update of a device: only the supplied fields are changed.
+
+    Attributes:
+    - localisation (Coordinate, optional): The new location of the device.
+    - deployment_date (date, optional): The new deployment date, null to clear it.
+    - owner (EmailStr, optional): The email address of the new owner of the device.
+    """
+    localisation: Optional[Coordinate] = Field(default=None,
+                                               description="The new geographical location "
+                                                           "of the device")
+    deployment_date: Optional[date] = Field(default=None,
+                                            description="The new deployment date of the "
+                                                        "device in the format YYYY-MM-DD, "
+                                                        "or null to clear it")
+    owner: Optional[EmailStr] = Field(default=None,
+                                      description="The email address of the new owner of "
+                                                  "the device")
+
+    @model_validator(mode="after")
+    def must_change_a_field(self) -> "DevicePatch":
+        """
+        Validates that the patch changes at least one field, and does not clear a
+        required one.
+
+        Returns:
+        - DevicePatch: The validated patch.
+
+        Raises:
+        - ValueError: If no field is supplied, or localisation or owner is null.
+        """
+        if not self.model_fields_set:
+            raise ValueError("At least one of localisation, deployment_date and owner "
+                             "must be supplied.")
+        for field in ("localisation", "owner"):
+            if field in self.model_fields_set and getattr(self, field) is None:
+                raise ValueError(f"{field} cannot be null.")
+        return self
+
+    model_config = {
+        "extra": "forbid",
+        "json_schema_extra": {
+            "example": {
+                "owner": "new_owner@edgematrix.com"
+            }
+        }
+    }
+
+
+class DevicePatchFilter(BaseModel):
+    """
+    Represents the devices a bulk patch applies to, with the filters of the listing.
+
+    Attributes:
+    - owner (str, optional): Only the devices of this owner are patched.
+    - deployed_from (date, optional): Only devices deployed on or after this date are patched.
+    - deployed_to (date, optional): Only devices deployed on or before this date are patched.
+    - prefix (str, optional): Only devices whose UUID starts with this prefix are patched.
+    """
+    owner: Optional[str] = None
+    deployed_from: Optional[date] = None
+    deployed_to: Optional[date] = None
+    prefix: Optional[str] = Field(default=None, pattern=r'^DEV([A-Z]\d{0,6})?$',
+                                  description="A UUID prefix (e.g., DEVX00)")
+
+    @model_validator(mode="after")
+    def must_filter(self) -> "DevicePatchFilter":
+        """
+        Validates that the filter restricts the patched devices, so that a missing filter
+        does not patch the whole fleet.
+
+        Returns:
+        - DevicePatchFilter: The validated filter.
+
+        Raises:
+        - ValueError: If no filter is supplied.
+        """
+        if all(value is None for value in (self.owner, self.deployed_from,
+                                           self.deployed_to, self.prefix)):
+            raise ValueError("At least one of owner, deployed_from, deployed_to and prefix "
+                             "must be supplied.")
+        return self
+
+    model_config = {"extra": "forbid"}
+
+
+class DeviceBulkPatchRequest(BaseModel):
+    """
+    Represents a patch applied to every device matching a filter.
+
+    Attributes:
+    - filter (DevicePatchFilter): The devices the patch applies to.
+    - patch (DevicePatch): The fields changed on each of them.
+    """
+    filter: DevicePatchFilter
+    patch: DevicePatch
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "filter": {"owner": "site_manager@edgematrix.com", "prefix": "DEVX"},
+                "patch": {"owner": "new_site_manager@edgematrix.com"}
+            }
+        }
+    }
+
+
+class DeviceBulkPatchResponse(BaseModel):
+    """
+    Represents the outcome of a bulk patch.
+
+    Attributes:
+    - updated (int): Number of devices patched.
+    """
+    updated: int = 0
+
+
+class OwnerCount(BaseModel):
+    """
+    Represents the number of devices of an owner.
+
+    Attributes:
+    - owner (str): The email address of the owner.
+    - devices (int): Number of devices of the owner.
+    """
+    owner: str
+    devices: int
+
+
+class OwnerCountList(BaseModel):
+    """
+    Represents the number of devices of each owner.
+
+    Attributes:
+    - items (list[OwnerCount]): The owners with a device, ordered by owner.
+    """
+    items: List[OwnerCount] = []
+
+
+class MonthCount(BaseModel):
+    """
+    Represents the number of devices deployed in a month.
+
+    Attributes:
+    - month (str): The deployment month, in the format YYYY-MM, or None for the devices
+      without a deployment date.
+    - devices (int): Number of devices deployed in the month.
+    """
+    month: Optional[str] = Field(default=None, examples=["2024-03"])
+    devices: int
+
+
+class MonthCountList(BaseModel):
+    """
+    Represents the number of devices deployed each month.
+
+    Attributes:
+    - items (list[MonthCount]): The months with a deployed device, ordered by month, then
+      the devices without a deployment date.
+    """
+    items: List[MonthCount] = []
+
+
+class GridCellCount(BaseModel):
+    """
+    Represents the number of devices located in a cell of a grid.
+
+    Attributes:
+    - latitude (float): The latitude of the south-west corner of the cell.
+    - longitude (float): The longitude of the south-west corner of the cell.
+    - size_degrees (float): The span of the cell in latitude and longitude.
+    - devices (int): Number of devices located in the cell.
+    """
+    latitude: float
+    longitude: float
+    size_degrees: float
+    devices: int
+
+
+class GridCellCountList(BaseModel):
+    """
+    Represents the number of devices located in each cell of a grid.
+
+    Attributes:
+    - precision (int): The precision of the grid, of cells spanning 10^-precision degrees.
+    - items (list[GridCellCount]): The cells with a device, ordered by latitude then
+      longitude.
+    """
+    precision: int
+    items: List[GridCellCount] = []
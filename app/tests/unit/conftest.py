@@ -0,0 +1,30 @@
+"""
+Module containing the fixtures shared by the unit tests.
+"""
+
+import asyncio
+import pytest
+
+from app.database.backend import set_backend
+from app.database.memory import MemoryEngine
+from app.database.startup import DATABASE_PATH
+
+
+@pytest.fixture(scope="module", params=["sqlite", "memory"])
+def storage_backend(request, tmp_path_factory):
+    """
+    Runs the tests of a module against each storage backend of the devices. The tests of a
+    module share the devices they store, as they do in the SQLite database.
+    """
+    if request.param == "sqlite":
+        yield request.param
+        return
+    # Registered under the database of the API, so that it publishes to its change feed
+    engine = MemoryEngine(DATABASE_PATH,
+                          str(tmp_path_factory.mktemp("memory") / "devices.db"))
+    set_backend(DATABASE_PATH, engine)
+    try:
+        yield request.param
+    finally:
+        set_backend(DATABASE_PATH, None)
+        asyncio.run(engine.close())
@@ -0,0 +1,107 @@
+"""
+Module containing unit tests for the admission control of the device API.
+"""
+
+import asyncio
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+from app.api.admission import AdmissionLimiter, AdmissionMiddleware, RequestShedError
+
+
+def test_limiter_queue():
+    """
+    Test that requests beyond the limit wait in line until the queue is full, or their
+    wait would exceed the deadline.
+    """
+    async def scenario():
+        limiter = AdmissionLimiter("write", 1, queue_size=1, deadline_ms=100)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        queued = limiter.queued
+        full = late = timed_out = None
+        try:
+            await limiter.acquire()
+        except RequestShedError as error:
+            full = error.reason
+        limiter.release(0.5)
+        await waiting
+        admitted = limiter.in_flight
+        try:
+            await limiter.acquire()
+        except RequestShedError as error:
+            late = (error.reason, error.retry_after)
+        limiter.latency_seconds = 0.01
+        try:
+            await limiter.acquire()
+        except RequestShedError as error:
+            timed_out = error.reason
+        return queued, full, admitted, late, timed_out, limiter.snapshot()
+
+    queued, full, admitted, late, timed_out, snapshot = asyncio.run(scenario())
+
+    assert queued == 1  # Check the second request waited in line
+    assert full == "queue_full"  # Check a request beyond the queue was shed
+    assert admitted == 1  # Check the waiting request took the released turn
+    assert late == ("deadline", 1)  # Check a request that would wait too long was shed
+    assert timed_out == "timeout"  # Check a request waiting past the deadline was shed
+    assert (snapshot["admitted"], snapshot["waited"], snapshot["shed_queue_full"],
+            snapshot["shed_deadline"], snapshot["shed_timeout"], snapshot["queued"]
+            ) == (2, 1, 1, 1, 1, 0)  # Check the counters
+
+
+def test_adaptive_limit():
+    """
+    Test that the adaptive limit decreases when the latency exceeds the target, and grows
+    back while requests wait, up to the configured limit.
+    """
+    async def scenario():
+        limiter = AdmissionLimiter("read", 4, deadline_ms=1000, adaptive=True,
+                                   target_latency_ms=10)
+        limits = []
+        for latency in (0.05, 0.001):
+            # A round of as many requests as the limit, while another one waits
+            admitted = limiter.limit
+            for _ in range(admitted):
+                await limiter.acquire()
+            waiting = asyncio.create_task(limiter.acquire())
+            await asyncio.sleep(0)
+            for _ in range(admitted):
+                limiter.release(latency)
+            await waiting
+            limiter.release(None)
+            limits.append(limiter.limit)
+        return limits
+
+    assert asyncio.run(scenario()) == [3, 4]  # Check the decrease, then the increase
+
+
+def test_shed_response():
+    """
+    Test that a request shed by the admission control is answered 503 with Retry-After,
+    and that the statistics are served.
+    """
+    writes = AdmissionLimiter("write", 1, queue_size=0)
+    asyncio.run(writes.acquire())
+    with TestClient(AdmissionMiddleware(app, writes=writes)) as client:
+        shed = client.delete("/devices/DEVX999999")
+        read = client.get("/devices/DEVX999999")
+        writes.release(None)
+        admitted = client.delete("/devices/DEVX999999")
+        stats = client.get("/admin/admission")
+    reads = AdmissionLimiter("read", 1, queue_size=0)
+    asyncio.run(reads.acquire())
+    with TestClient(AdmissionMiddleware(app, reads=reads)) as client:
+        page = client.get("/devices/", params={"prefix": "DEVX99"})
+        streamed = client.get("/devices/", params={"prefix": "DEVX99", "format": "ndjson"})
+
+    assert shed.status_code == status.HTTP_503_SERVICE_UNAVAILABLE  # Check it was shed
+    assert shed.headers["Retry-After"] == "1"  # Check the advised delay
+    assert read.status_code == status.HTTP_404_NOT_FOUND  # Check reads are limited apart
+    assert admitted.status_code == status.HTTP_404_NOT_FOUND  # Check it was then admitted
+    assert [item["kind"] for item in stats.json()] == ["read", "write"]  # Check the stats
+    assert page.status_code == status.HTTP_503_SERVICE_UNAVAILABLE  # Check a page is limited
+    assert streamed.status_code == status.HTTP_200_OK  # Check a stream is not limited
+    assert reads.latency_seconds is None  # Check the stream was not timed
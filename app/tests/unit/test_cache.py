@@ -0,0 +1,63 @@
+"""
+Module containing unit tests for the device cache.
+"""
+
+from fastapi.testclient import TestClient
+from fastapi import status
+from app.database.cache import DeviceCache
+
+from app.main import app
+
+DEVICE_RECORD = {
+    "device_uuid": "DEVC000001",
+    "localisation": {"latitude": 35.6582, "longitude": 139.8752},
+    "deployment_date": "2024-03-14",
+    "owner": "cache_owner@example.com"
+}
+
+
+def test_cache_lru_eviction():
+    """
+    Test that the least recently used device is evicted beyond the entry budget.
+    """
+    cache = DeviceCache(max_entries=2, max_bytes=1 << 20, ttl_seconds=60,
+                        negative_ttl_seconds=60)
+    cache.fill("DEVC000001", DEVICE_RECORD, cache.read_token())
+    cache.fill("DEVC000002", None, cache.read_token())
+    cache.get("DEVC000001")  # Makes DEVC000002 the least recently used
+    cache.fill("DEVC000003", DEVICE_RECORD, cache.read_token())
+
+    assert cache.get("DEVC000001") == DEVICE_RECORD  # Check hit
+    assert cache.get("DEVC000002") is DeviceCache.MISSING  # Check eviction
+    assert cache.stats.evictions == 1  # Check counter
+
+
+def test_cache_negative_ttl_and_stale_fill():
+    """
+    Test that absences expire and that a read racing with a write is not cached.
+    """
+    cache = DeviceCache(max_entries=10, max_bytes=1 << 20, ttl_seconds=60,
+                        negative_ttl_seconds=0)
+    cache.fill("DEVC000001", None, cache.read_token())
+    token = cache.read_token()
+    cache.write("DEVC000002", DEVICE_RECORD)
+    cache.fill("DEVC000002", None, token)  # Read before the write committed
+
+    assert cache.get("DEVC000001") is DeviceCache.MISSING  # Check expiration
+    assert cache.get("DEVC000002") == DEVICE_RECORD  # Check the write was kept
+    assert cache.stats.stale_fills == 1  # Check counter
+
+
+def test_cache_stats():
+    """
+    Test that repeated reads of a missing device are answered by the cache.
+    """
+    with TestClient(app) as client:
+        for _ in range(3):
+            client.get(f"/devices/{DEVICE_RECORD['device_uuid']}")
+        response = client.get("/admin/cache")
+
+    assert response.status_code == status.HTTP_200_OK  # Check status code
+    stats = response.json()[0]
+    assert stats["misses"] == 1  # Check only the first read queried the database
+    assert stats["negative_hits"] == 2  # Check counter
@@ -0,0 +1,115 @@
+"""
+Module containing unit tests for the device change feed.
+"""
+
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.changes import sse_message
+from app.database.changes import ChangeFeed, CREATED, DELETED, RESET, UPDATED
+
+FEED_DEVICE_DATA = {
+    "device_uuid": "DEVF000001",
+    "localisation": {"latitude": 48.8566, "longitude": 2.3522},
+    "deployment_date": "2024-03-14",
+    "owner": "feed_owner@example.com"
+}
+
+
+def test_feed_filters_and_resumes():
+    """
+    Test that subscribers only receive matching events, and resume after a sequence.
+    """
+    async def scenario():
+        feed = ChangeFeed(history_size=10, buffer_size=10)
+        start = feed.sequence
+        owned = feed.subscribe(owner="a@example.com")
+        prefixed = feed.subscribe(prefix="DEVF")
+        feed.publish(CREATED, "DEVF000001", {}, "a@example.com")
+        feed.publish(CREATED, "DEVG000001", {}, "b@example.com")
+        feed.publish(UPDATED, "DEVG000001", {}, "c@example.com", "b@example.com")
+        feed.publish(UPDATED, "DEVG000002", {}, "b@example.com", "a@example.com")
+        owned_events = [await owned.next_event(0) for _ in range(3)]
+        prefixed_events = [await prefixed.next_event(0) for _ in range(2)]
+        resumed = feed.subscribe(after=start + 2)
+        resumed_events = [await resumed.next_event(0) for _ in range(3)]
+        return start, owned_events, prefixed_events, resumed_events
+
+    start, owned_events, prefixed_events, resumed_events = asyncio.run(scenario())
+
+    assert [event and event.device_uuid for event in owned_events] == [
+        "DEVF000001", "DEVG000002", None]  # Check the owner filter, including previous owners
+    assert [event and event.device_uuid for event in prefixed_events] == [
+        "DEVF000001", None]  # Check the prefix filter
+    assert [event and event.sequence for event in resumed_events] == [
+        start + 3, start + 4, None]  # Check the replay after a sequence
+
+
+def test_feed_overflow_and_reset():
+    """
+    Test that a slow subscriber resumes from the kept events, or gets a reset event once
+    they are lost.
+    """
+    async def scenario():
+        feed = ChangeFeed(history_size=5, buffer_size=2)
+        slow = feed.subscribe()
+        for index in range(4):
+            feed.publish(CREATED, f"DEVF00000{index}", {}, "a@example.com")
+        caught_up = [(await slow.next_event(0)).sequence for _ in range(4)]
+        for index in range(8):
+            feed.publish(DELETED, f"DEVF00000{index}", None, "a@example.com")
+        lost = [(await slow.next_event(0)).type for _ in range(3)]
+        restarted = ChangeFeed().subscribe(after=feed.sequence)
+        return caught_up, lost, (await restarted.next_event(0)).type, feed.subscriber_count()
+
+    caught_up, lost, restarted, subscribers = asyncio.run(scenario())
+
+    assert caught_up == list(range(caught_up[0], caught_up[0] + 4))  # Check nothing was lost
+    assert lost == [DELETED, DELETED, RESET]  # Check the reset once events are lost
+    assert restarted == RESET  # Check resuming from another feed resets
+    assert subscribers == 1  # Check the slow subscriber is registered again
+
+
+def test_sse_message():
+    """
+    Test the Server-Sent Event format of an event.
+    """
+    async def scenario():
+        feed = ChangeFeed()
+        subscription = feed.subscribe()
+        feed.publish(DELETED, "DEVF000001", None, "a@example.com")
+        return await subscription.next_event(0)
+
+    event = asyncio.run(scenario())
+
+    assert sse_message(event) == (
+        f'id: {event.sequence}\nevent: deleted\ndata: {{"sequence":{event.sequence},'
+        f'"type":"deleted","device_uuid":"DEVF000001","device":null}}\n\n'
+    ).encode()  # Check the id, event and data lines
+
+
+@pytest.mark.usefixtures("storage_backend")
+def test_websocket_change_feed():
+    """
+    Test that device writes are streamed over the WebSocket, filtered by prefix.
+    """
+    updated_data = {**FEED_DEVICE_DATA, "owner": "new_feed_owner@example.com"}
+    with TestClient(app) as client:
+        with client.websocket_connect("/devices/changes/ws?prefix=DEVF") as websocket:
+            client.post("/devices/", json={**FEED_DEVICE_DATA, "device_uuid": "DEVE000001"})
+            client.post("/devices/", json=FEED_DEVICE_DATA)
+            client.put("/devices/", json=updated_data)
+            client.delete("/devices/DEVF000001")
+            client.delete("/devices/DEVE000001")
+            messages = [websocket.receive_json() for _ in range(3)]
+
+    assert [message["type"] for message in messages] == [
+        "created", "updated", "deleted"]  # Check the events of the prefix, in order
+    assert [message["sequence"] - messages[0]["sequence"]
+            for message in messages] == [0, 1, 2]  # Check consecutive sequences
+    assert messages[0]["device"] == FEED_DEVICE_DATA  # Check the created device
+    assert messages[1]["device"] == updated_data  # Check the updated device
+    assert messages[1]["previous_owner"] == "feed_owner@example.com"  # Check previous owner
+    assert messages[2]["device"] is None  # Check the deletion
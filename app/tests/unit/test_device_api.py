@@ -2,12 +2,16 @@
 Module containing unit tests for device-related endpoints.
 """
 
+import pytest
 from fastapi.testclient import TestClient
 from fastapi import status
 from app.models.device import DeviceDeletionResponse, DeviceAlreadyExists, DeviceNotFoundResponse
 
 from app.main import app
 
+# Every test runs against each storage backend
+pytestmark = pytest.mark.usefixtures("storage_backend")
+
 DEVICE_DATA = {
     "device_uuid": "DEVX000001",
     "localisation":
@@ -0,0 +1,54 @@
+"""
+Module containing unit tests for the batch device read endpoint.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+
+# Every test runs against each storage backend
+pytestmark = pytest.mark.usefixtures("storage_backend")
+
+BATCH_DEVICES_DATA = [
+    {
+        "device_uuid": f"DEVG00000{index}",
+        "localisation": {"latitude": 48.8566 + index, "longitude": 2.3522},
+        "deployment_date": "2024-03-14",
+        "owner": "batch_owner@example.com"
+    }
+    for index in range(3)
+]
+
+
+def test_batch_get_devices():
+    """
+    Test reading found and missing devices in a single request, in request order.
+    """
+    with TestClient(app) as client:
+        client.post("/devices/bulk", json=BATCH_DEVICES_DATA)
+        # The first device is cached, the others are read from the database
+        client.get("/devices/DEVG000000")
+        response = client.post("/devices/batch-get",
+                               json={"device_uuids": ["DEVG000002", "DEVG999999", "DEVG000000",
+                                                      "DEVG000001", "DEVG000002"]})
+        for device in BATCH_DEVICES_DATA:
+            client.delete(f"/devices/{device['device_uuid']}")
+
+    assert response.status_code == status.HTTP_200_OK  # Check status code
+    assert response.json() == {
+        "items": [BATCH_DEVICES_DATA[2], BATCH_DEVICES_DATA[0], BATCH_DEVICES_DATA[1]],
+        "missing": ["DEVG999999"]
+    }  # Check devices are returned once, in request order
+
+
+def test_batch_get_invalid_uuid():
+    """
+    Test that a batch with an invalid UUID is rejected.
+    """
+    with TestClient(app) as client:
+        response = client.post("/devices/batch-get",
+                               json={"device_uuids": ["DEVG000001", "DEVG01"]})
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT  # Check status code
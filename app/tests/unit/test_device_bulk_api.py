@@ -0,0 +1,73 @@
+"""
+Module containing unit tests for the bulk device endpoints.
+"""
+
+import json
+import pytest
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+
+# Every test runs against each storage backend
+pytestmark = pytest.mark.usefixtures("storage_backend")
+
+BULK_DEVICES_DATA = [
+    {
+        "device_uuid": f"DEVB00000{index}",
+        "localisation": {"latitude": 48.8566, "longitude": 2.3522 + index},
+        "deployment_date": "2024-03-14",
+        "owner": "bulk_owner@example.com"
+    }
+    for index in range(3)
+]
+
+INVALID_DEVICE_DATA = {
+    "device_uuid": "DEVB000009",
+    "localisation": {"latitude": 48.8566, "longitude": 2.3522},
+    "owner": "not an email"
+}
+
+
+def test_bulk_create_devices():
+    """
+    Test creating devices in bulk from a JSON array, with a duplicate and an invalid item.
+    """
+    payload = BULK_DEVICES_DATA[:2] + [BULK_DEVICES_DATA[0], INVALID_DEVICE_DATA]
+    with TestClient(app) as client:
+        response = client.post("/devices/bulk", json=payload)
+        read_response = client.get(f"/devices/{BULK_DEVICES_DATA[1]['device_uuid']}")
+
+    assert response.status_code == status.HTTP_200_OK  # Check status code
+    body = response.json()
+    assert (body["created"], body["conflicts"], body["invalid"]) == (2, 1, 1)  # Check counts
+    assert [result["status"] for result in body["results"]] == [
+        "created", "created", "conflict", "invalid"]  # Check per-item results
+    assert body["results"][3]["device_uuid"] == INVALID_DEVICE_DATA["device_uuid"]
+    assert read_response.json() == BULK_DEVICES_DATA[1]  # Check the device was stored
+
+
+def test_bulk_create_devices_ndjson():
+    """
+    Test creating devices in bulk from an NDJSON stream, with an existing device.
+    """
+    lines = [json.dumps(device) for device in BULK_DEVICES_DATA[1:]] + ["{not json"]
+    with TestClient(app) as client:
+        response = client.post("/devices/bulk", content="\n".join(lines),
+                               headers={"Content-Type": "application/x-ndjson"})
+        for device in BULK_DEVICES_DATA:
+            client.delete(f"/devices/{device['device_uuid']}")
+
+    assert response.status_code == status.HTTP_200_OK  # Check status code
+    assert [result["status"] for result in response.json()["results"]] == [
+        "conflict", "created", "invalid"]  # Check per-item results
+
+
+def test_bulk_create_invalid_payload():
+    """
+    Test creating devices in bulk from a body that is not a JSON array.
+    """
+    with TestClient(app) as client:
+        response = client.post("/devices/bulk", json={"device_uuid": "DEVB000001"})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST  # Check status code
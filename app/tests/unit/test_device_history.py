@@ -0,0 +1,107 @@
+"""
+Module containing unit tests for the device history.
+"""
+
+import asyncio
+import sqlite3
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.database.startup import setup_database
+from app.database.pool import close_pools, get_pool
+from app.database.encoding import encode_uuid
+from app.database.operations.history import (MS_PER_DAY, MS_PER_HOUR, compact_history,
+                                             now_ms)
+
+HISTORY_DEVICE_DATA = {
+    "device_uuid": "DEVH000001",
+    "localisation": {"latitude": 48.8566, "longitude": 2.3522},
+    "deployment_date": "2024-03-14",
+    "owner": "history_owner@example.com"
+}
+
+
+@pytest.mark.usefixtures("storage_backend")
+def test_device_history():
+    """
+    Test that creations and updates are recorded, read by time range, and kept once the
+    device is deleted.
+    """
+    moved = {**HISTORY_DEVICE_DATA, "localisation": {"latitude": 45.764, "longitude": 4.8357}}
+    given = {**moved, "owner": "new_history_owner@example.com"}
+    with TestClient(app) as client:
+        client.delete("/devices/DEVH000001")
+        client.post("/devices/", json=HISTORY_DEVICE_DATA)
+        client.put("/devices/", json=moved)
+        client.put("/devices/", json=given)
+        client.delete("/devices/DEVH000001")
+        response = client.get("/devices/DEVH000001/history")
+        versions = response.json()["items"][-3:]
+        since = client.get("/devices/DEVH000001/history",
+                           params={"from": versions[1]["recorded_at"]})
+        future = client.get("/devices/DEVH000001/history",
+                            params={"from": "2999-01-01T00:00:00"})
+        missing = client.get("/devices/DEVH999999/history")
+
+    assert response.status_code == 200  # Check the history of a deleted device is kept
+    assert [version["localisation"]["latitude"] for version in versions] == [
+        48.8566, 45.764, 45.764]  # Check every version was recorded, oldest first
+    assert [version["owner"] for version in versions][1:] == [
+        "history_owner@example.com", "new_history_owner@example.com"]  # Check the owners
+    assert versions[0]["recorded_at"] <= versions[1]["recorded_at"] <= versions[2][
+        "recorded_at"]  # Check the time order
+    assert since.json()["items"] == versions[1:]  # Check the range start is included
+    assert future.json() == {"device_uuid": "DEVH000001", "items": []}  # Check empty range
+    assert missing.status_code == 404  # Check a device without history is not found
+
+
+def test_history_compaction(tmp_path):
+    """
+    Test that old versions are downsampled to the last one per bucket, and expired unless
+    they are the current version of an existing device.
+    """
+    db_name = str(tmp_path / "devices.db")
+    setup_database(db_name)
+    now = now_ms()
+    day = (now - 30 * MS_PER_DAY) // MS_PER_DAY * MS_PER_DAY
+    versions = [
+        ("DEVH000001", now - 400 * MS_PER_DAY),  # Expired, a later version exists
+        ("DEVH000001", day + MS_PER_HOUR),  # Downsampled, same day as the next one
+        ("DEVH000001", day + 5 * MS_PER_HOUR),
+        ("DEVH000001", now - MS_PER_DAY),  # Full resolution
+        ("DEVH000001", now - MS_PER_DAY + 1),
+        ("DEVH000002", now - 400 * MS_PER_DAY),  # Expired, the device was deleted
+        ("DEVH000003", now - 400 * MS_PER_DAY),  # Current version of an existing device
+    ]
+
+    async def scenario():
+        try:
+            pool = await get_pool(db_name)
+            async with pool.transaction() as database:
+                await database.execute("INSERT INTO coordinates (latitude, longitude) "
+                                       "VALUES (1.0, 2.0)")
+                await database.executemany(
+                    "INSERT INTO devices (device_id, localisation_id, deployment_date, owner) "
+                    "VALUES (?, 1, '2024-03-14', 'a@example.com')",
+                    [(encode_uuid("DEVH000001"),), (encode_uuid("DEVH000003"),)])
+                await database.executemany(
+                    "INSERT INTO device_history (device_id, recorded_at, localisation_id, "
+                    "deployment_date, owner) VALUES (?, ?, 1, '2024-03-14', 'a@example.com')",
+                    [(encode_uuid(device_uuid), recorded_at)
+                     for device_uuid, recorded_at in versions])
+            return await compact_history(now=now, full_resolution_days=7, bucket_hours=24,
+                                         retention_days=365, db_name=db_name)
+        finally:
+            await close_pools()
+
+    outcome = asyncio.run(scenario())
+    with sqlite3.connect(db_name) as database:
+        kept = database.execute("SELECT device_id, recorded_at FROM device_history "
+                                "ORDER BY device_id, recorded_at").fetchall()
+    database.close()
+
+    assert (outcome.downsampled, outcome.expired) == (1, 2)  # Check the deleted versions
+    assert kept == [(encode_uuid(device_uuid), recorded_at)
+                    for device_uuid, recorded_at in versions[2:5] + versions[6:]
+                    ]  # Check the kept versions
@@ -0,0 +1,73 @@
+"""
+Module containing unit tests for the device listing endpoint.
+"""
+
+import json
+import pytest
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+
+# Every test runs against each storage backend
+pytestmark = pytest.mark.usefixtures("storage_backend")
+
+LISTED_DEVICES_DATA = [
+    {
+        "device_uuid": f"DEVL00000{index}",
+        "localisation": {"latitude": 45.764, "longitude": 4.8357},
+        "deployment_date": f"2024-0{index + 1}-01",
+        "owner": "listing_owner@example.com"
+    }
+    for index in range(5)
+]
+
+
+def test_list_devices_pages():
+    """
+    Test listing devices page by page with the returned cursor.
+    """
+    pages = []
+    with TestClient(app) as client:
+        client.post("/devices/bulk", json=LISTED_DEVICES_DATA)
+        params = {"owner": "listing_owner@example.com", "limit": 2}
+        while True:
+            response = client.get("/devices/", params=params)
+            assert response.status_code == status.HTTP_200_OK  # Check status code
+            pages.append(response.json())
+            if pages[-1]["next_cursor"] is None:
+                break
+            params["cursor"] = pages[-1]["next_cursor"]
+
+    assert [len(page["items"]) for page in pages] == [2, 2, 1]  # Check page sizes
+    assert [item for page in pages for item in page["items"]] == LISTED_DEVICES_DATA
+
+
+def test_list_devices_by_prefix():
+    """
+    Test listing the devices whose UUID starts with a prefix.
+    """
+    with TestClient(app) as client:
+        response = client.get("/devices/", params={"prefix": "DEVL000003"})
+        invalid_response = client.get("/devices/", params={"prefix": "DEVL0000003"})
+
+    assert response.status_code == status.HTTP_200_OK  # Check status code
+    assert response.json()["items"] == LISTED_DEVICES_DATA[3:4]  # Check the matching device
+    assert invalid_response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
+def test_list_devices_ndjson():
+    """
+    Test streaming the devices deployed in a date range as NDJSON.
+    """
+    with TestClient(app) as client:
+        response = client.get("/devices/", params={"owner": "listing_owner@example.com",
+                                                   "deployed_from": "2024-02-01",
+                                                   "deployed_to": "2024-04-01",
+                                                   "format": "ndjson"})
+        for device in LISTED_DEVICES_DATA:
+            client.delete(f"/devices/{device['device_uuid']}")
+
+    assert response.status_code == status.HTTP_200_OK  # Check status code
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == LISTED_DEVICES_DATA[1:4]
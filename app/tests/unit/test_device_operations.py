@@ -0,0 +1,75 @@
+"""
+Module containing unit tests for the device database operations.
+"""
+
+import asyncio
+import pytest
+from app.database.startup import setup_database
+from app.database.pool import close_pools, get_pool
+from app.database.exceptions import DeviceAlreadyExistsError, DeviceNotFoundError
+from app.database.operations import devices
+from app.models.device import Device
+
+DEVICE = Device(device_uuid="DEVO000001",
+                localisation={"latitude": 48.85661400000001, "longitude": 2.3522219000000004},
+                deployment_date="2024-03-14",
+                owner="operations_owner@example.com")
+
+
+@pytest.fixture(name="db_name")
+def fixture_db_name(tmp_path):
+    """
+    Provides an empty database.
+    """
+    db_name = str(tmp_path / "devices.db")
+    setup_database(db_name)
+    return db_name
+
+
+def test_concurrent_creates(db_name):
+    """
+    Test that exactly one of several concurrent creations of a device succeeds.
+    """
+    async def scenario():
+        try:
+            results = await asyncio.gather(
+                *(devices.create_device(DEVICE, db_name) for _ in range(5)),
+                return_exceptions=True)
+            pool = await get_pool(db_name)
+            async with pool.reader() as database:
+                async with database.execute("SELECT COUNT(*) FROM coordinates") as cursor:
+                    coordinates = (await cursor.fetchone())[0]
+        finally:
+            await close_pools()
+        return results, coordinates
+
+    results, coordinates = asyncio.run(scenario())
+
+    assert results.count(None) == 1  # Check a single creation succeeded
+    assert all(isinstance(result, DeviceAlreadyExistsError)
+               for result in results if result is not None)  # Check the others conflicted
+    assert coordinates == 1  # Check the coordinate was shared
+
+
+def test_bulk_create_reuses_exact_coordinates(db_name):
+    """
+    Test that bulk creation finds coordinates stored with full float precision.
+    """
+    other = DEVICE.model_copy(update={"device_uuid": "DEVO000002"})
+
+    async def scenario():
+        try:
+            await devices.create_device(DEVICE, db_name)
+            created = await devices.create_devices([other], db_name)
+            missing_update = devices.update_device(
+                DEVICE.model_copy(update={"device_uuid": "DEVO000003"}), db_name)
+            with pytest.raises(DeviceNotFoundError):
+                await missing_update
+            return created, await devices.get_device(other.device_uuid, db_name)
+        finally:
+            await close_pools()
+
+    created, stored = asyncio.run(scenario())
+
+    assert created == {"DEVO000002": True}  # Check the device was created
+    assert stored["localisation"] == DEVICE.localisation.model_dump()  # Check exact coordinates
@@ -0,0 +1,89 @@
+"""
+Module containing unit tests for the device patch endpoints.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+
+# Every test runs against each storage backend
+pytestmark = pytest.mark.usefixtures("storage_backend")
+
+PATCH_DEVICES_DATA = [
+    {
+        "device_uuid": f"DEVP00000{index}",
+        "localisation": {"latitude": 48.8566, "longitude": 2.3522 + index},
+        "deployment_date": "2024-03-14",
+        "owner": "site_owner@example.com" if index < 3 else "other_owner@example.com"
+    }
+    for index in range(4)
+]
+
+
+def test_patch_device():
+    """
+    Test changing some fields of a device, leaving the others unchanged.
+    """
+    device = PATCH_DEVICES_DATA[0]
+    with TestClient(app) as client:
+        client.delete(f"/devices/{device['device_uuid']}")
+        client.post("/devices/", json=device)
+        owner_response = client.patch(f"/devices/{device['device_uuid']}",
+                                      json={"owner": "new_owner@example.com"})
+        moved_response = client.patch(f"/devices/{device['device_uuid']}",
+                                      json={"localisation": {"latitude": 45.764,
+                                                             "longitude": 4.8357},
+                                            "deployment_date": None})
+        read_response = client.get(f"/devices/{device['device_uuid']}")
+        history = client.get(f"/devices/{device['device_uuid']}/history").json()["items"]
+        missing_response = client.patch("/devices/DEVP999999",
+                                        json={"owner": "new_owner@example.com"})
+        invalid_responses = [client.patch(f"/devices/{device['device_uuid']}", json=body)
+                             for body in ({}, {"owner": None},
+                                          {"device_uuid": "DEVP000009"})]
+        client.delete(f"/devices/{device['device_uuid']}")
+
+    assert owner_response.status_code == status.HTTP_200_OK  # Check status code
+    assert owner_response.json() == {
+        **device, "owner": "new_owner@example.com"}  # Check only the owner changed
+    assert read_response.json() == {
+        **device, "owner": "new_owner@example.com",
+        "localisation": {"latitude": 45.764, "longitude": 4.8357},
+        "deployment_date": None}  # Check the stored device
+    assert moved_response.json() == read_response.json()  # Check the patched device
+    assert [version["owner"] for version in history[-3:]] == [
+        "site_owner@example.com", "new_owner@example.com",
+        "new_owner@example.com"]  # Check every patch was recorded
+    assert missing_response.status_code == status.HTTP_404_NOT_FOUND  # Check unknown device
+    assert [response.status_code for response in invalid_responses] == [
+        status.HTTP_422_UNPROCESSABLE_CONTENT] * 3  # Check empty, null and unknown fields
+
+
+def test_bulk_patch_devices():
+    """
+    Test transferring the devices of an owner within a UUID prefix to a new owner.
+    """
+    with TestClient(app) as client:
+        for device in PATCH_DEVICES_DATA:
+            client.delete(f"/devices/{device['device_uuid']}")
+            client.post("/devices/", json=device)
+        response = client.patch("/devices/bulk", json={
+            "filter": {"owner": "site_owner@example.com", "prefix": "DEVP"},
+            "patch": {"owner": "new_site_owner@example.com"}})
+        listed = client.get("/devices/", params={"prefix": "DEVP00000"}).json()["items"]
+        unfiltered_response = client.patch("/devices/bulk", json={
+            "filter": {}, "patch": {"owner": "new_site_owner@example.com"}})
+        for device in PATCH_DEVICES_DATA:
+            client.delete(f"/devices/{device['device_uuid']}")
+
+    assert response.status_code == status.HTTP_200_OK  # Check status code
+    assert response.json() == {"updated": 3}  # Check the matching devices were patched
+    assert [device["owner"] for device in listed] == [
+        "new_site_owner@example.com"] * 3 + [
+        "other_owner@example.com"]  # Check the other devices were left unchanged
+    assert [device["localisation"] for device in listed] == [
+        device["localisation"] for device in PATCH_DEVICES_DATA]  # Check the locations
+    assert unfiltered_response.status_code == \
+        status.HTTP_422_UNPROCESSABLE_CONTENT  # Check a filter is required
@@ -0,0 +1,69 @@
+"""
+Module containing unit tests for the spatial device endpoints.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+
+# Every test runs against each storage backend
+pytestmark = pytest.mark.usefixtures("storage_backend")
+
+SPATIAL_DEVICES_DATA = [
+    {
+        "device_uuid": "DEVS000001",
+        "localisation": {"latitude": 35.6582, "longitude": 139.8752},
+        "deployment_date": "2024-03-14",
+        "owner": "spatial_owner@example.com"
+    },
+    {
+        "device_uuid": "DEVS000002",
+        "localisation": {"latitude": 35.6895, "longitude": 139.6917},
+        "deployment_date": "2024-03-14",
+        "owner": "spatial_owner@example.com"
+    },
+    {
+        "device_uuid": "DEVS000003",
+        "localisation": {"latitude": -16.5, "longitude": 179.9},
+        "deployment_date": "2024-03-14",
+        "owner": "spatial_owner@example.com"
+    }
+]
+
+
+def test_find_devices_near():
+    """
+    Test finding the devices within a radius and the nearest devices of a point.
+    """
+    with TestClient(app) as client:
+        client.post("/devices/bulk", json=SPATIAL_DEVICES_DATA)
+        radius_response = client.get("/devices/near", params={"lat": 35.6586, "lon": 139.8745,
+                                                              "radius_km": 5})
+        nearest_response = client.get("/devices/near", params={"lat": -16.5, "lon": -179.9,
+                                                               "limit": 1})
+
+    assert radius_response.status_code == status.HTTP_200_OK  # Check status code
+    items = radius_response.json()["items"]
+    assert [item["device_uuid"] for item in items] == ["DEVS000001"]  # Check radius
+    assert items[0]["distance_km"] < 0.1  # Check distance
+    # Check the nearest device is found across the antimeridian
+    assert [item["device_uuid"] for item in nearest_response.json()["items"]] == ["DEVS000003"]
+
+
+def test_find_devices_in_box():
+    """
+    Test finding the devices in a bounding box.
+    """
+    with TestClient(app) as client:
+        response = client.get("/devices/within", params={"min_lat": 35, "max_lat": 36,
+                                                         "min_lon": 139.7, "max_lon": 140})
+        invalid_response = client.get("/devices/within", params={"min_lat": 36, "max_lat": 35,
+                                                                 "min_lon": 139, "max_lon": 140})
+        for device in SPATIAL_DEVICES_DATA:
+            client.delete(f"/devices/{device['device_uuid']}")
+
+    assert response.status_code == status.HTTP_200_OK  # Check status code
+    assert response.json()["items"] == SPATIAL_DEVICES_DATA[:1]  # Check response data
+    assert invalid_response.status_code == status.HTTP_400_BAD_REQUEST  # Check status code
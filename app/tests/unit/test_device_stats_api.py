@@ -0,0 +1,119 @@
+"""
+Module containing unit tests for the device statistics endpoints.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from app.main import app
+
+# Every test runs against each storage backend
+pytestmark = pytest.mark.usefixtures("storage_backend")
+
+STATS_DEVICES_DATA = [
+    {
+        "device_uuid": f"DEVN00000{index}",
+        "localisation": {"latitude": -33.8688 + index // 2 * 0.01, "longitude": 151.2093},
+        "deployment_date": f"2023-0{7 + index // 2}-1{index}",
+        "owner": "stats_owner@example.com" if index < 2 else "other_stats@example.com"
+    }
+    for index in range(3)
+]
+
+
+def _counts(client: TestClient) -> dict:
+    """
+    Reads every device count, keyed by statistic then group.
+    """
+    cells = client.get("/devices/stats/by-grid-cell", params={"precision": 2}).json()
+    return {
+        "owner": {item["owner"]: item["devices"]
+                  for item in client.get("/devices/stats/by-owner").json()["items"]},
+        "month": {item["month"]: item["devices"] for item in
+                  client.get("/devices/stats/by-deployment-month").json()["items"]},
+        "cell": {(item["latitude"], item["longitude"]): item["devices"]
+                 for item in cells["items"]},
+    }
+
+
+def _delta(before: dict, after: dict) -> dict:
+    """
+    Returns the groups whose count changed, and by how much.
+    """
+    deltas = {}
+    for statistic, counts in before.items():
+        changes = {group: after[statistic].get(group, 0) - counts.get(group, 0)
+                   for group in {**counts, **after[statistic]}}
+        deltas[statistic] = {group: change for group, change in changes.items() if change}
+    return deltas
+
+
+def test_device_stats():
+    """
+    Test that the device counts follow the creations, updates and deletions of devices.
+    """
+    with TestClient(app) as client:
+        for device in STATS_DEVICES_DATA:
+            client.delete(f"/devices/{device['device_uuid']}")
+        initial = _counts(client)
+        for device in STATS_DEVICES_DATA:
+            client.post("/devices/", json=device)
+        created = _counts(client)
+        client.patch("/devices/DEVN000001", json={"owner": "other_stats@example.com",
+                                                   "deployment_date": None})
+        # Moved onto the corner of a cell, whose scaled longitude is 15119.999999999998
+        client.put("/devices/", json={**STATS_DEVICES_DATA[2],
+                                      "localisation": {"latitude": 48.85,
+                                                       "longitude": 151.2}})
+        updated = _counts(client)
+        client.delete("/devices/DEVN000000")
+        deleted = _counts(client)
+        one_degree = client.get("/devices/stats/by-grid-cell").json()
+        invalid_response = client.get("/devices/stats/by-grid-cell",
+                                      params={"precision": 3})
+        for device in STATS_DEVICES_DATA:
+            client.delete(f"/devices/{device['device_uuid']}")
+        cleaned = _counts(client)
+
+    assert _delta(initial, created) == {
+        "owner": {"stats_owner@example.com": 2, "other_stats@example.com": 1},
+        "month": {"2023-07": 2, "2023-08": 1},
+        "cell": {(-33.87, 151.2): 2, (-33.86, 151.2): 1},
+    }  # Check the created devices were counted
+    assert _delta(created, updated) == {
+        "owner": {"stats_owner@example.com": -1, "other_stats@example.com": 1},
+        "month": {"2023-07": -1, None: 1},
+        "cell": {(-33.86, 151.2): -1, (48.85, 151.2): 1},
+    }  # Check the updated devices moved to their new groups
+    assert _delta(updated, deleted) == {
+        "owner": {"stats_owner@example.com": -1},
+        "month": {"2023-07": -1},
+        "cell": {(-33.87, 151.2): -1},
+    }  # Check the deleted device was uncounted
+    assert "stats_owner@example.com" not in deleted["owner"]  # Check empty groups are dropped
+    assert {"latitude": -34.0, "longitude": 151.0, "size_degrees": 1,
+            "devices": deleted["cell"][(-33.87, 151.2)]} in one_degree[
+        "items"]  # Check the cells of one degree
+    assert invalid_response.status_code == \
+        status.HTTP_422_UNPROCESSABLE_CONTENT  # Check an unknown precision is rejected
+    assert cleaned == initial  # Check the counts are back once the devices are deleted
+
+
+def test_rebuild_device_stats():
+    """
+    Test that rebuilding the device counts from the devices gives the maintained counts.
+    """
+    with TestClient(app) as client:
+        for device in STATS_DEVICES_DATA:
+            client.delete(f"/devices/{device['device_uuid']}")
+            client.post("/devices/", json=device)
+        maintained = _counts(client)
+        rebuild_response = client.post("/admin/stats/rebuild")
+        rebuilt = _counts(client)
+        for device in STATS_DEVICES_DATA:
+            client.delete(f"/devices/{device['device_uuid']}")
+
+    assert rebuild_response.status_code == status.HTTP_200_OK  # Check status code
+    assert rebuilt == maintained  # Check the rebuilt counts match the maintained ones
+    assert rebuilt["owner"]["stats_owner@example.com"] == 2  # Check the devices were counted
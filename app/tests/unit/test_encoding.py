@@ -0,0 +1,32 @@
+"""
+Module containing unit tests for the integer encoding of the device UUIDs.
+"""
+
+import pytest
+from app.database.encoding import MAX_DEVICE_ID, decode_uuid, encode_uuid, prefix_range
+
+
+def test_encode_uuid_round_trip():
+    """
+    Test encoding device UUIDs and decoding them back.
+    """
+    uuids = ["DEVA000000", "DEVA000001", "DEVX000001", "DEVZ999999"]
+    encoded = [encode_uuid(uuid) for uuid in uuids]
+
+    assert encoded == [0, 1, 23000001, MAX_DEVICE_ID]  # Check the encoding
+    assert encoded == sorted(encoded)  # Check the identifiers sort like the UUIDs
+    assert [decode_uuid(device_id) for device_id in encoded] == uuids  # Check the decoding
+    with pytest.raises(ValueError):
+        encode_uuid("DEVX00001")  # Check an invalid UUID is rejected
+
+
+def test_prefix_range():
+    """
+    Test the identifier ranges of UUID prefixes.
+    """
+    assert prefix_range("DEV") == (0, MAX_DEVICE_ID)  # Check every device matches
+    assert prefix_range("DEVX") == (23000000, 23999999)  # Check a letter prefix
+    assert prefix_range("DEVX12") == (23120000, 23129999)  # Check a partial serial
+    assert prefix_range("DEVX000001") == (23000001, 23000001)  # Check a full UUID
+    low, high = prefix_range("ABC")
+    assert low > high  # Check an impossible prefix matches nothing
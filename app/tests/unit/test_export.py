@@ -0,0 +1,128 @@
+"""
+Module containing unit tests for the device export and the database backup.
+"""
+
+import asyncio
+import csv
+import io
+import sqlite3
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from app import cli
+from app.main import app
+from app.cli import main
+from app.config import Settings
+from app.database.startup import setup_database
+from app.database.pool import close_pools
+from app.database.sharding import ShardLayout
+from app.database.operations import devices
+from app.database.export import PYARROW_AVAILABLE, iter_batches
+from app.models.device import Device
+
+EXPORTED_DEVICES = [{
+    "device_uuid": f"DEVK00000{serial}",
+    "localisation": {"latitude": 48.0 + serial, "longitude": 2.3522},
+    "deployment_date": "2024-03-14",
+    "owner": "export_owner@example.com"
+} for serial in range(3)]
+
+
+@pytest.mark.usefixtures("storage_backend")
+def test_export_api():
+    """
+    Test that every device is exported as NDJSON and CSV.
+    """
+    with TestClient(app) as client:
+        client.post("/devices/bulk", json=EXPORTED_DEVICES)
+        ndjson = client.get("/devices/export", params={"batch_size": 2})
+        exported_csv = client.get("/devices/export", params={"format": "csv"})
+        arrow = client.get("/devices/export", params={"format": "arrow"})
+
+    lines = [orjson.loads(line) for line in ndjson.text.splitlines()]
+    rows = list(csv.reader(io.StringIO(exported_csv.text)))
+
+    assert ndjson.headers["content-type"] == "application/x-ndjson"  # Check the media type
+    assert [line for line in lines
+            if line["device_uuid"].startswith("DEVK")] == EXPORTED_DEVICES  # Check the devices
+    assert rows[0] == ["device_uuid", "latitude", "longitude", "deployment_date",
+                       "owner"]  # Check the CSV header
+    assert ["DEVK000001", "49.0", "2.3522", "2024-03-14",
+            "export_owner@example.com"] in rows  # Check the flat CSV columns
+    assert len(rows) == len(lines) + 1  # Check both exports hold the same devices
+    assert arrow.status_code == (200 if PYARROW_AVAILABLE else 501)  # Check the optional format
+
+
+def test_export_snapshot(tmp_path):
+    """
+    Test that writes committed during an export are not part of it.
+    """
+    db_name = str(tmp_path / "devices.db")
+    setup_database(db_name, ShardLayout(count=3, key="letter"))
+    stored = [Device(**{**data, "device_uuid": f"DEV{letter}00000{index}"})
+              for index, data in enumerate(EXPORTED_DEVICES) for letter in "AX"]
+
+    async def scenario():
+        try:
+            await devices.create_devices(stored, db_name)
+            batches = iter_batches(batch_size=1, db_name=db_name)
+            exported = [await batches.__anext__()]
+            await devices.delete_device("DEVX000002", db_name)
+            await devices.create_devices([Device(**{**EXPORTED_DEVICES[0],
+                                                    "device_uuid": "DEVM000001"})], db_name)
+            exported += [batch async for batch in batches]
+        finally:
+            await close_pools()
+        return [row[0] for batch in exported for row in batch]
+
+    exported = asyncio.run(scenario())
+
+    assert exported == sorted(device.device_uuid for device in stored)  # Check the snapshot
+
+
+def test_backup(tmp_path):
+    """
+    Test that the backup command copies every shard into complete database files.
+    """
+    db_name = str(tmp_path / "devices.db")
+    setup_database(db_name, ShardLayout(count=3, key="letter"))
+
+    async def scenario():
+        try:
+            await devices.create_devices([Device(**{**data, "device_uuid": f"DEV{letter}"
+                                                                          f"00000{index}"})
+                                          for index, data in enumerate(EXPORTED_DEVICES)
+                                          for letter in "AJX"], db_name)
+        finally:
+            await close_pools()
+
+    asyncio.run(scenario())
+    status = main(["--database", db_name, "backup", str(tmp_path / "backup.db"),
+                   "--pages", "1"])
+    counts = []
+    for index in range(3):
+        with sqlite3.connect(tmp_path / f"backup-{index}.db") as database:
+            counts.append(database.execute("SELECT COUNT(*) FROM devices").fetchone()[0])
+            integrity = database.execute("PRAGMA integrity_check").fetchone()[0]
+        database.close()
+
+    assert status == 0  # Check the command succeeded
+    assert counts == [3, 3, 3]  # Check every shard was copied
+    assert integrity == "ok"  # Check the copy is a valid database
+    assert not list(tmp_path.glob("*.partial"))  # Check no partial copy is left
+
+
+def test_cli_memory_backend(tmp_path, monkeypatch, capsys):
+    """
+    Test that the commands refuse to run on the SQLite database when the devices are stored
+    in memory.
+    """
+    monkeypatch.setattr(cli, "settings", Settings(storage_backend="memory"))
+    statuses = [main(["--database", str(tmp_path / "devices.db"), *arguments])
+                for arguments in (["export"], ["backup", str(tmp_path / "backup.db")],
+                                  ["load", str(tmp_path / "devices.csv")])]
+
+    assert statuses == [1, 1, 1]  # Check every command failed
+    assert "POST /devices/bulk" in capsys.readouterr().err  # Check the advised alternative
+    assert not list(tmp_path.iterdir())  # Check nothing was written
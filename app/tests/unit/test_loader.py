@@ -0,0 +1,104 @@
+"""
+Module containing unit tests for the offline bulk loader.
+"""
+
+import asyncio
+import orjson
+from app.cli import main
+from app.database.startup import setup_database
+from app.database.pool import close_pools
+from app.database.sharding import ShardLayout
+from app.database.operations import devices
+from app.database.operations.history import get_device_history
+from app.database.loader import load_devices
+
+CSV_ROWS = """owner,device_uuid,latitude,longitude,deployment_date
+loader_owner@example.com,DEVA000001,48.8566,2.3522,2024-03-14
+loader_owner@example.com,DEVX000001,48.8566,2.3522,
+loader_owner@example.com,DEVA1,48.8566,2.3522,2024-03-14
+loader_owner@example.com,DEVA000002,91,2.3522,2024-03-14
+loader_owner@example.com,DEVA000003,48.8566,east,2024-03-14
+loader_owner@example.com,DEVA000004,48.8566,2.3522,2024-02-30
+not an email,DEVA000005,48.8566,2.3522,2024-03-14
+loader_owner@example.com,DEVA000001,45.764,4.8357,2024-03-14
+loader_owner@example.com,DEVA000006
+loader_owner@example.com,DEVA000007,999,2.3522,2024-03-14
+loader_owner@example.com,DEVA000007,45.764,4.8357,2024-03-14
+"""
+
+
+def test_load_csv(tmp_path):
+    """
+    Test that the valid rows of a CSV file are loaded, and the others rejected with their
+    reason.
+    """
+    db_name = str(tmp_path / "devices.db")
+    path = tmp_path / "devices.csv"
+    path.write_text(CSV_ROWS)
+
+    status = main(["--database", db_name, "load", str(path), "--batch-size", "4"])
+
+    async def scenario():
+        try:
+            return (await devices.get_devices(["DEVA000001", "DEVX000001", "DEVA000007"],
+                                              db_name),
+                    await get_device_history("DEVA000001", db_name=db_name))
+        finally:
+            await close_pools()
+
+    loaded, history = asyncio.run(scenario())
+    rejected = [orjson.loads(line) for line in
+                (tmp_path / "devices.csv.rejected.ndjson").read_text().splitlines()]
+
+    assert status == 0  # Check the command succeeded
+    assert loaded["DEVA000001"] == {
+        "device_uuid": "DEVA000001",
+        "localisation": {"latitude": 48.8566, "longitude": 2.3522},
+        "deployment_date": "2024-03-14",
+        "owner": "loader_owner@example.com"
+    }  # Check the loaded device
+    assert loaded["DEVX000001"]["deployment_date"] is None  # Check the optional date
+    assert loaded["DEVA000007"]["localisation"] == {
+        "latitude": 45.764, "longitude": 4.8357}  # Check a valid row after an invalid one
+    assert len(history) == 1  # Check the first version was recorded
+    assert [(row["line"], row["reason"]) for row in rejected] == [
+        (4, "Invalid device_uuid format"),
+        (5, "Latitude must be between -90 and 90 degrees"),
+        (6, "Longitude must be between -180 and 180 degrees"),
+        (7, "Invalid deployment date, expected YYYY-MM-DD"),
+        (8, "Invalid owner email address"),
+        (9, "Device already exists"),
+        (10, "Unreadable row"),
+        (11, "Latitude must be between -90 and 90 degrees"),
+    ]  # Check every invalid row was rejected with its reason
+    assert rejected[0]["row"][1] == "DEVA1"  # Check the rejected row is kept as read
+
+
+def test_load_ndjson_shards(tmp_path):
+    """
+    Test that NDJSON devices are loaded into their shards, and duplicates rejected.
+    """
+    db_name = str(tmp_path / "devices.db")
+    setup_database(db_name, ShardLayout(count=3, key="hash"))
+    device = {"localisation": {"latitude": 45.764, "longitude": 4.8357},
+              "deployment_date": "2024-03-14", "owner": "loader_owner@example.com"}
+    path = tmp_path / "devices.ndjson"
+    path.write_bytes(b"".join(orjson.dumps({**device, "device_uuid": f"DEVJ00000{serial}"})
+                              + b"\n" for serial in range(6))
+                     + orjson.dumps({**device, "device_uuid": "DEVJ000001"}) + b"\n"
+                     + b"{not json\n")
+
+    report = load_devices(str(path), db_name=db_name)
+
+    async def scenario():
+        try:
+            return await devices.list_devices(100, db_name=db_name)
+        finally:
+            await close_pools()
+
+    listed = asyncio.run(scenario())
+
+    assert (report.rows, report.loaded, report.rejected) == (8, 6, 2)  # Check the counts
+    assert [item["device_uuid"] for item in listed] == [
+        f"DEVJ00000{serial}" for serial in range(6)]  # Check every shard was loaded
+    assert report.rows_per_second > 0  # Check the throughput is reported
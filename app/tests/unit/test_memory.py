@@ -0,0 +1,116 @@
+"""
+Module containing unit tests for the in-memory storage engine.
+"""
+
+import asyncio
+
+from app.database.memory import MemoryEngine
+from app.database.operations.history import MS_PER_DAY
+from app.models.device import Device, DevicePatch
+
+
+def _device(serial: int, owner: str = "memory_owner@example.com") -> Device:
+    """
+    Builds a device of the memory engine tests.
+    """
+    return Device(device_uuid=f"DEVQ{serial:06d}",
+                  localisation={"latitude": 48.8566, "longitude": 2.3522 + serial},
+                  deployment_date="2024-03-14", owner=owner)
+
+
+def test_log_replay(tmp_path):
+    """
+    Test that the writes logged since the last snapshot are replayed on startup, and that a
+    torn entry at the end of the log is discarded.
+    """
+    db_name = str(tmp_path / "devices.db")
+
+    async def scenario():
+        engine = MemoryEngine(db_name)
+        await engine.open()
+        await engine.create_devices([_device(serial) for serial in range(3)])
+        await engine.snapshot()
+        await engine.patch_device("DEVQ000001", DevicePatch(owner="new_owner@example.com"))
+        await engine.delete_device("DEVQ000002")
+        await engine.create_device(_device(3))
+        # Simulate a crash during a write: the engine is left open, with a torn entry
+        engine._log.write(b'[4, 48.8')  # pylint: disable=protected-access
+        engine._log.flush()  # pylint: disable=protected-access
+
+        restarted = MemoryEngine(db_name)
+        await restarted.open()
+        listed = await restarted.list_devices(10, None, None, None, None, "DEVQ")
+        history = await restarted.get_device_history("DEVQ000001", None, None, 10)
+        months = await restarted.count_devices_by_deployment_month()
+        await restarted.create_device(_device(4))
+        await restarted.close()
+
+        reopened = MemoryEngine(db_name)
+        await reopened.open()
+        count = reopened.device_count
+        await reopened.close()
+        return listed, history, months, count
+
+    listed, history, months, count = asyncio.run(scenario())
+
+    assert [device["device_uuid"] for device in listed] == [
+        "DEVQ000000", "DEVQ000001", "DEVQ000003"]  # Check the logged writes were replayed
+    assert listed[1]["owner"] == "new_owner@example.com"  # Check the logged patch
+    assert [version["owner"] for version in history] == [
+        "memory_owner@example.com", "new_owner@example.com"]  # Check the history was kept
+    assert months == {"2024-03": 3}  # Check the counts were rebuilt from the replayed devices
+    assert count == 4  # Check the write after the torn entry was not lost
+    with open(f"{db_name}.log", "rb") as log_file:
+        assert log_file.read() == b""  # Check the log was cut down by the final snapshot
+
+
+def test_memory_history_compaction(tmp_path):
+    """
+    Test that old versions are downsampled and expired with the rules of the SQLite
+    backend, keeping the current version of existing devices.
+    """
+    async def scenario():
+        engine = MemoryEngine(str(tmp_path / "devices.db"))
+        await engine.open()
+        await engine.create_devices([_device(0), _device(1)])
+        for _ in range(2):
+            await engine.patch_device("DEVQ000000", DevicePatch(owner="new@example.com"))
+        await engine.delete_device("DEVQ000001")
+        # Everything is older than the retention period
+        written = await engine.get_device_history("DEVQ000000", None, None, 10)
+        compacted = await engine.compact_history(2 ** 62, MS_PER_DAY, 2 ** 62)
+        kept = await engine.get_device_history("DEVQ000000", None, None, 10)
+        deleted = await engine.get_device_history("DEVQ000001", None, None, 10)
+        await engine.close()
+        return len(written), compacted, kept, deleted
+
+    versions, compacted, kept, deleted = asyncio.run(scenario())
+
+    assert versions == 3  # Check every write was recorded
+    assert compacted == (2, 1)  # Check the downsampled and expired versions
+    assert [version["owner"] for version in kept] == [
+        "new@example.com"]  # Check the current version of an existing device was kept
+    assert deleted is None  # Check the history of a deleted device expired
+
+
+def test_memory_listing_order(tmp_path):
+    """
+    Test that the devices are listed in UUID order whether they were created one at a time,
+    inserted in order, or in bulk, appended then sorted.
+    """
+    async def scenario():
+        engine = MemoryEngine(str(tmp_path / "devices.db"))
+        await engine.open()
+        await engine.create_device(_device(7))
+        await engine.create_device(_device(2))
+        serials = list(range(10, 50)) + [5]
+        await engine.create_devices([_device(serial) for serial in reversed(serials)])
+        await engine.create_device(_device(3))
+        listed = await engine.list_devices(100, None, None, None, None, "DEVQ")
+        await engine.close()
+        return [device["device_uuid"] for device in listed]
+
+    listed = asyncio.run(scenario())
+
+    assert listed == sorted(listed)  # Check the devices are listed in UUID order
+    assert len(listed) == 44  # Check every device was listed
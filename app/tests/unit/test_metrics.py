@@ -0,0 +1,67 @@
+"""
+Module containing unit tests for the metrics and the slow request profiling.
+"""
+
+import asyncio
+from fastapi import FastAPI, status
+from fastapi.testclient import TestClient
+from app.api.middleware import MetricsMiddleware, slow_requests
+from app.metrics import HTTP_REQUESTS, SQL_STATEMENT_SECONDS, Histogram
+
+from app.main import app
+
+
+def test_metrics_endpoint():
+    """
+    Test that requests and SQL statements are counted and exposed in the Prometheus format.
+    """
+    requests_before = HTTP_REQUESTS.value("GET", "read_device", "404")
+    statements_before = SQL_STATEMENT_SECONDS.count("get_device")
+    with TestClient(app) as client:
+        client.get("/devices/DEVM999999")
+        response = client.get("/metrics")
+
+    assert response.status_code == status.HTTP_200_OK  # Check status code
+    assert response.headers["content-type"].startswith("text/plain")  # Check the format
+    assert HTTP_REQUESTS.value("GET", "read_device", "404") == requests_before + 1
+    assert SQL_STATEMENT_SECONDS.count("get_device") == statements_before + 1
+    assert ('edgematrix_http_requests_total{method="GET",handler="read_device",status="404"}'
+            in response.text)  # Check the request sample is exposed
+
+
+def test_histogram_render():
+    """
+    Test the cumulated buckets, sum and count of a histogram.
+    """
+    histogram = Histogram("test_seconds", "Test histogram.", ("operation",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, "read")
+
+    assert histogram.samples() == [
+        'test_seconds_bucket{operation="read",le="0.1"} 1',
+        'test_seconds_bucket{operation="read",le="1.0"} 2',
+        'test_seconds_bucket{operation="read",le="+Inf"} 3',
+        'test_seconds_sum{operation="read"} 5.55',
+        'test_seconds_count{operation="read"} 3',
+    ]  # Check the exposed samples
+
+
+def test_slow_request_profiling():
+    """
+    Test that the stack of a sampled request slower than the threshold is captured.
+    """
+    slow_app = FastAPI()
+
+    @slow_app.get("/slow")
+    async def wait_a_while():
+        await asyncio.sleep(0.05)
+
+    slow_app.add_middleware(MetricsMiddleware, slow_request_ms=10, sample_rate=1.0)
+    captured_before = len(slow_requests())
+    with TestClient(slow_app) as client:
+        client.get("/slow")
+
+    captured = slow_requests()
+    assert len(captured) == captured_before + 1  # Check the request was captured
+    assert captured[-1]["path"] == "/slow"
+    assert "wait_a_while" in captured[-1]["stack"]  # Check the stack shows the endpoint
@@ -0,0 +1,68 @@
+"""
+Module containing unit tests for the schema migrations.
+"""
+
+import sqlite3
+from app.cli import main
+from app.database.migrations import SCHEMA_VERSION, get_schema_version
+from app.database.startup import setup_database
+
+
+def test_migrate_unversioned_database(tmp_path):
+    """
+    Test upgrading a database created before versioning, with duplicated coordinates
+    and a device whose UUID cannot be encoded.
+    """
+    db_name = str(tmp_path / "devices.db")
+    with sqlite3.connect(db_name) as database:
+        database.execute("CREATE TABLE coordinates (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "latitude REAL NOT NULL, longitude REAL NOT NULL)")
+        database.execute("CREATE TABLE devices (device_uuid TEXT PRIMARY KEY, "
+                         "localisation_id INTEGER, deployment_date TEXT, owner TEXT NOT NULL)")
+        database.executemany("INSERT INTO coordinates (latitude, longitude) VALUES (?, ?)",
+                             [(1.5, 2.5), (1.5, 2.5), (3.5, 4.5)])
+        database.executemany("INSERT INTO devices VALUES (?, ?, '2024-03-14', 'a@example.com')",
+                             [("DEVX000001", 1), ("DEVX000002", 2), ("DEVX000003", 3),
+                              ("legacy", 3)])
+    database.close()
+
+    reports = setup_database(db_name)
+
+    database = sqlite3.connect(db_name)
+    version = get_schema_version(database)
+    auto_vacuum = database.execute("PRAGMA auto_vacuum").fetchone()[0]
+    localisations = database.execute("SELECT device_id, localisation_id FROM devices "
+                                     "ORDER BY device_id").fetchall()
+    unencodable = database.execute("SELECT device_uuid FROM unencodable_devices").fetchall()
+    indexes = {row[0] for row in database.execute("SELECT name FROM sqlite_master "
+                                                  "WHERE type = 'index'")}
+    database.close()
+
+    assert [report.version for report in reports] == list(range(1, SCHEMA_VERSION + 1))
+    assert version == SCHEMA_VERSION  # Check the version was stored
+    assert localisations == [(23000001, 1), (23000002, 1),
+                             (23000003, 3)]  # Check duplicates were merged and UUIDs encoded
+    assert unencodable == [("legacy",)]  # Check the invalid UUID was set aside
+    assert {"devices_owner", "devices_deployment_date",
+            "coordinates_location"} <= indexes  # Check the indexes were built
+    assert auto_vacuum == 2  # Check the incremental auto-vacuum mode
+    assert not setup_database(db_name)  # Check nothing is applied twice
+
+
+def test_migrate_cli(tmp_path, capsys):
+    """
+    Test applying the pending migrations with the command-line interface.
+    """
+    db_name = str(tmp_path / "devices.db")
+    status = main(["--database", db_name, "migrate"])
+    output = capsys.readouterr().err
+    database = sqlite3.connect(db_name)
+    version = get_schema_version(database)
+    database.close()
+    second_status = main(["--database", db_name, "migrate"])
+
+    assert status == 0  # Check the command succeeded
+    assert version == SCHEMA_VERSION  # Check every migration was applied
+    assert f"Applied migration {SCHEMA_VERSION} " in output  # Check each step is reported
+    assert second_status == 0  # Check an up-to-date database is left as is
+    assert not capsys.readouterr().err  # Check nothing was applied twice
@@ -0,0 +1,96 @@
+"""
+Module containing unit tests for the database connection pool.
+"""
+
+import asyncio
+import time
+from fastapi.testclient import TestClient
+from fastapi import status
+from app.database.pool import ConnectionPool
+from app.database.startup import setup_database
+
+from app.main import app
+
+
+def test_pool_stats():
+    """
+    Test reading the connection pool statistics once a request went through the pool.
+    """
+    with TestClient(app) as client:
+        # The warm-up borrows readers too
+        while client.get("/ready").status_code != status.HTTP_200_OK:
+            time.sleep(0.01)
+        client.get("/devices/DEVX999999")
+        response = client.get("/admin/pool")
+
+    assert response.status_code == status.HTTP_200_OK  # Check status code
+    stats = response.json()[0]
+    assert stats["writer"]["size"] == 1  # Check there is a single writer
+    assert stats["readers"]["acquisitions"] >= 1  # Check the read was counted
+    assert stats["readers"]["in_use"] == 0  # Check the connection was released
+
+
+def test_pool_wal_and_rollback(tmp_path):
+    """
+    Test that the pool enables WAL mode and rolls back a failed transaction.
+    """
+    db_name = str(tmp_path / "pool.db")
+    setup_database(db_name)
+
+    async def scenario():
+        pool = ConnectionPool(db_name, readers=1)
+        await pool.open()
+        try:
+            async with pool.reader() as database:
+                async with database.execute("PRAGMA journal_mode") as cursor:
+                    journal_mode = (await cursor.fetchone())[0]
+            try:
+                async with pool.transaction() as database:
+                    await database.execute("INSERT INTO coordinates (latitude, longitude) "
+                                           "VALUES (1, 2)")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            async with pool.reader() as database:
+                async with database.execute("SELECT COUNT(*) FROM coordinates") as cursor:
+                    count = (await cursor.fetchone())[0]
+        finally:
+            await pool.close()
+        return journal_mode, count
+
+    journal_mode, count = asyncio.run(scenario())
+
+    assert journal_mode == "wal"  # Check WAL mode is enabled
+    assert count == 0  # Check the insertion was rolled back
+
+
+def test_pool_readers_served_in_order(tmp_path):
+    """
+    Test that a released reader goes to the longest waiting request, even when another
+    request asks for one at the same time.
+    """
+    db_name = str(tmp_path / "pool.db")
+    setup_database(db_name)
+    order = []
+
+    async def borrow(pool, name):
+        async with pool.reader():
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async def scenario():
+        pool = ConnectionPool(db_name, readers=1)
+        await pool.open()
+        try:
+            async with pool.reader():
+                waiting = [asyncio.create_task(borrow(pool, name)) for name in ("first", "second")]
+                await asyncio.sleep(0)
+            # Asks for the reader right after its release, before the waiters are resumed
+            await borrow(pool, "late")
+            await asyncio.gather(*waiting)
+        finally:
+            await pool.close()
+
+    asyncio.run(scenario())
+
+    assert order == ["first", "second", "late"]  # Check waiters were served first
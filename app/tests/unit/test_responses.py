@@ -0,0 +1,51 @@
+"""
+Module containing unit tests for the response serialization.
+"""
+
+import json
+from fastapi.testclient import TestClient
+from fastapi import status
+from fastapi.encoders import jsonable_encoder
+
+from app.main import app
+from app.api.responses import model_json, trusted_json
+from app.models.device import Device
+
+SERIALIZED_DEVICE_DATA = {
+    "device_uuid": "DEVR000001",
+    "localisation": {"latitude": 48.8566, "longitude": 2.3522},
+    "deployment_date": "2024-03-14",
+    "owner": "serialized_owner@example.com"
+}
+
+
+def test_trusted_and_model_responses_match_encoder():
+    """
+    Test that the fast responses render the same JSON as the encoder they replace.
+    """
+    device = Device(**SERIALIZED_DEVICE_DATA)
+    trusted = trusted_json({"items": [SERIALIZED_DEVICE_DATA]})
+    validated = model_json(device, status.HTTP_201_CREATED)
+
+    assert json.loads(trusted.body) == {"items": [SERIALIZED_DEVICE_DATA]}  # Check content
+    assert json.loads(validated.body) == jsonable_encoder(device)  # Check content
+    assert validated.status_code == status.HTTP_201_CREATED  # Check status code
+    assert validated.media_type == "application/json"  # Check media type
+
+
+def test_device_responses_are_json():
+    """
+    Test that created, read and updated devices are returned as JSON.
+    """
+    updated_data = {**SERIALIZED_DEVICE_DATA, "owner": "updated_owner@example.com"}
+    with TestClient(app) as client:
+        created = client.post("/devices/", json=SERIALIZED_DEVICE_DATA)
+        read = client.get("/devices/DEVR000001")
+        updated = client.put("/devices/", json=updated_data)
+        client.delete("/devices/DEVR000001")
+
+    assert created.status_code == status.HTTP_201_CREATED  # Check status code
+    for response, expected in ((created, SERIALIZED_DEVICE_DATA), (read, SERIALIZED_DEVICE_DATA),
+                               (updated, updated_data)):
+        assert response.headers["content-type"] == "application/json"  # Check media type
+        assert response.json() == expected  # Check content
@@ -0,0 +1,102 @@
+"""
+Module containing unit tests for the sharded device storage.
+"""
+
+import asyncio
+import sqlite3
+import pytest
+from app.database.startup import setup_database
+from app.database.pool import close_pools
+from app.database.sharding import ShardLayout, shard_of, shards
+from app.database.operations import devices
+from app.models.device import Device
+
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def _device(device_uuid: str, latitude: float = 48.8566) -> Device:
+    """
+    Builds a device of the sharding tests.
+    """
+    return Device(device_uuid=device_uuid,
+                  localisation={"latitude": latitude, "longitude": 2.3522},
+                  deployment_date="2024-03-14",
+                  owner="sharded_owner@example.com")
+
+
+SHARDED_DEVICES = [_device(f"DEV{letter}00000{serial}", 48.0 + serial)
+                   for letter in "AJTX" for serial in range(3)]
+
+
+def test_layout_routing(tmp_path):
+    """
+    Test that devices are routed by letter or by serial, and prefixes narrow the shards.
+    """
+    db_name = str(tmp_path / "devices.db")
+    setup_database(db_name, ShardLayout(count=26, key="letter"))
+    by_letter = {shard_of(f"DEV{letter}000001", db_name) for letter in LETTERS}
+    prefix_shards = shards(db_name, "DEVX00")
+
+    assert len(by_letter) == 26  # Check each letter has its own shard
+    assert prefix_shards == [shard_of("DEVX123456", db_name)]  # Check the prefix is narrowed
+    assert prefix_shards[0] == str(tmp_path / "devices-23.db")  # Check the shard file name
+    assert len(shards(db_name, "DEV")) == 26  # Check a letterless prefix reads every shard
+    assert shards(db_name, after="DEVX000001") == [
+        str(tmp_path / f"devices-{index}.db") for index in (23, 24, 25)]  # Check the cursor
+    assert ShardLayout(count=3, key="letter").index(25000001) == 2  # Check letter ranges
+
+    hashed = ShardLayout(count=4, key="hash")
+    assert {hashed.index(device_id)
+            for device_id in range(23000000, 23000004)} == {0, 1, 2, 3}  # Check the spread
+    assert hashed.indexes_for_listing("DEVX00") == [0, 1, 2, 3]  # Check every shard is read
+
+    with pytest.raises(ValueError):  # Check an unknown key is rejected
+        ShardLayout(count=4, key="owner")
+
+
+@pytest.mark.parametrize("layout", [ShardLayout(count=3, key="letter"),
+                                    ShardLayout(count=3, key="hash")])
+def test_sharded_operations(tmp_path, layout):
+    """
+    Test that devices written across shards are read, listed, searched and deleted.
+    """
+    db_name = str(tmp_path / "devices.db")
+    setup_database(db_name, layout)
+
+    async def scenario():
+        try:
+            await devices.create_device(SHARDED_DEVICES[0], db_name)
+            created = await devices.create_devices(SHARDED_DEVICES, db_name)
+            read = await devices.get_device("DEVX000002", db_name)
+            batch = await devices.get_devices(["DEVJ000001", "DEVJ999999", "DEVA000000"],
+                                              db_name)
+            first_page = await devices.list_devices(5, db_name=db_name)
+            second_page = await devices.list_devices(100, first_page[-1]["device_uuid"],
+                                                     db_name=db_name)
+            prefixed = await devices.list_devices(100, prefix="DEVJ", db_name=db_name)
+            within = await devices.find_devices_in_box(48.5, 49.5, 2.0, 3.0, 100, db_name)
+            await devices.delete_device("DEVX000002", db_name)
+            deleted = await devices.get_device("DEVX000002", db_name)
+        finally:
+            await close_pools()
+        return created, read, batch, first_page + second_page, prefixed, within, deleted
+
+    created, read, batch, listed, prefixed, within, deleted = asyncio.run(scenario())
+    counts = []
+    for shard in shards(db_name):
+        with sqlite3.connect(shard) as database:
+            counts.append(database.execute("SELECT COUNT(*) FROM devices").fetchone()[0])
+        database.close()
+
+    assert list(created.values()) == [False] + [True] * 11  # Check the existing device
+    assert read["localisation"]["latitude"] == 50.0  # Check the device was read
+    assert batch["DEVJ999999"] is None  # Check the missing device
+    assert batch["DEVJ000001"]["device_uuid"] == "DEVJ000001"  # Check the found device
+    assert [item["device_uuid"] for item in listed] == sorted(
+        device.device_uuid for device in SHARDED_DEVICES)  # Check the merged UUID order
+    assert [item["device_uuid"] for item in prefixed] == [
+        "DEVJ000000", "DEVJ000001", "DEVJ000002"]  # Check the prefix listing
+    assert sorted(item["device_uuid"] for item in within) == [
+        "DEVA000001", "DEVJ000001", "DEVT000001", "DEVX000001"]  # Check the spatial search
+    assert deleted is None  # Check the device was deleted
+    assert sum(counts) == 11 and counts.count(0) == 0  # Check every shard holds devices
@@ -0,0 +1,87 @@
+"""
+Module containing unit tests for the storage maintenance.
+"""
+
+import asyncio
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.database.startup import setup_database
+from app.database.pool import close_pools, get_pool
+from app.database.operations import devices
+from app.database.operations.history import compact_history
+from app.database.operations.storage import (collect_coordinates, release_free_pages,
+                                             storage_stats)
+from app.models.device import Device
+
+
+def _device(device_uuid: str, latitude: float) -> Device:
+    """
+    Builds a device of the storage tests.
+    """
+    return Device(device_uuid=device_uuid,
+                  localisation={"latitude": latitude, "longitude": 2.3522},
+                  deployment_date="2024-03-14",
+                  owner="storage_owner@example.com")
+
+
+def test_collect_and_release(tmp_path):
+    """
+    Test that only the coordinates no device nor history refers to are deleted, and their
+    pages returned to the file system.
+    """
+    db_name = str(tmp_path / "devices.db")
+    setup_database(db_name)
+
+    async def scenario():
+        try:
+            pool = await get_pool(db_name)
+            async with pool.transaction() as database:
+                await database.executemany("INSERT INTO coordinates (latitude, longitude) "
+                                           "VALUES (?, 0)",
+                                           [(index / 1000,) for index in range(20_000)])
+            await devices.create_device(_device("DEVS000001", 48.0), db_name)
+            await devices.update_device(_device("DEVS000001", 49.0), db_name)
+            await devices.create_device(_device("DEVS000002", 50.0), db_name)
+            await devices.delete_device("DEVS000002", db_name)
+            deleted = await collect_coordinates(db_name)
+            async with pool.reader() as database:
+                async with database.execute("SELECT latitude FROM coordinates "
+                                            "ORDER BY latitude") as cursor:
+                    kept = [row[0] for row in await cursor.fetchall()]
+            # The first location of DEVS000001 and the history of DEVS000002 expire
+            await compact_history(full_resolution_days=0, retention_days=0, db_name=db_name)
+            expired = await collect_coordinates(db_name)
+            before = (await storage_stats(db_name))[0]
+            released = await release_free_pages(db_name)
+            after = (await storage_stats(db_name))[0]
+        finally:
+            await close_pools()
+        return deleted, expired, before, released, after, kept
+
+    deleted, expired, before, released, after, kept = asyncio.run(scenario())
+
+    assert deleted == 20_000  # Check the unreferenced coordinates were deleted
+    assert kept == [48.0, 49.0, 50.0]  # Check the coordinates of devices and history are kept
+    assert expired == 2  # Check the coordinates of the expired history were deleted
+    assert before["reclaimable_bytes"] > 0  # Check the freed pages are reported
+    assert released == before["reclaimable_bytes"]  # Check every free page was released
+    assert after["reclaimable_bytes"] == 0  # Check no free page is left
+    assert after["database_bytes"] == before["database_bytes"] - released  # Check it shrank
+    assert {"coordinates", "devices", "device_history"} <= set(
+        before["table_bytes"])  # Check the table sizes
+
+
+def test_storage_api():
+    """
+    Test the storage statistics and maintenance endpoints.
+    """
+    with TestClient(app) as client:
+        stats = client.get("/admin/storage")
+        maintenance = client.post("/admin/storage/maintain")
+
+    assert stats.status_code == 200  # Check the statistics are served
+    assert stats.json()[0]["table_bytes"]["devices"] > 0  # Check the devices table size
+    assert maintenance.status_code == 200  # Check the maintenance ran
+    assert set(maintenance.json()) == {"deleted_coordinates", "released_bytes",
+                                       "seconds"}  # Check the outcome
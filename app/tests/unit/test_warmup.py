@@ -0,0 +1,84 @@
+"""
+Module containing unit tests for the warm-up after startup.
+"""
+
+import asyncio
+from concurrent.futures import Future
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.database.startup import setup_database
+from app.database.pool import close_pools
+from app.database.cache import clear_caches, get_cache
+from app.database.operations import devices
+from app.database.warmup import hot_devices_path, save_hot_devices, warm_up
+from app.models.device import Device
+
+
+def _device(device_uuid: str) -> Device:
+    """
+    Builds a device of the warm-up tests.
+    """
+    return Device(device_uuid=device_uuid,
+                  localisation={"latitude": 48.8566, "longitude": 2.3522},
+                  deployment_date="2024-03-14",
+                  owner="warmup_owner@example.com")
+
+
+def test_warm_up(tmp_path):
+    """
+    Test that the tables and indexes are read through, and the devices most recently used
+    before the shutdown preloaded into the cache.
+    """
+    db_name = str(tmp_path / "devices.db")
+    setup_database(db_name)
+
+    async def scenario():
+        try:
+            for serial in range(4):
+                await devices.create_device(_device(f"DEVW00000{serial}"), db_name)
+            clear_caches()
+            for serial in (0, 2, 3, 2):
+                await devices.get_device(f"DEVW00000{serial}", db_name)
+            await devices.get_device("DEVW999999", db_name)
+            saved = save_hot_devices(2, db_name)
+            clear_caches()
+            outcome = await warm_up(db_name)
+            cache = get_cache(db_name)
+            hot = cache.hot_keys(10)
+            await devices.get_device("DEVW000003", db_name)
+            return saved, outcome, hot, cache.stats
+        finally:
+            await close_pools()
+            clear_caches()
+
+    saved, outcome, hot, stats = asyncio.run(scenario())
+
+    assert saved == 2  # Check only the requested number of devices was saved
+    with open(hot_devices_path(db_name), encoding="utf-8") as saved_file:
+        assert saved_file.read().split() == ["DEVW000002",
+                                             "DEVW000003"]  # Check the most recent first
+    assert {"devices", "devices_owner", "coordinates_location",
+            "coordinates_rtree_node"} <= set(outcome.scanned)  # Check what was read
+    assert "device_history" not in outcome.scanned  # Check the history is left out
+    assert outcome.preloaded_devices == 2  # Check the saved devices were preloaded
+    assert hot == ["DEVW000002", "DEVW000003"]  # Check the cache order was restored
+    assert stats.hits == 1  # Check a preloaded device is served from the cache
+
+
+def test_readiness():
+    """
+    Test that the application reports ready only once the warm-up is done.
+    """
+    with TestClient(app) as client:
+        pending = Future()
+        warm_up_task, app.state.warm_up = app.state.warm_up, pending
+        warming = client.get("/ready")
+        pending.set_result(None)
+        ready = client.get("/ready")
+        app.state.warm_up = warm_up_task
+
+    assert warming.status_code == 503  # Check the application is not ready while warming up
+    assert warming.json() == {"status": "warming up"}  # Check the reported status
+    assert ready.status_code == 200  # Check the application is ready once warmed up
+    assert ready.json() == {"status": "ready"}  # Check the reported status
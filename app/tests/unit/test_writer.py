@@ -0,0 +1,69 @@
+"""
+Module containing unit tests for the group-commit writer.
+"""
+
+import asyncio
+from app.database.pool import ConnectionPool
+from app.database.startup import setup_database
+
+
+def test_group_commit_isolates_failures(tmp_path):
+    """
+    Test that concurrent writes share transactions and that a failing one is rolled back alone.
+    """
+    db_name = str(tmp_path / "writer.db")
+    setup_database(db_name)
+
+    def insert(latitude):
+        async def operation(database):
+            await database.execute("INSERT INTO coordinates (latitude, longitude) "
+                                   "VALUES (?, 0)", (latitude,))
+            if latitude == 13:
+                raise ValueError("Failing operation")
+            return latitude
+        return operation
+
+    async def scenario():
+        pool = ConnectionPool(db_name, readers=1)
+        await pool.open()
+        try:
+            results = await asyncio.gather(*(pool.submit(insert(latitude))
+                                             for latitude in range(50)),
+                                           return_exceptions=True)
+            async with pool.reader() as database:
+                async with database.execute("SELECT latitude FROM coordinates "
+                                            "ORDER BY latitude") as cursor:
+                    stored = [row[0] for row in await cursor.fetchall()]
+            stats = pool.stats()["group_commit"]
+        finally:
+            await pool.close()
+        return results, stored, stats
+
+    results, stored, stats = asyncio.run(scenario())
+
+    assert isinstance(results[13], ValueError)  # Check the failure was raised to its caller
+    assert results[:13] + results[14:] == stored  # Check the other writes were committed
+    assert 13 not in stored  # Check the failing write was rolled back
+    assert stats["operations"] == 50  # Check counters
+    assert stats["batches"] < 50  # Check writes were committed together
+
+
+def test_stopped_writer_executes_queued_operations(tmp_path):
+    """
+    Test that closing the pool waits for the queued writes.
+    """
+    db_name = str(tmp_path / "writer.db")
+    setup_database(db_name)
+
+    async def operation(database):
+        await database.execute("INSERT INTO coordinates (latitude, longitude) VALUES (1, 1)")
+
+    async def scenario():
+        pool = ConnectionPool(db_name, readers=1)
+        await pool.open()
+        pending = asyncio.ensure_future(pool.submit(operation))
+        await asyncio.sleep(0)
+        await pool.close()
+        return await pending
+
+    assert asyncio.run(scenario()) is None  # Check the write completed
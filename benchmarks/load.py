@@ -0,0 +1,436 @@
+"""
+Module containing the endpoint load benchmark of the device API.
+
+The application is driven in-process through httpx's ASGI transport, so the measures cover
+routing, validation, serialization and the data layer, without the network. A dataset of
+the requested size is seeded directly into the database file, which can be kept and reused
+across runs, then each scenario sends its requests from a number of concurrent clients
+and reports its throughput and latency percentiles.
+
+The results are written as JSON. Given a baseline produced by an earlier run, the
+benchmark flags the scenarios whose throughput dropped or whose p95 latency grew beyond
+a tolerance, and exits with status 1 if any did.
+
+Usage:
+    python -m benchmarks.load --devices 100000 --concurrency 32 --output results.json
+    python -m benchmarks.load --devices 100000 --baseline results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+import httpx
+
+SCENARIOS = ("get", "get_missing", "batch_get", "list", "list_owner", "near", "within",
+             "export", "stats_owner", "stats_month", "stats_grid_cell", "create", "update",
+             "patch", "history", "delete", "bulk", "patch_bulk")
+OWNER_COUNT = 1000
+SEED_CHUNK_SIZE = 100_000
+BULK_REQUEST_SIZE = 100
+BATCH_GET_SIZE = 1000
+EXPORT_REQUEST_SHARE = 100
+PATCH_BULK_BLOCK_SIZE = 10
+
+Request = Callable[[httpx.AsyncClient], Awaitable[httpx.Response]]
+
+
+@dataclass
+class ScenarioResult:
+    """
+    Represents the measures of one scenario.
+
+    Attributes:
+    - requests (int): Number of requests sent.
+    - errors (int): Number of responses with an unexpected status code.
+    - seconds (float): Wall-clock duration of the scenario.
+    - throughput (float): Requests completed per second.
+    - p50_ms (float): Median latency, in milliseconds.
+    - p95_ms (float): 95th percentile latency, in milliseconds.
+    - p99_ms (float): 99th percentile latency, in milliseconds.
+    """
+    requests: int
+    errors: int
+    seconds: float
+    throughput: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    Returns a percentile of sorted values, with the nearest-rank method.
+
+    Parameters:
+    - sorted_values (list[float]): The values, in ascending order.
+    - fraction (float): The percentile, between 0 and 1.
+
+    Returns:
+    - float: The percentile value, 0 if there are no values.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(fraction * len(sorted_values) + 0.5))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def seed_database(db_name: str, device_count: int) -> None:
+    """
+    Fills a database with devices, unless it already holds them.
+
+    Devices are keyed DEVA000000 onward, each located on one of device_count / 10 random
+    coordinates and owned by one of OWNER_COUNT owners. When the database is sharded,
+    every shard gets the coordinates and the devices routed to it.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file.
+    - device_count (int): The number of devices of the dataset.
+    """
+    # pylint: disable=import-outside-toplevel
+    from app.database.sharding import get_layout, shards
+    from app.database.startup import setup_database
+
+    setup_database(db_name)
+    layout = get_layout(db_name)
+    expected = [0] * layout.count
+    for device_id in range(device_count):
+        expected[layout.index(device_id)] += 1
+    existing = []
+    for shard in shards(db_name):
+        with sqlite3.connect(shard) as database:
+            existing.append(database.execute("SELECT COUNT(*) FROM devices WHERE device_id < ?",
+                                              (device_count,)).fetchone()[0])
+        database.close()
+    if existing == expected:
+        return
+
+    start = time.perf_counter()
+    for index, shard in enumerate(shards(db_name)):
+        rng = random.Random(0)
+        database = sqlite3.connect(shard)
+        with database:
+            database.execute("DELETE FROM devices")
+            database.executemany("INSERT OR IGNORE INTO coordinates (latitude, longitude) "
+                                 "VALUES (?, ?)",
+                                 ((rng.uniform(-60, 60), rng.uniform(-180, 180))
+                                  for _ in range(max(1, device_count // 10))))
+        coordinate_ids = [row[0] for row in database.execute("SELECT id FROM coordinates")]
+        for low in range(0, device_count, SEED_CHUNK_SIZE):
+            with database:
+                database.executemany(
+                    "INSERT INTO devices (device_id, localisation_id, deployment_date, owner) "
+                    "VALUES (?, ?, ?, ?)",
+                    ((device_id, rng.choice(coordinate_ids),
+                      f"20{10 + device_id % 15}-0{1 + device_id % 9}-1{device_id % 10}",
+                      f"owner{device_id % OWNER_COUNT}@example.com")
+                     for device_id in range(low, min(low + SEED_CHUNK_SIZE, device_count))
+                     if layout.index(device_id) == index))
+        database.execute("PRAGMA optimize")
+        database.close()
+    print(f"Seeded {device_count} devices in {time.perf_counter() - start:.1f}s",
+          file=sys.stderr)
+
+
+def _device(device_id: int, rng: random.Random) -> dict:
+    """
+    Builds the JSON body of a device.
+
+    Parameters:
+    - device_id (int): The device identifier, encoded in its UUID.
+    - rng (random.Random): The random generator of the location.
+
+    Returns:
+    - dict: The device.
+    """
+    from app.database.encoding import decode_uuid  # pylint: disable=import-outside-toplevel
+
+    return {"device_uuid": decode_uuid(device_id),
+            "localisation": {"latitude": rng.uniform(-60, 60),
+                             "longitude": rng.uniform(-180, 180)},
+            "deployment_date": "2024-03-14",
+            "owner": f"owner{device_id % OWNER_COUNT}@example.com"}
+
+
+def build_requests(scenario: str, device_count: int, request_count: int,
+                   rng: random.Random) -> Iterator[Request]:
+    """
+    Builds the requests of a scenario.
+
+    Write scenarios use identifiers above the dataset: 'create' creates request_count
+    devices, which 'update' then updates, 'patch' patches, 'history' reads the versions of
+    and 'delete' deletes, and 'bulk' creates BULK_REQUEST_SIZE devices per request after
+    them, which 'patch_bulk' patches by blocks of PATCH_BULK_BLOCK_SIZE sharing a UUID
+    prefix. 'export' streams the whole dataset per request, so it sends one request per
+    EXPORT_REQUEST_SHARE requests of the other scenarios.
+
+    Parameters:
+    - scenario (str): The scenario name.
+    - device_count (int): The number of devices of the dataset.
+    - request_count (int): The number of requests to build.
+    - rng (random.Random): The random generator of the request parameters.
+
+    Returns:
+    - Iterator[Request]: The requests, each a coroutine function of the client.
+    """
+    from app.database.encoding import decode_uuid  # pylint: disable=import-outside-toplevel
+
+    def request(method: str, url: str, **kwargs) -> Request:
+        return lambda client: client.request(method, url, **kwargs)
+
+    # The first block of PATCH_BULK_BLOCK_SIZE devices created by 'bulk'
+    first_block = -(-(device_count + request_count) // PATCH_BULK_BLOCK_SIZE)
+    if scenario == "export":
+        request_count = max(1, request_count // EXPORT_REQUEST_SHARE)
+    for index in range(request_count):
+        if scenario == "get":
+            yield request("GET", f"/devices/{decode_uuid(rng.randrange(device_count))}")
+        elif scenario == "get_missing":
+            yield request("GET", f"/devices/{decode_uuid(device_count + request_count + index)}")
+        elif scenario == "batch_get":
+            yield request("POST", "/devices/batch-get",
+                          json={"device_uuids": [decode_uuid(rng.randrange(device_count))
+                                                 for _ in range(BATCH_GET_SIZE)]})
+        elif scenario == "list":
+            yield request("GET", "/devices/",
+                          params={"cursor": decode_uuid(rng.randrange(device_count)),
+                                  "limit": 100})
+        elif scenario == "list_owner":
+            yield request("GET", "/devices/",
+                          params={"owner": f"owner{rng.randrange(OWNER_COUNT)}@example.com",
+                                  "limit": 100})
+        elif scenario == "near":
+            yield request("GET", "/devices/near",
+                          params={"lat": rng.uniform(-60, 60), "lon": rng.uniform(-180, 180),
+                                  "limit": 10})
+        elif scenario == "within":
+            latitude, longitude = rng.uniform(-60, 59), rng.uniform(-180, 179)
+            yield request("GET", "/devices/within",
+                          params={"min_lat": latitude, "max_lat": latitude + 1,
+                                  "min_lon": longitude, "max_lon": longitude + 1,
+                                  "limit": 100})
+        elif scenario == "export":
+            yield request("GET", "/devices/export", params={"format": "ndjson"})
+        elif scenario == "stats_owner":
+            yield request("GET", "/devices/stats/by-owner")
+        elif scenario == "stats_month":
+            yield request("GET", "/devices/stats/by-deployment-month")
+        elif scenario == "stats_grid_cell":
+            yield request("GET", "/devices/stats/by-grid-cell",
+                          params={"precision": rng.randrange(3)})
+        elif scenario == "create":
+            yield request("POST", "/devices/", json=_device(device_count + index, rng))
+        elif scenario == "update":
+            yield request("PUT", "/devices/", json=_device(device_count + index, rng))
+        elif scenario == "patch":
+            yield request("PATCH", f"/devices/{decode_uuid(device_count + index)}",
+                          json={"owner": f"owner{rng.randrange(OWNER_COUNT)}@example.com"})
+        elif scenario == "history":
+            yield request("GET", f"/devices/{decode_uuid(device_count + index)}/history")
+        elif scenario == "delete":
+            yield request("DELETE", f"/devices/{decode_uuid(device_count + index)}")
+        elif scenario == "bulk":
+            low = device_count + request_count + index * BULK_REQUEST_SIZE
+            yield request("POST", "/devices/bulk",
+                          json=[_device(device_id, rng)
+                                for device_id in range(low, low + BULK_REQUEST_SIZE)])
+        elif scenario == "patch_bulk":
+            block = decode_uuid((first_block + index) * PATCH_BULK_BLOCK_SIZE)
+            yield request("PATCH", "/devices/bulk",
+                          json={"filter": {"prefix": block[:-1]},
+                                "patch": {"deployment_date": "2024-04-01"}})
+        else:
+            raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def run_scenario(client: httpx.AsyncClient, requests: Iterator[Request],
+                       concurrency: int) -> ScenarioResult:
+    """
+    Sends the requests of a scenario from concurrent clients.
+
+    Parameters:
+    - client (httpx.AsyncClient): The client of the application.
+    - requests (Iterator[Request]): The requests to send.
+    - concurrency (int): The number of requests in flight at any time.
+
+    Returns:
+    - ScenarioResult: The measures of the scenario.
+    """
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        for send in requests:
+            start = time.perf_counter()
+            response = await send(client)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return ScenarioResult(requests=len(latencies), errors=errors, seconds=seconds,
+                          throughput=len(latencies) / seconds if seconds else 0.0,
+                          p50_ms=percentile(latencies, 0.50) * 1000,
+                          p95_ms=percentile(latencies, 0.95) * 1000,
+                          p99_ms=percentile(latencies, 0.99) * 1000)
+
+
+async def run_benchmark(scenarios: List[str], device_count: int, request_count: int,
+                        concurrency: int) -> Dict[str, ScenarioResult]:
+    """
+    Runs scenarios against the application, within its lifespan.
+
+    Parameters:
+    - scenarios (list[str]): The scenarios to run, in order.
+    - device_count (int): The number of devices of the dataset.
+    - request_count (int): The number of requests per scenario.
+    - concurrency (int): The number of requests in flight at any time.
+
+    Returns:
+    - dict[str, ScenarioResult]: The measures of each scenario.
+    """
+    from app.main import app  # pylint: disable=import-outside-toplevel
+
+    rng = random.Random(1)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for scenario in scenarios:
+                requests = build_requests(scenario, device_count, request_count, rng)
+                results[scenario] = await run_scenario(client, requests, concurrency)
+                print(f"{scenario:<15} {results[scenario].throughput:10.1f} req/s  "
+                      f"p50 {results[scenario].p50_ms:8.2f} ms  "
+                      f"p95 {results[scenario].p95_ms:8.2f} ms  "
+                      f"p99 {results[scenario].p99_ms:8.2f} ms  "
+                      f"errors {results[scenario].errors}", file=sys.stderr)
+    return results
+
+
+def remove_written_devices(db_name: str, device_count: int) -> None:
+    """
+    Deletes the devices created by the write scenarios, and their history, so the dataset
+    can be reused.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file.
+    - device_count (int): The number of devices of the dataset.
+    """
+    from app.database.sharding import shards  # pylint: disable=import-outside-toplevel
+
+    for shard in shards(db_name):
+        database = sqlite3.connect(shard)
+        with database:
+            database.execute("DELETE FROM devices WHERE device_id >= ?", (device_count,))
+            database.execute("DELETE FROM device_history WHERE device_id >= ?",
+                             (device_count,))
+        database.close()
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Compares results with a baseline.
+
+    A scenario regressed if its throughput dropped, or its p95 latency grew, by more than
+    the tolerance.
+
+    Parameters:
+    - results (dict): The results of this run.
+    - baseline (dict): The results of the baseline run.
+    - tolerance (float): The accepted relative difference (e.g., 0.1 for 10%).
+
+    Returns:
+    - list[str]: A description of each regression.
+    """
+    regressions = []
+    for scenario, result in results["scenarios"].items():
+        reference = baseline.get("scenarios", {}).get(scenario)
+        if reference is None:
+            continue
+        if result["throughput"] < reference["throughput"] * (1 - tolerance):
+            regressions.append(f"{scenario}: throughput {result['throughput']:.1f} req/s "
+                               f"< baseline {reference['throughput']:.1f} req/s")
+        if result["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {result['p95_ms']:.2f} ms "
+                               f"> baseline {reference['p95_ms']:.2f} ms")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Runs the benchmark from the command line.
+
+    Parameters:
+    - argv (list[str], optional): The command-line arguments. Default is sys.argv.
+
+    Returns:
+    - int: The exit status, 1 if a regression was found.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=10_000,
+                        help="number of devices of the dataset (default: 10000)")
+    parser.add_argument("--requests", type=int, default=2_000,
+                        help="number of requests per scenario (default: 2000)")
+    parser.add_argument("--concurrency", type=int, default=32,
+                        help="number of requests in flight (default: 32)")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS),
+                        help="scenarios to run, in order (default: all)")
+    parser.add_argument("--database",
+                        help="database file, kept to reuse its dataset (default: temporary)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="number of shard files of the database (default: 1)")
+    parser.add_argument("--shard-key", choices=("letter", "hash"), default="letter",
+                        help="how devices are assigned to shards (default: letter)")
+    parser.add_argument("--output", help="file the JSON results are written to")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="accepted relative regression (default: 0.10)")
+    arguments = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_name = arguments.database or str(Path(directory) / "devices.db")
+        # The application reads its database path and layout when it is imported
+        os.environ["EDGEMATRIX_DATABASE_PATH"] = db_name
+        os.environ["EDGEMATRIX_SHARD_COUNT"] = str(arguments.shards)
+        os.environ["EDGEMATRIX_SHARD_KEY"] = arguments.shard_key
+        seed_database(db_name, arguments.devices)
+        try:
+            results = asyncio.run(run_benchmark(arguments.scenarios, arguments.devices,
+                                                arguments.requests, arguments.concurrency))
+        finally:
+            remove_written_devices(db_name, arguments.devices)
+
+    report = {
+        "config": {"devices": arguments.devices, "requests": arguments.requests,
+                   "concurrency": arguments.concurrency, "shards": arguments.shards,
+                   "shard_key": arguments.shard_key},
+        "scenarios": {scenario: asdict(result) for scenario, result in results.items()},
+    }
+    if arguments.output:
+        Path(arguments.output).write_text(json.dumps(report, indent=2) + "\n")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if arguments.baseline:
+        regressions = find_regressions(report, json.loads(Path(arguments.baseline).read_text()),
+                                       arguments.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
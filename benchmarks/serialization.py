@@ -0,0 +1,104 @@
+"""
+Module measuring the CPU time spent serializing device responses.
+
+Each response is built the way the endpoints built it before the trusted path, walked by
+`jsonable_encoder` and rendered with the json module, then with the trusted path: rendered
+straight to bytes with orjson for devices read from the database, or by Pydantic for the
+devices validated from a request body. The cost of validating the database rows against the
+Device model, as a response model would, is also reported.
+
+Usage: python -m benchmarks.serialization [--iterations 20000]
+"""
+import argparse
+import time
+from typing import Callable, List
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from app.api.responses import model_json, trusted_json
+from app.models.device import Device
+
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def _device_rows(count: int) -> List[dict]:
+    """
+    Builds devices as they are read from the database.
+
+    Parameters:
+    - count (int): The number of devices.
+
+    Returns:
+    - list[dict]: The devices.
+    """
+    return [{"device_uuid": f"DEV{LETTERS[index % 26]}{index:06d}",
+             "localisation": {"latitude": 48.8566 + index / 1000,
+                              "longitude": 2.3522 - index / 1000},
+             "deployment_date": "2024-03-14",
+             "owner": f"owner{index % 100}@example.com"}
+            for index in range(count)]
+
+
+def _cpu_per_call(function: Callable[[], object], iterations: int) -> float:
+    """
+    Measures the mean CPU time of a function, in microseconds.
+
+    Parameters:
+    - function (Callable[[], object]): The function to call.
+    - iterations (int): The number of calls.
+
+    Returns:
+    - float: The mean CPU time of a call.
+    """
+    start = time.process_time()
+    for _ in range(iterations):
+        function()
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def main() -> None:
+    """
+    Runs the measurements and prints their results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20_000)
+    arguments = parser.parse_args()
+
+    row = _device_rows(1)[0]
+    page = {"items": _device_rows(100), "next_cursor": "DEVV000099"}
+    device = Device(**row)
+
+    cases = {
+        "read a device": {
+            "validated": lambda: JSONResponse(
+                content=jsonable_encoder(Device.model_validate(row))),
+            "encoded": lambda: JSONResponse(content=jsonable_encoder(row)),
+            "trusted": lambda: trusted_json(row),
+        },
+        "list 100 devices": {
+            "validated": lambda: JSONResponse(content=jsonable_encoder(
+                {"items": [Device.model_validate(item) for item in page["items"]],
+                 "next_cursor": page["next_cursor"]})),
+            "encoded": lambda: JSONResponse(content=jsonable_encoder(page)),
+            "trusted": lambda: trusted_json(page),
+        },
+        "write a device": {
+            "encoded": lambda: JSONResponse(content=jsonable_encoder(device)),
+            "trusted": lambda: model_json(device),
+        },
+    }
+
+    for name, variants in cases.items():
+        # The page cases are 100 times slower, so they are run 100 times less
+        iterations = arguments.iterations // 100 if name.startswith("list") \
+            else arguments.iterations
+        results = {variant: _cpu_per_call(function, iterations)
+                   for variant, function in variants.items()}
+        print(f"\n{name}")
+        for variant, cpu_us in results.items():
+            print(f"  {variant:<10} {cpu_us:10.2f} us")
+        print(f"  saved      {results['encoded'] - results['trusted']:10.2f} us per request")
+
+
+if __name__ == "__main__":
+    main()
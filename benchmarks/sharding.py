@@ -0,0 +1,115 @@
+"""
+Module measuring the write throughput of the device storage across shard counts.
+
+SQLite allows a single writer per file, so several application processes (e.g. uvicorn
+workers) writing to the same database wait on each other's write lock. For each shard
+count, a number of processes create devices concurrently through the device operations,
+each with its own connection pools as a worker would, and the aggregated number of devices
+created per second is reported. Devices are spread over every UUID letter, so that both
+shard keys spread them across the shards.
+
+Usage: python -m benchmarks.sharding [--shards 1 4 26] [--key letter] [--processes 4]
+                                     [--devices 20000] [--concurrency 32]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple
+from app.database.encoding import SERIAL_RANGE, decode_uuid
+from app.database.operations import devices
+from app.database.pool import close_pools
+from app.database.sharding import ShardLayout
+from app.database.startup import setup_database
+from app.models.device import Device
+
+
+def _write_devices(db_name: str, layout: ShardLayout, device_ids: List[int],
+                   concurrency: int) -> Tuple[float, float]:
+    """
+    Creates devices one request at a time from concurrent tasks, in a worker process.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file.
+    - layout (ShardLayout): The shard layout of the database.
+    - device_ids (list[int]): The identifiers of the devices to create.
+    - concurrency (int): The number of creations in flight.
+
+    Returns:
+    - tuple[float, float]: The start and end times of the writes, from `time.perf_counter()`.
+    """
+    setup_database(db_name, layout)
+    pending = iter([Device(device_uuid=decode_uuid(device_id),
+                           localisation={"latitude": device_id % 180 - 90.0,
+                                         "longitude": device_id % 360 - 180.0},
+                           deployment_date="2024-03-14",
+                           owner="benchmark@example.com")
+                    for device_id in device_ids])
+
+    async def writer() -> None:
+        for device in pending:
+            await devices.create_device(device, db_name)
+
+    async def run() -> Tuple[float, float]:
+        # Opens the pools before timing, as the application does on startup
+        await devices.get_devices([decode_uuid(device_ids[0])], db_name)
+        start = time.perf_counter()
+        await asyncio.gather(*(writer() for _ in range(concurrency)))
+        end = time.perf_counter()
+        await close_pools()
+        return start, end
+
+    return asyncio.run(run())
+
+
+def measure(layout: ShardLayout, processes: int, device_count: int,
+            concurrency: int) -> float:
+    """
+    Measures the number of devices created per second by concurrent processes.
+
+    Parameters:
+    - layout (ShardLayout): The shard layout of the database.
+    - processes (int): The number of writing processes.
+    - device_count (int): The total number of devices to create.
+    - concurrency (int): The number of creations in flight per process.
+
+    Returns:
+    - float: The aggregated throughput, in devices per second.
+    """
+    # Consecutive devices use consecutive letters
+    device_ids = [index % 26 * SERIAL_RANGE + index // 26 for index in range(device_count)]
+    with tempfile.TemporaryDirectory() as directory:
+        db_name = str(Path(directory) / "devices.db")
+        setup_database(db_name, layout)
+        with multiprocessing.Pool(processes) as pool:
+            spans = pool.starmap(_write_devices,
+                                 [(db_name, layout, device_ids[worker::processes], concurrency)
+                                  for worker in range(processes)])
+    # perf_counter is a system-wide monotonic clock, comparable across processes
+    return device_count / (max(end for _, end in spans) - min(start for start, _ in spans))
+
+
+def main() -> None:
+    """
+    Runs the measurements and prints their results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 4, 26])
+    parser.add_argument("--key", choices=("letter", "hash"), default="letter")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--devices", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    arguments = parser.parse_args()
+
+    print(f"{arguments.processes} processes, {arguments.concurrency} creations in flight each")
+    for count in arguments.shards:
+        throughput = measure(ShardLayout(count=count, key=arguments.key), arguments.processes,
+                             arguments.devices, arguments.concurrency)
+        print(f"  {count:>3} shard(s) {throughput:10.1f} devices/s")
+
+
+if __name__ == "__main__":
+    main()
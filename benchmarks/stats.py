@@ -0,0 +1,142 @@
+"""
+Module comparing the maintained device counts with counting the devices on demand.
+
+A database is filled with devices spread over owners, deployment months and sites, around
+which they are scattered over about a degree, once with the triggers maintaining the
+counts and once without them, to measure what they add to the writes. Each count is then
+read from its summary table, with the query of `app.database.operations.stats`, and
+computed by grouping every device, as a dashboard would without them. Reading the summary
+tables costs the number of groups, reported alongside: the finer the grid, the closer it
+gets to the number of devices.
+
+Usage: python -m benchmarks.stats [--devices 1000000] [--owners 1000] [--sites 100]
+                                  [--reads 20]
+"""
+import argparse
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+from app.database.migrations import DEVICE_COUNTS_REBUILD, GRID_PRECISIONS
+from app.database.operations import stats
+from app.database.startup import setup_database
+
+COUNT_TRIGGERS = ("device_counts_insert", "device_counts_update", "device_counts_delete")
+
+
+def _fill(db_name: str, device_count: int, owner_count: int, site_count: int,
+          counted: bool) -> float:
+    """
+    Inserts the devices into a new database, in a single transaction.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file.
+    - device_count (int): The number of devices to insert.
+    - owner_count (int): The number of owners the devices are spread over.
+    - site_count (int): The number of sites the devices are scattered around.
+    - counted (bool): Whether the triggers maintaining the counts are kept.
+
+    Returns:
+    - float: The time taken by the insertions, in seconds.
+    """
+    setup_database(db_name)
+    rng = random.Random(0)
+    database = sqlite3.connect(db_name, isolation_level=None)
+    if not counted:
+        for trigger in COUNT_TRIGGERS:
+            database.execute(f"DROP TRIGGER {trigger}")
+    sites = [(rng.uniform(-60, 60), rng.uniform(-170, 170)) for _ in range(site_count)]
+    rows = []
+    for device_id in range(device_count):
+        latitude, longitude = rng.choice(sites)
+        rows.append((device_id, latitude + rng.gauss(0, 0.5), longitude + rng.gauss(0, 0.5),
+                     f"{rng.randint(2020, 2024)}-{rng.randint(1, 12):02d}-14",
+                     f"owner{rng.randrange(owner_count)}@example.com"))
+    start = time.perf_counter()
+    database.execute("BEGIN")
+    database.executemany("INSERT INTO coordinates (id, latitude, longitude) VALUES (?, ?, ?)",
+                         [row[:3] for row in rows])
+    database.executemany("INSERT INTO devices (device_id, localisation_id, deployment_date, "
+                         "owner) VALUES (?1, ?1, ?4, ?5)", rows)
+    database.execute("COMMIT")
+    seconds = time.perf_counter() - start
+    database.close()
+    return seconds
+
+
+def _time(operation: Callable[[], object], reads: int) -> float:
+    """
+    Returns the median time of an operation, in milliseconds.
+    """
+    times = []
+    for _ in range(reads):
+        start = time.perf_counter()
+        operation()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2] * 1000
+
+
+def measure(db_name: str, reads: int) -> List[Tuple[str, int, float, float]]:
+    """
+    Measures each count read from its summary table and computed from the devices.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file.
+    - reads (int): The number of times each count is read.
+
+    Returns:
+    - list[tuple[str, int, float, float]]: The name and number of groups of each count,
+      with the median time of reading it maintained and computed, in milliseconds.
+    """
+    maintained = [
+        ("by owner", stats.OWNER_COUNTS_SELECT, ()),
+        ("by deployment month", stats.MONTH_COUNTS_SELECT, ()),
+        *((f"by grid cell, precision {precision}", stats.CELL_COUNTS_SELECT, (precision,))
+          for precision in GRID_PRECISIONS),
+    ]
+    # The grouping queries of the rebuild, in the same order, without inserting their rows
+    computed = [statement[statement.index("SELECT"):]
+                for statement in DEVICE_COUNTS_REBUILD if statement.startswith("INSERT")]
+    database = sqlite3.connect(db_name)
+    results = []
+    for (name, query, parameters), grouping in zip(maintained, computed):
+        groups = len(database.execute(query, parameters).fetchall())
+        results.append((name, groups,
+                        _time(lambda query=query, parameters=parameters:
+                              database.execute(query, parameters).fetchall(), reads),
+                        _time(lambda grouping=grouping:
+                              database.execute(grouping).fetchall(), reads)))
+    database.close()
+    return results
+
+
+def main() -> None:
+    """
+    Runs the measurements and prints their results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1_000_000)
+    parser.add_argument("--owners", type=int, default=1000)
+    parser.add_argument("--sites", type=int, default=100)
+    parser.add_argument("--reads", type=int, default=20)
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        uncounted = _fill(str(Path(directory) / "uncounted.db"), arguments.devices,
+                          arguments.owners, arguments.sites, counted=False)
+        db_name = str(Path(directory) / "devices.db")
+        counted = _fill(db_name, arguments.devices, arguments.owners, arguments.sites,
+                        counted=True)
+        print(f"Inserting {arguments.devices} devices: {uncounted:.2f}s without the counts, "
+              f"{counted:.2f}s maintaining them "
+              f"({(counted - uncounted) / arguments.devices * 1e6:.1f}us per device)")
+        print(f"{'count':<26} {'groups':>8} {'maintained':>12} {'computed':>12}")
+        for name, groups, maintained, computed in measure(db_name, arguments.reads):
+            print(f"{name:<26} {groups:>8} {maintained:>10.2f}ms {computed:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
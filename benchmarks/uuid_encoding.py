@@ -0,0 +1,166 @@
+"""
+Module comparing the text and integer keyed device tables.
+
+A database is filled with devices keyed by their text UUID, as before schema version 6,
+then copied and migrated to the integer encoding. Both are vacuumed, then the size of the
+devices table and of its indexes, and the time of point lookups and UUID prefix scans,
+are measured on each.
+
+Usage: python -m benchmarks.uuid_encoding [--devices 1000000] [--lookups 100000]
+"""
+import argparse
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+from app.database.encoding import encode_uuid, prefix_range
+from app.database.migrations import MIGRATIONS, run_migrations
+
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def _create_text_keyed_database(db_name: str, device_count: int) -> List[str]:
+    """
+    Creates a database at schema version 5, whose devices are keyed by their text UUID.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file.
+    - device_count (int): The number of devices to insert.
+
+    Returns:
+    - list[str]: The UUIDs of the inserted devices.
+    """
+    rng = random.Random(0)
+    uuids = [f"DEV{LETTERS[index % 26]}{index // 26:06d}" for index in range(device_count)]
+    database = sqlite3.connect(db_name)
+    cursor = database.cursor()
+    for migration in MIGRATIONS[:5]:
+        migration.apply(cursor)
+    cursor.execute(f"PRAGMA user_version = {MIGRATIONS[4].version}")
+    cursor.executemany("INSERT INTO coordinates (latitude, longitude) VALUES (?, ?)",
+                       [(rng.uniform(-90, 90), rng.uniform(-180, 180))
+                        for _ in range(device_count // 10)])
+    # Devices are inserted in random order, as they would be registered
+    cursor.executemany("INSERT INTO devices VALUES (?, ?, '2024-03-14', ?)",
+                       [(uuid, rng.randint(1, device_count // 10),
+                         f"owner{rng.randrange(1000)}@example.com")
+                        for uuid in rng.sample(uuids, len(uuids))])
+    database.commit()
+    database.close()
+    return uuids
+
+
+def _sizes(database: sqlite3.Connection) -> Dict[str, int]:
+    """
+    Measures the storage used by the devices table and its indexes.
+
+    Parameters:
+    - database (sqlite3.Connection): The connection to the database.
+
+    Returns:
+    - dict[str, int]: The number of bytes of each B-tree, and of the whole file.
+    """
+    rows = database.execute("SELECT name, SUM(pgsize) FROM dbstat "
+                            "WHERE name = 'devices' OR name LIKE 'sqlite_autoindex_devices%' "
+                            "OR name LIKE 'devices_%' GROUP BY name").fetchall()
+    sizes = dict(rows)
+    page_count = database.execute("PRAGMA page_count").fetchone()[0]
+    page_size = database.execute("PRAGMA page_size").fetchone()[0]
+    sizes["file"] = page_count * page_size
+    return sizes
+
+
+def _time_per_call(function: Callable[[], None], calls: int) -> float:
+    """
+    Measures the mean duration of a function, in microseconds.
+
+    Parameters:
+    - function (Callable[[], None]): The function to call.
+    - calls (int): The number of calls.
+
+    Returns:
+    - float: The mean duration of a call.
+    """
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def _measure(db_name: str, uuids: List[str], lookups: int, integer_keys: bool) -> dict:
+    """
+    Measures the sizes and query times of a database.
+
+    Parameters:
+    - db_name (str): The name of the SQLite database file.
+    - uuids (list[str]): The UUIDs of the devices.
+    - lookups (int): The number of point lookups to time.
+    - integer_keys (bool): Whether devices are keyed by the integer encoding.
+
+    Returns:
+    - dict: The measurements.
+    """
+    database = sqlite3.connect(db_name)
+    database.execute("VACUUM")
+    sizes = _sizes(database)
+    rng = random.Random(1)
+    targets = [rng.choice(uuids) for _ in range(lookups)]
+    prefixes = [uuid[:7] for uuid in rng.sample(uuids, 1000)]
+
+    if integer_keys:
+        lookup_sql = "SELECT owner FROM devices WHERE device_id = ?"
+        scan_sql = "SELECT owner FROM devices WHERE device_id BETWEEN ? AND ?"
+        lookup_args = iter([(encode_uuid(uuid),) for uuid in targets])
+        scan_args = iter([prefix_range(prefix) for prefix in prefixes])
+    else:
+        lookup_sql = "SELECT owner FROM devices WHERE device_uuid = ?"
+        scan_sql = "SELECT owner FROM devices WHERE device_uuid >= ? AND device_uuid < ?"
+        lookup_args = iter([(uuid,) for uuid in targets])
+        scan_args = iter([(prefix, prefix + ":") for prefix in prefixes])
+
+    lookup_us = _time_per_call(lambda: database.execute(lookup_sql,
+                                                        next(lookup_args)).fetchone(), lookups)
+    scan_us = _time_per_call(lambda: database.execute(scan_sql,
+                                                      next(scan_args)).fetchall(), 1000)
+    database.close()
+    return {"sizes": sizes, "lookup_us": lookup_us, "prefix_scan_us": scan_us}
+
+
+def main() -> None:
+    """
+    Runs the comparison and prints its results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        text_db = str(Path(directory) / "text.db")
+        integer_db = str(Path(directory) / "integer.db")
+        uuids = _create_text_keyed_database(text_db, arguments.devices)
+        shutil.copyfile(text_db, integer_db)
+        with sqlite3.connect(integer_db) as database:
+            start = time.perf_counter()
+            run_migrations(database)
+            migration_seconds = time.perf_counter() - start
+        database.close()
+
+        results = {"text": _measure(text_db, uuids, arguments.lookups, False),
+                   "integer": _measure(integer_db, uuids, arguments.lookups, True)}
+
+    print(f"{arguments.devices} devices, migrated in {migration_seconds:.2f}s")
+    for name, result in results.items():
+        print(f"\n{name} keys")
+        for table, size in sorted(result["sizes"].items()):
+            print(f"  {table:<32} {size / 1024 / 1024:8.2f} MiB")
+        print(f"  point lookup                     {result['lookup_us']:8.2f} us")
+        print(f"  prefix scan (7 chars, 1000 rows) {result['prefix_scan_us']:8.2f} us")
+
+
+if __name__ == "__main__":
+    main()